@@ -0,0 +1,135 @@
+"""Offline stand-ins for the remote APIs used by both services.
+
+``FakeGenaiClient`` implements the slice of ``google.genai.Client`` the
+detection pipeline calls (``files.upload``/``files.get`` and
+``models.generate_content``) with configurable latencies; ``FakeAgent``
+replaces the langchain agent behind ``backend/main.py`` and
+``FakeTokenClient`` the TokenC prompt compressor.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+
+class _Files:
+    def __init__(self, client: "FakeGenaiClient") -> None:
+        self._client = client
+        self._uploaded: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _info(self, name: str, ready_at: float) -> Any:
+        state = "ACTIVE" if time.monotonic() >= ready_at else "PROCESSING"
+        return SimpleNamespace(
+            name=name,
+            uri=f"https://fake.invalid/{name}",
+            mime_type="video/mp4",
+            state=SimpleNamespace(name=state),
+            expiration_time=None,
+        )
+
+    def upload(self, *, file: str) -> Any:
+        client = self._client
+        client._count("files.upload")
+        # Uploads are bandwidth bound: fixed latency plus size / throughput.
+        size = os.path.getsize(file)
+        time.sleep(client.upload_latency + size / (client.upload_mbps * 1024 * 1024))
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        ready_at = time.monotonic() + client.processing_seconds
+        with self._lock:
+            self._uploaded[name] = ready_at
+        return self._info(name, ready_at)
+
+    def get(self, *, name: str) -> Any:
+        self._client._count("files.get")
+        time.sleep(self._client.request_latency)
+        with self._lock:
+            ready_at = self._uploaded.get(name)
+        if ready_at is None:
+            raise RuntimeError(f"404 File {name} not found")
+        return self._info(name, ready_at)
+
+
+class _Models:
+    def __init__(self, client: "FakeGenaiClient") -> None:
+        self._client = client
+
+    def generate_content(self, *, model: str, contents: List[Any], config: Any = None) -> Any:
+        client = self._client
+        client._count("models.generate_content")
+        has_image = any(getattr(part, "inline_data", None) is not None for part in contents)
+        if has_image:
+            time.sleep(client.image_latency)
+            body: Dict[str, Any] = {"target": client.target}
+        else:
+            time.sleep(client.generate_latency)
+            body = {"target": client.target, "items": client.items}
+        text = json.dumps(body)
+        tokens = sum(len(getattr(part, "text", "") or "") // 4 for part in contents) + len(text) // 4
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+
+class FakeGenaiClient:
+    """Deterministic ``google.genai.Client`` replacement.
+
+    An uploaded file reports ``PROCESSING`` until ``processing_seconds`` after
+    the upload, then ``ACTIVE``. ``items`` is the object list returned for
+    video prompts; ``target`` is returned for image prompts.
+    """
+
+    def __init__(
+        self,
+        *,
+        items: Optional[List[Dict[str, Any]]] = None,
+        target: str = "a soda can",
+        upload_latency: float = 0.2,
+        upload_mbps: float = 20.0,
+        processing_seconds: float = 1.0,
+        request_latency: float = 0.05,
+        image_latency: float = 0.8,
+        generate_latency: float = 2.0,
+    ) -> None:
+        self.items = items or []
+        self.target = target
+        self.upload_latency = upload_latency
+        self.upload_mbps = upload_mbps
+        self.processing_seconds = processing_seconds
+        self.request_latency = request_latency
+        self.image_latency = image_latency
+        self.generate_latency = generate_latency
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.files = _Files(self)
+        self.models = _Models(self)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+
+class FakeAgent:
+    """Stands in for the langchain agent ``main.backend`` invokes."""
+
+    def __init__(self, latency: float = 1.5, reply: str = "The product now appears in the scene.") -> None:
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+
+    def invoke(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"messages": list(payload.get("messages", [])) + [SimpleNamespace(content=self.reply)]}
+
+
+class FakeTokenClient:
+    """TokenC replacement that returns prompts unchanged after ``latency`` seconds."""
+
+    def __init__(self, latency: float = 0.1) -> None:
+        self.latency = latency
+
+    def compress_input(self, *, input: str, aggressiveness: float) -> Any:
+        time.sleep(self.latency)
+        return SimpleNamespace(output=input)
@@ -0,0 +1,548 @@
+"""Stand-in ComfyUI nodes for benchmarking ``video_script`` without models or a GPU.
+
+Every node does NumPy work on tensors of the shapes the real Wan 2.1 VACE
+workflow produces (full-resolution frames, 16-channel latents at 1/8 scale
+with 4x temporal compression, umt5-sized text conditioning), so memory
+traffic and the glue code in ``video_script`` are exercised realistically;
+only the neural networks are missing. Model-sized latencies can be added with
+``configure``.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from fractions import Fraction
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+
+_settings = {
+    "model_mb": 64,
+    "load_latency": 0.0,
+    "step_latency": 0.0,
+    "segment_latency": 0.0,
+    "decode_latency": 0.0,
+}
+
+_output_dir: Optional[str] = None
+_timings: Dict[str, List[float]] = defaultdict(list)
+_timings_lock = threading.Lock()
+
+
+def configure(**settings: Any) -> None:
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise TypeError(f"Unknown fake node settings: {sorted(unknown)}")
+    _settings.update(settings)
+
+
+def take_timings() -> Dict[str, List[float]]:
+    """Per-node call durations (seconds) since the last call."""
+    with _timings_lock:
+        taken = {name: list(values) for name, values in _timings.items()}
+        _timings.clear()
+    return taken
+
+
+def _timed(fn):
+    def wrapper(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            with _timings_lock:
+                _timings[type(self).NODE_NAME].append(time.perf_counter() - t0)
+
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+
+def _rng(*parts: Any) -> np.random.Generator:
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).digest()
+    return np.random.default_rng(int.from_bytes(digest[:8], "little"))
+
+
+def _resize(frames: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Nearest-neighbour resize of [..., H, W, C] frames."""
+    if frames.shape[-3] == height and frames.shape[-2] == width:
+        return frames
+    rows = (np.arange(height) * frames.shape[-3] // height).astype(np.intp)
+    cols = (np.arange(width) * frames.shape[-2] // width).astype(np.intp)
+    return frames[..., rows, :, :][..., :, cols, :]
+
+
+class FakeModel:
+    """Holds a weight buffer so model residency accounting sees a real size."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.weights = np.zeros(int(_settings["model_mb"] * 1024 * 1024 // 4), dtype=np.float32)
+
+    def model_size(self) -> int:
+        return self.weights.nbytes
+
+
+def _load(name: str) -> FakeModel:
+    if _settings["load_latency"]:
+        time.sleep(_settings["load_latency"])
+    return FakeModel(name)
+
+
+class UNETLoader:
+    NODE_NAME = "UNETLoader"
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "load_unet"
+
+    @_timed
+    def load_unet(self, unet_name, weight_dtype):
+        return (_load(unet_name),)
+
+
+class LoraLoaderModelOnly:
+    NODE_NAME = "LoraLoaderModelOnly"
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "load_lora_model_only"
+
+    @_timed
+    def load_lora_model_only(self, lora_name, strength_model, model):
+        return (model,)
+
+
+class CLIPLoader:
+    NODE_NAME = "CLIPLoader"
+    RETURN_TYPES = ("CLIP",)
+    FUNCTION = "load_clip"
+
+    @_timed
+    def load_clip(self, clip_name, type, device="default"):
+        return (_load(clip_name),)
+
+
+class FakeVAE(FakeModel):
+    """Wan VAE shapes: 16 latent channels, 8x spatial and 4x temporal compression."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.projection = np.eye(3, 16, dtype=np.float32)
+
+    def _decode(self, latent: torch.Tensor) -> torch.Tensor:
+        if _settings["decode_latency"]:
+            time.sleep(_settings["decode_latency"])
+        x = latent.detach().cpu().numpy().astype(np.float32, copy=False)
+        t = 1 + 4 * (x.shape[2] - 1)
+        # Output frame k comes from latent frame ceil(k / 4).
+        index = (np.arange(t) + 3) // 4
+        rgb = np.tensordot(self.projection, x[:, :, index], axes=([1], [1]))  # [3, B, T, h, w]
+        rgb = np.moveaxis(rgb, 0, -1)
+        rgb = np.repeat(np.repeat(rgb, 8, axis=2), 8, axis=3)
+        return torch.from_numpy(np.clip(rgb, 0.0, 1.0))
+
+    def decode(self, samples):
+        return self._decode(samples)
+
+    def decode_tiled(self, samples, tile_x=None, tile_y=None, overlap=None):
+        return self._decode(samples)
+
+
+class VAELoader:
+    NODE_NAME = "VAELoader"
+    RETURN_TYPES = ("VAE",)
+    FUNCTION = "load_vae"
+
+    @_timed
+    def load_vae(self, vae_name):
+        if _settings["load_latency"]:
+            time.sleep(_settings["load_latency"])
+        return (FakeVAE(vae_name),)
+
+
+class CLIPTextEncode:
+    NODE_NAME = "CLIPTextEncode"
+    FUNCTION = "encode"
+
+    @_timed
+    def encode(self, text, clip):
+        # umt5-xxl: 512 tokens x 4096 features.
+        cond = _rng("clip", text).standard_normal((1, 512, 4096), dtype=np.float32)
+        return ([[torch.from_numpy(cond), {"pooled_output": None}]],)
+
+
+class VHS_LoadVideo:
+    NODE_NAME = "VHS_LoadVideo"
+    FUNCTION = "load_video"
+
+    @_timed
+    def load_video(
+        self,
+        video,
+        force_rate,
+        custom_width,
+        custom_height,
+        frame_load_cap,
+        skip_first_frames,
+        select_every_nth,
+        format,
+    ):
+        import av
+
+        with av.open(video) as container:
+            stream = container.streams.video[0]
+            source_fps = float(stream.average_rate or 0) or 24.0
+            source_width, source_height = stream.codec_context.width, stream.codec_context.height
+            width = int(custom_width or 0)
+            height = int(custom_height or 0)
+            if width and not height:
+                height = round(source_height * width / source_width)
+            elif height and not width:
+                width = round(source_width * height / source_height)
+            width = width or source_width
+            height = height or source_height
+
+            rate = float(force_rate or 0) or source_fps
+            nth = max(1, int(select_every_nth or 1))
+            skip = int(skip_first_frames or 0)
+            cap = int(frame_load_cap or 0)
+
+            frames = []
+            source_count = 0
+            resampled = -1
+            kept = 0
+            for frame in container.decode(stream):
+                index = source_count
+                source_count += 1
+                # force_rate keeps the first source frame of every output tick.
+                tick = int(index * rate / source_fps)
+                if tick == resampled:
+                    continue
+                resampled = tick
+                if tick < skip or (tick - skip) % nth:
+                    continue
+                if cap and kept >= cap:
+                    continue
+                frames.append(frame.to_ndarray(width=width, height=height, format="rgb24"))
+                kept += 1
+
+        if format == "Wan" and frames:
+            # Like VHS: the "Wan" format trims every load to 4n+1 frames.
+            frames = frames[: (len(frames) - 1) // 4 * 4 + 1]
+        if frames:
+            images = np.stack(frames).astype(np.float32) / 255.0
+        else:
+            images = np.zeros((0, height, width, 3), dtype=np.float32)
+        loaded_fps = rate / nth
+        info = {
+            "source_fps": source_fps,
+            "source_frame_count": source_count,
+            "source_duration": source_count / source_fps,
+            "source_width": source_width,
+            "source_height": source_height,
+            "loaded_fps": loaded_fps,
+            "loaded_frame_count": images.shape[0],
+            "loaded_duration": images.shape[0] / loaded_fps,
+            "loaded_width": width,
+            "loaded_height": height,
+        }
+        return (torch.from_numpy(images), images.shape[0], None, info)
+
+
+class LoadImage:
+    NODE_NAME = "LoadImage"
+    FUNCTION = "load_image"
+
+    @_timed
+    def load_image(self, image):
+        import av
+
+        with av.open(image) as container:
+            frame = next(container.decode(video=0))
+            rgb = frame.to_ndarray(format="rgb24").astype(np.float32) / 255.0
+        mask = np.zeros(rgb.shape[:2], dtype=np.float32)
+        return (torch.from_numpy(rgb[None]), torch.from_numpy(mask[None]))
+
+
+class SAM3Segmentation:
+    """Thresholds bright, saturated pixels; the synthetic bench clip draws its object that way."""
+
+    NODE_NAME = "SAM3Segmentation"
+    FUNCTION = "segment"
+
+    @_timed
+    def segment(
+        self,
+        prompt,
+        threshold,
+        min_width_pixels,
+        min_height_pixels,
+        use_video_model,
+        unload_after_run,
+        object_ids,
+        image,
+    ):
+        if _settings["segment_latency"]:
+            time.sleep(_settings["segment_latency"] * image.shape[0])
+        frames = image.detach().cpu().numpy()
+        r, g, b = frames[..., 0], frames[..., 1], frames[..., 2]
+        brightest = np.maximum(np.maximum(r, g), b)
+        saturation = brightest - np.minimum(np.minimum(r, g), b)
+        mask = ((saturation > 0.5) & (brightest > 0.7)).astype(np.float32)
+        rows = mask.any(axis=2).sum(axis=1)
+        cols = mask.any(axis=1).sum(axis=1)
+        small = (rows < int(min_height_pixels or 0)) | (cols < int(min_width_pixels or 0))
+        mask[small] = 0.0
+        return (image, None, torch.from_numpy(mask))
+
+
+class WanVaceToVideo:
+    NODE_NAME = "WanVaceToVideo"
+    FUNCTION = "EXECUTE_NORMALIZED"
+
+    @_timed
+    def EXECUTE_NORMALIZED(
+        self,
+        width,
+        height,
+        length,
+        batch_size,
+        strength,
+        positive,
+        negative,
+        vae,
+        control_video=None,
+        control_masks=None,
+        reference_image=None,
+    ):
+        latent_frames = (length - 1) // 4 + 1
+        trim = 1 if reference_image is not None else 0
+        latent = np.zeros((batch_size, 16, latent_frames + trim, height // 8, width // 8), dtype=np.float32)
+        if control_video is not None and control_video.shape[0]:
+            control = control_video.detach().cpu().numpy()[:length]
+            if control.shape[0] < length:
+                pad = np.repeat(control[-1:], length - control.shape[0], axis=0)
+                control = np.concatenate((control, pad))
+            control = _resize(control[::4], height // 8 * 8, width // 8 * 8)
+            pooled = control.reshape(latent_frames, height // 8, 8, width // 8, 8, 3).mean(axis=(2, 4))
+            latent[:, :3, trim:] = np.moveaxis(pooled, -1, 0)[None]
+        if trim:
+            ref = _resize(reference_image.detach().cpu().numpy()[:1], height // 8, width // 8)
+            latent[:, :3, 0] = np.moveaxis(ref[0], -1, 0)[None]
+        return (positive, negative, {"samples": torch.from_numpy(latent)}, trim)
+
+
+class ModelSamplingSD3:
+    NODE_NAME = "ModelSamplingSD3"
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "patch"
+
+    @_timed
+    def patch(self, shift, model):
+        return (model,)
+
+
+class KSampler:
+    NODE_NAME = "KSampler"
+    FUNCTION = "sample"
+
+    @_timed
+    def sample(self, seed, steps, cfg, sampler_name, scheduler, denoise, model, positive, negative, latent_image):
+        rng = np.random.default_rng(int(seed) % (2 ** 63))
+        x = latent_image["samples"].detach().cpu().numpy().copy()
+        mix = (np.eye(16, dtype=np.float32) * 0.9 + rng.standard_normal((16, 16), dtype=np.float32) * 0.01)
+        for _ in range(int(steps)):
+            if _settings["step_latency"]:
+                time.sleep(_settings["step_latency"])
+            x = np.moveaxis(np.tensordot(mix, x, axes=([1], [1])), 0, 1)
+            x += rng.standard_normal(x.shape, dtype=np.float32) * 0.01
+        return ({"samples": torch.from_numpy(np.ascontiguousarray(x))},)
+
+
+class TrimVideoLatent:
+    NODE_NAME = "TrimVideoLatent"
+    FUNCTION = "EXECUTE_NORMALIZED"
+
+    @_timed
+    def EXECUTE_NORMALIZED(self, trim_amount, samples):
+        return ({"samples": samples["samples"][:, :, trim_amount:]},)
+
+
+class VHS_VideoInfo:
+    NODE_NAME = "VHS_VideoInfo"
+    FUNCTION = "get_video_info"
+
+    _KEYS = (
+        "source_fps",
+        "source_frame_count",
+        "source_duration",
+        "source_width",
+        "source_height",
+        "loaded_fps",
+        "loaded_frame_count",
+        "loaded_duration",
+        "loaded_width",
+        "loaded_height",
+    )
+
+    @_timed
+    def get_video_info(self, video_info):
+        return tuple(video_info[key] for key in self._KEYS)
+
+
+class VAEDecode:
+    NODE_NAME = "VAEDecode"
+    FUNCTION = "decode"
+
+    @_timed
+    def decode(self, vae, samples):
+        images = vae.decode(samples["samples"])
+        return (images.reshape(-1, *images.shape[-3:]),)
+
+
+class CreateVideo:
+    NODE_NAME = "CreateVideo"
+    FUNCTION = "EXECUTE_NORMALIZED"
+
+    @_timed
+    def EXECUTE_NORMALIZED(self, fps, images, audio=None):
+        return ((images, fps),)
+
+
+class SaveVideo:
+    NODE_NAME = "SaveVideo"
+    FUNCTION = "EXECUTE_NORMALIZED"
+
+    @_timed
+    def EXECUTE_NORMALIZED(self, filename_prefix, format, codec, video):
+        import av
+
+        images, fps = video
+        subfolder, prefix = os.path.split(filename_prefix)
+        folder = os.path.join(_output_dir, subfolder)
+        os.makedirs(folder, exist_ok=True)
+        counter = 1
+        while True:
+            filename = f"{prefix}_{counter:05}_.mp4"
+            try:
+                with open(os.path.join(folder, filename), "x"):
+                    pass
+                break
+            except FileExistsError:
+                counter += 1
+
+        frames = (images.clamp(0, 1) * 255).round().to(torch.uint8).cpu().numpy()
+        height = frames.shape[1] - frames.shape[1] % 2
+        width = frames.shape[2] - frames.shape[2] % 2
+        with av.open(os.path.join(folder, filename), mode="w") as container:
+            stream = container.add_stream("libx264", rate=Fraction(float(fps)).limit_denominator(1001))
+            stream.pix_fmt = "yuv420p"
+            stream.height, stream.width = height, width
+            for frame in frames:
+                packet_frame = av.VideoFrame.from_ndarray(
+                    np.ascontiguousarray(frame[:height, :width, :3]), format="rgb24"
+                )
+                for packet in stream.encode(packet_frame):
+                    container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        return {"ui": {"videos": [{"filename": filename, "subfolder": subfolder, "type": "output"}]}}
+
+
+class MaskToImage:
+    NODE_NAME = "MaskToImage"
+    FUNCTION = "mask_to_image"
+
+    @_timed
+    def mask_to_image(self, mask):
+        return (mask.reshape(-1, 1, mask.shape[-2], mask.shape[-1]).movedim(1, -1).expand(-1, -1, -1, 3),)
+
+
+class InvertMask:
+    NODE_NAME = "InvertMask"
+    FUNCTION = "invert"
+
+    @_timed
+    def invert(self, mask):
+        return (1.0 - mask,)
+
+
+class ImageCompositeFromMaskBatch:
+    NODE_NAME = "ImageCompositeFromMaskBatch+"
+    FUNCTION = "execute"
+
+    @_timed
+    def execute(self, image_from, image_to, mask):
+        count = image_to.shape[0]
+        height, width = image_to.shape[1], image_to.shape[2]
+        image_from = _resize(image_from[:count].detach().cpu().numpy(), height, width)
+        if image_from.shape[0] < count:
+            image_from = np.concatenate((image_from, np.repeat(image_from[-1:], count - image_from.shape[0], axis=0)))
+        weights = _resize(mask[:count].detach().cpu().numpy()[..., None], height, width)
+        blended = image_from * (1.0 - weights) + image_to.detach().cpu().numpy() * weights
+        return (torch.from_numpy(blended.astype(np.float32)),)
+
+
+class MaskPreview:
+    NODE_NAME = "MaskPreview"
+    FUNCTION = "EXECUTE_NORMALIZED"
+
+    @_timed
+    def EXECUTE_NORMALIZED(self, mask):
+        return {}
+
+
+class PreviewImage:
+    NODE_NAME = "PreviewImage"
+    FUNCTION = "save_images"
+
+    def save_images(self, images):
+        return {}
+
+
+NODE_CLASS_MAPPINGS = {
+    cls.NODE_NAME: cls
+    for cls in (
+        UNETLoader,
+        LoraLoaderModelOnly,
+        CLIPLoader,
+        VAELoader,
+        CLIPTextEncode,
+        VHS_LoadVideo,
+        LoadImage,
+        SAM3Segmentation,
+        WanVaceToVideo,
+        ModelSamplingSD3,
+        KSampler,
+        TrimVideoLatent,
+        VHS_VideoInfo,
+        VAEDecode,
+        CreateVideo,
+        SaveVideo,
+        MaskToImage,
+        InvertMask,
+        ImageCompositeFromMaskBatch,
+        MaskPreview,
+        PreviewImage,
+    )
+}
+
+
+def install(output_dir: str):
+    """Make ``video_script`` use these nodes and write its outputs to ``output_dir``."""
+    global _output_dir
+    _output_dir = output_dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    nodes = types.ModuleType("nodes")
+    nodes.NODE_CLASS_MAPPINGS = NODE_CLASS_MAPPINGS
+    sys.modules["nodes"] = nodes
+
+    import video_script
+
+    video_script._custom_path_added = True
+    video_script._custom_nodes_imported = True
+    video_script._output_directory_set = True
+    video_script._output_directory_cache = output_dir
+    return video_script
@@ -0,0 +1,485 @@
+"""End-to-end benchmark of both backends against local stand-ins.
+
+Runs ``analyze_video`` (detection service) and ``process_video_backend``
+(Flask backend) with a fake Gemini client and fake ComfyUI nodes, and writes
+per-stage latency, throughput and peak memory to a JSON file so results can
+be compared across commits. Run from ``backend/``::
+
+    python bench/run_bench.py
+    python bench/run_bench.py --scenario process_video --iterations 5 --compare bench/results/old.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+SCENARIOS = ("analyze", "analyze_image", "analyze_cached", "process_video", "process_video_detected")
+
+# Fraction of the synthetic clip in which the object is visible.
+_OBJECT_SPAN = (0.3, 0.7)
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repeatable; default: all.")
+    parser.add_argument("--iterations", type=int, default=3, help="Measured runs per scenario.")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per scenario.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Parallel requests for analyze scenarios.")
+    parser.add_argument("--output", default=None, help="Result file (default: bench/results/<time>_<commit>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier result file to print per-stage deltas against.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also record Python/NumPy peak allocations (slower).")
+
+    clip = parser.add_argument_group("input clip")
+    clip.add_argument("--clip-size", default="1280x720", help="WxH of the synthetic input video.")
+    clip.add_argument("--clip-seconds", type=float, default=3.0)
+    clip.add_argument("--clip-fps", type=float, default=24.0)
+
+    workflow = parser.add_argument_group("workflow")
+    workflow.add_argument("--size", default="720x720", help="WxH the workflow loads and generates at.")
+    workflow.add_argument("--frames", type=int, default=41, help="frame_load_cap13 / length26.")
+    workflow.add_argument("--steps", type=int, default=4, help="steps31.")
+    workflow.add_argument("--model-mb", type=int, default=64, help="Weight buffer held by each fake model.")
+    workflow.add_argument("--load-latency", type=float, default=0.0, help="Seconds per fake model load.")
+    workflow.add_argument("--step-latency", type=float, default=0.0, help="Seconds per fake sampler step.")
+    workflow.add_argument("--segment-latency", type=float, default=0.0, help="Seconds per segmented frame.")
+    workflow.add_argument("--decode-latency", type=float, default=0.0, help="Seconds per VAE decode call.")
+
+    gemini = parser.add_argument_group("gemini")
+    gemini.add_argument("--upload-latency", type=float, default=0.2)
+    gemini.add_argument("--upload-mbps", type=float, default=20.0)
+    gemini.add_argument("--processing-seconds", type=float, default=1.0)
+    gemini.add_argument("--request-latency", type=float, default=0.05)
+    gemini.add_argument("--image-latency", type=float, default=0.8)
+    gemini.add_argument("--generate-latency", type=float, default=2.0)
+    gemini.add_argument("--agent-latency", type=float, default=1.5)
+    gemini.add_argument("--tokenc-latency", type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+def _size(value: str) -> tuple:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def _write_clip(path: str, width: int, height: int, seconds: float, fps: float) -> int:
+    """Grey gradient with sensor noise and a red square that crosses the frame mid-clip."""
+    import av
+    from fractions import Fraction
+
+    count = max(1, int(round(seconds * fps)))
+    rng = np.random.default_rng(0)
+    background = np.linspace(40, 200, width, dtype=np.float32)[None, :, None].repeat(height, 0).repeat(3, 2)
+    side = max(16, min(width, height) // 5)
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream("libx264", rate=Fraction(fps).limit_denominator(1001))
+        stream.pix_fmt = "yuv420p"
+        stream.width, stream.height = width, height
+        for index in range(count):
+            frame = background + rng.normal(0, 6, background.shape).astype(np.float32)
+            progress = index / max(1, count - 1)
+            if _OBJECT_SPAN[0] <= progress < _OBJECT_SPAN[1]:
+                along = (progress - _OBJECT_SPAN[0]) / (_OBJECT_SPAN[1] - _OBJECT_SPAN[0])
+                x = int(along * (width - side))
+                y = (height - side) // 2
+                frame[y : y + side, x : x + side] = (230, 20, 20)
+            image = np.clip(frame, 0, 255).astype(np.uint8)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return count
+
+
+def _write_image(path: str, side: int = 300) -> None:
+    import av
+
+    image = np.full((side, side, 3), 245, dtype=np.uint8)
+    image[side // 4 : 3 * side // 4, side // 3 : 2 * side // 3] = (230, 20, 20)
+    with av.open(path, mode="w", format="image2") as container:
+        stream = container.add_stream("png")
+        stream.pix_fmt = "rgb24"
+        stream.width = stream.height = side
+        for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+
+
+def _frame_count(path: str) -> int:
+    import av
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        if stream.frames:
+            return int(stream.frames)
+        return sum(1 for _ in container.decode(stream))
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class _NoCache:
+    """Drop-in for the result/upload caches so every measured run does the full work."""
+
+    def get(self, key: str) -> None:
+        return None
+
+    def put(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def forget(self, key: str) -> None:
+        pass
+
+
+def _git_info() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {
+            "commit": git("rev-parse", "HEAD"),
+            "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        }
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "subject": None, "dirty": None}
+
+
+def _environment() -> Dict[str, Any]:
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "mean": round(statistics.fmean(ordered), 4),
+        "p50": round(statistics.median(ordered), 4),
+        "p95": round(p95, 4),
+        "min": round(ordered[0], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def _measure(run: Callable[[], Dict[str, Any]], trace: bool) -> Dict[str, Any]:
+    if trace:
+        tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    record = run()
+    record["seconds"] = round(time.perf_counter() - t0, 4)
+    if trace:
+        record["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    record["max_rss_mb"] = _max_rss_mb()
+    return record
+
+
+class Bench:
+    def __init__(self, opts: argparse.Namespace, work_dir: str) -> None:
+        self.opts = opts
+        self.work_dir = work_dir
+        self.video_path = os.path.join(work_dir, "input.mp4")
+        self.image_path = os.path.join(work_dir, "reference.png")
+        self.clip_frames = _write_clip(
+            self.video_path, *_size(opts.clip_size), opts.clip_seconds, opts.clip_fps
+        )
+        _write_image(self.image_path)
+        self.detection = {
+            "items": [
+                {
+                    "label": "red box",
+                    "description": "A red box slides across the middle of the frame.",
+                    "timestamps": [
+                        {
+                            "start_time": round(_OBJECT_SPAN[0] * opts.clip_seconds, 3),
+                            "end_time": round(_OBJECT_SPAN[1] * opts.clip_seconds, 3),
+                        }
+                    ],
+                }
+            ]
+        }
+        self._detection_ready = False
+        self._video_ready = False
+
+    # -- detection service -------------------------------------------------
+
+    def _setup_detection(self) -> None:
+        if self._detection_ready:
+            return
+        from fake_genai import FakeGenaiClient, FakeTokenClient
+
+        import gemini_client
+        import pipeline
+        import tokenc_compress
+
+        opts = self.opts
+        self.genai = FakeGenaiClient(
+            items=self.detection["items"],
+            upload_latency=opts.upload_latency,
+            upload_mbps=opts.upload_mbps,
+            processing_seconds=opts.processing_seconds,
+            request_latency=opts.request_latency,
+            image_latency=opts.image_latency,
+            generate_latency=opts.generate_latency,
+        )
+        gemini_client._video_client = self.genai
+        gemini_client._image_client = self.genai
+        tokenc_compress._CLIENT = FakeTokenClient(opts.tokenc_latency)
+        self.pipeline = pipeline
+        self.gemini_client = gemini_client
+        self._real_caches = (pipeline._RESULT_CACHE, gemini_client.UPLOADS)
+        self._detection_ready = True
+
+    def _use_caches(self, enabled: bool) -> None:
+        result_cache, uploads = self._real_caches if enabled else (_NoCache(), _NoCache())
+        self.pipeline._RESULT_CACHE = result_cache
+        self.gemini_client.UPLOADS = uploads
+
+    def _analyze_once(self, image_path: Optional[str]) -> Dict[str, Any]:
+        out = self.pipeline.analyze_video(self.video_path, image_path)
+        return {"stages": dict(out["timings"]), "cached": out["cached"]}
+
+    def analyze(self, scenario: str) -> Dict[str, Any]:
+        self._setup_detection()
+        image_path = self.image_path if scenario == "analyze_image" else None
+        cached = scenario == "analyze_cached"
+        self._use_caches(cached)
+        if cached:
+            self.pipeline.analyze_video(self.video_path, image_path)
+        before = dict(self.genai.calls)
+        result = self._run_iterations(lambda: self._analyze_once(image_path), self.opts.concurrency)
+        # Includes the warm-up runs.
+        result["gemini_calls"] = {k: v - before.get(k, 0) for k, v in self.genai.calls.items()}
+        return result
+
+    # -- Flask backend -----------------------------------------------------
+
+    def _setup_video(self) -> None:
+        if self._video_ready:
+            return
+        import fake_nodes
+        from fake_genai import FakeAgent
+
+        opts = self.opts
+        fake_nodes.configure(
+            model_mb=opts.model_mb,
+            load_latency=opts.load_latency,
+            step_latency=opts.step_latency,
+            segment_latency=opts.segment_latency,
+            decode_latency=opts.decode_latency,
+        )
+        video_script = fake_nodes.install(os.path.join(self.work_dir, "output"))
+        width, height = _size(opts.size)
+        video_script.parser.set_defaults(
+            custom_width11=width,
+            custom_height12=height,
+            width24=width,
+            height25=height,
+            frame_load_cap13=opts.frames,
+            length26=opts.frames,
+            steps31=opts.steps,
+        )
+
+        # The warm-up thread would build the real agent and load ComfyUI.
+        os.environ["WARMUP_ON_STARTUP"] = "0"
+        import main
+
+        main._agent = FakeAgent(opts.agent_latency)
+        self.fake_nodes = fake_nodes
+        self.main = main
+        self._video_ready = True
+
+    def _process_once(self, detection: Optional[tuple]) -> Dict[str, Any]:
+        from mask_cache import MASKS
+
+        # Each run segments from scratch; resident models are kept as in a
+        # long-running server.
+        MASKS.clear()
+        self.fake_nodes.take_timings()
+
+        marks = []
+        output_path, _ = self.main.process_video_backend(
+            self.video_path,
+            "red box",
+            image_path=self.image_path,
+            detection=detection,
+            on_stage=lambda stage: marks.append((stage, time.perf_counter())),
+        )
+        marks.append(("done", time.perf_counter()))
+
+        stages = {stage: round(end - start, 4) for (stage, start), (_, end) in zip(marks, marks[1:])}
+        node_seconds = 0.0
+        for name, values in self.fake_nodes.take_timings().items():
+            stages[f"node.{name}"] = round(sum(values), 4)
+            node_seconds += sum(values)
+        if "generate_video" in stages:
+            stages["workflow_glue"] = round(stages["generate_video"] - node_seconds, 4)
+
+        frames = _frame_count(output_path)
+        os.remove(output_path)
+        return {"stages": stages, "output_frames": frames}
+
+    def process_video(self, scenario: str) -> Dict[str, Any]:
+        self._setup_video()
+        detection = (self.detection, 0) if scenario == "process_video_detected" else None
+        return self._run_iterations(lambda: self._process_once(detection), 1)
+
+    # -- shared ------------------------------------------------------------
+
+    def _run_iterations(self, once: Callable[[], Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+        opts = self.opts
+        for _ in range(opts.warmup):
+            once()
+
+        started = time.perf_counter()
+        if concurrency <= 1:
+            records = [_measure(once, opts.tracemalloc) for _ in range(opts.iterations)]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [pool.submit(_measure, once, opts.tracemalloc) for _ in range(opts.iterations)]
+                records = [f.result() for f in futures]
+        wall = time.perf_counter() - started
+
+        stage_names = sorted({name for r in records for name in r["stages"]})
+        result: Dict[str, Any] = {
+            "iterations": records,
+            "latency": _summary([r["seconds"] for r in records]),
+            "stages": {
+                name: _summary([r["stages"][name] for r in records if name in r["stages"]])
+                for name in stage_names
+            },
+            "throughput": {"requests_per_second": round(len(records) / wall, 4), "concurrency": concurrency},
+            "peak_memory": {"max_rss_mb": max(r["max_rss_mb"] for r in records)},
+        }
+        if any("output_frames" in r for r in records):
+            frames = sum(r.get("output_frames", 0) for r in records)
+            result["throughput"]["frames_per_second"] = round(frames / wall, 3)
+        if opts.tracemalloc:
+            result["peak_memory"]["tracemalloc_peak_mb"] = max(r["tracemalloc_peak_mb"] for r in records)
+        return result
+
+    def run(self, scenario: str) -> Dict[str, Any]:
+        if scenario.startswith("analyze"):
+            return self.analyze(scenario)
+        return self.process_video(scenario)
+
+
+def _print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    for scenario, result in results["scenarios"].items():
+        if "error" in result:
+            print(f"\n{scenario}: FAILED {result['error']}")
+            continue
+        throughput = ", ".join(f"{k}={v}" for k, v in result["throughput"].items())
+        print(f"\n{scenario}: mean {result['latency']['mean']:.3f}s  p95 {result['latency']['p95']:.3f}s  "
+              f"{throughput}  max_rss {result['peak_memory']['max_rss_mb']}MB")
+        old = (baseline or {}).get("scenarios", {}).get(scenario, {})
+        rows = [("(request)", result["latency"], old.get("latency"))]
+        rows += [(name, summary, old.get("stages", {}).get(name)) for name, summary in result["stages"].items()]
+        for name, summary, previous in rows:
+            line = f"  {name:<32} {summary['mean']:>9.4f}s"
+            if previous:
+                delta = summary["mean"] - previous["mean"]
+                pct = f" ({100 * delta / previous['mean']:+.1f}%)" if previous["mean"] else ""
+                line += f"  was {previous['mean']:.4f}s{pct}"
+            print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    opts = _parse_args(argv)
+    scenarios = opts.scenario or list(SCENARIOS)
+    work_dir = tempfile.mkdtemp(prefix="nexhacks_bench_")
+
+    # Caches and rate-limiter state stay inside the scratch directory, and the
+    # limiter is loosened so it never sleeps during a run.
+    os.environ["ANALYZE_CACHE_DIR"] = os.path.join(work_dir, "analyze_cache")
+    os.environ["TOKENC_CACHE_DIR"] = os.path.join(work_dir, "tokenc_cache")
+    os.environ["GEMINI_UPLOAD_CACHE_PATH"] = os.path.join(work_dir, "gemini_upload_cache.json")
+    os.environ["MASK_CACHE_DIR"] = ""
+    os.environ.pop("CONDITIONING_CACHE_DIR", None)
+    os.environ.pop("GEMINI_RATE_LIMIT_STATE", None)
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+    # backend/ first so ``main`` is the Flask app, not detection/main.py.
+    for path in (BENCH_DIR, BACKEND_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    sys.path.append(os.path.join(BACKEND_DIR, "detection"))
+
+    if opts.tracemalloc:
+        tracemalloc.start()
+
+    baseline = None
+    if opts.compare:
+        with open(opts.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_info(),
+        "environment": _environment(),
+        "config": vars(opts),
+        "scenarios": {},
+    }
+    try:
+        bench = Bench(opts, work_dir)
+        results["input"] = {
+            "video_bytes": os.path.getsize(bench.video_path),
+            "video_frames": bench.clip_frames,
+        }
+        for scenario in scenarios:
+            print(f"Running {scenario} ...", flush=True)
+            try:
+                results["scenarios"][scenario] = bench.run(scenario)
+            except Exception as e:
+                results["scenarios"][scenario] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = opts.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        commit = (results["git"]["commit"] or "unknown")[:10]
+        output = os.path.join(BENCH_DIR, "results", f"{stamp}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    _print_report(results, baseline)
+    print(f"\nResults written to {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
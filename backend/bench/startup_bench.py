@@ -0,0 +1,157 @@
+"""Cold-start benchmark for the Flask backend.
+
+Each run starts a fresh interpreter and measures how long ``import main``
+takes, when ``/health`` first answers and, with the warm-up thread enabled,
+when ``/ready`` turns 200. One extra run with ``-X importtime`` lists the
+slowest imports. Results go to JSON like ``run_bench.py``. Run from
+``backend/``::
+
+    python bench/startup_bench.py --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from run_bench import BACKEND_DIR, BENCH_DIR, _environment, _git_info, _summary
+
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+imported = time.perf_counter() - t0
+client = main.app.test_client()
+health_status = client.get("/health").status_code
+health = time.perf_counter() - t0
+out = {"import_seconds": imported, "health_seconds": health, "health_status": health_status}
+if main.WARMUP_ON_STARTUP:
+    main._warmup_done.wait(float(sys.argv[1]))
+    ready = client.get("/ready")
+    out["ready_seconds"] = time.perf_counter() - t0
+    out["ready_status"] = ready.status_code
+    out["warmup"] = main.warmup_state()
+print("STARTUP_RESULT " + json.dumps(out))
+"""
+
+
+def _run_child(warmup: bool, timeout: float, extra_args: Optional[List[str]] = None) -> Dict[str, Any]:
+    env = dict(os.environ, WARMUP_ON_STARTUP="1" if warmup else "0")
+    cmd = [sys.executable] + (extra_args or []) + ["-c", _CHILD, str(timeout)]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=timeout + 60)
+    wall = time.perf_counter() - t0
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP_RESULT "):
+            result = json.loads(line[len("STARTUP_RESULT "):])
+    if result is None:
+        raise RuntimeError(f"Child exited with {proc.returncode}: {proc.stderr[-2000:]}")
+    result["process_seconds"] = wall
+    result["stderr"] = proc.stderr
+    return result
+
+
+def _slowest_imports(stderr: str, top: int) -> List[Dict[str, Any]]:
+    """The ``top`` modules by cumulative time from ``-X importtime`` output.
+
+    Only the first two levels of the import tree are kept (``main`` and what
+    it imports directly), otherwise transitive imports crowd the list.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        # Each nesting level indents the name by two more spaces.
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level > 1:
+            continue
+        rows.append(
+            {
+                "module": name.strip(),
+                "level": level,
+                "self_ms": round(int(self_us) / 1000, 2),
+                "cumulative_ms": round(int(cumulative_us) / 1000, 2),
+            }
+        )
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per mode.")
+    parser.add_argument("--ready-timeout", type=float, default=600.0, help="Seconds to wait for the warm-up.")
+    parser.add_argument("--skip-warmup", action="store_true", help="Only measure with WARMUP_ON_STARTUP=0.")
+    parser.add_argument("--top-imports", type=int, default=15)
+    parser.add_argument("--output", default=None, help="Result file (default: bench/results/startup_<time>_<commit>.json).")
+    return parser.parse_args(argv)
+
+
+def _mode(runs: int, warmup: bool, timeout: float) -> Dict[str, Any]:
+    records = []
+    for _ in range(runs):
+        record = _run_child(warmup, timeout)
+        record.pop("stderr")
+        records.append(record)
+    keys = ["process_seconds", "import_seconds", "health_seconds"] + (["ready_seconds"] if warmup else [])
+    result: Dict[str, Any] = {
+        "runs": records,
+        "summary": {key: _summary([r[key] for r in records]) for key in keys},
+    }
+    if warmup:
+        result["ready_status"] = [r["ready_status"] for r in records]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    opts = _parse_args(argv)
+    results: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_info(),
+        "environment": _environment(),
+        "config": vars(opts),
+        "modes": {},
+    }
+
+    print("Measuring import with warm-up disabled ...", flush=True)
+    results["modes"]["lazy"] = _mode(opts.runs, False, opts.ready_timeout)
+    if not opts.skip_warmup:
+        print("Measuring time to ready with the warm-up thread ...", flush=True)
+        results["modes"]["warmup"] = _mode(opts.runs, True, opts.ready_timeout)
+
+    traced = _run_child(False, opts.ready_timeout, ["-X", "importtime"])
+    results["slowest_imports"] = _slowest_imports(traced["stderr"], opts.top_imports)
+
+    output = opts.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        commit = (results["git"]["commit"] or "unknown")[:10]
+        output = os.path.join(BENCH_DIR, "results", f"startup_{stamp}_{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for mode, result in results["modes"].items():
+        print(f"\n{mode}:")
+        for key, summary in result["summary"].items():
+            print(f"  {key:<18} mean {summary['mean']:.3f}s  p95 {summary['p95']:.3f}s")
+        if "ready_status" in result:
+            print(f"  /ready statuses    {result['ready_status']}")
+            print(f"  warm-up steps      {json.dumps(result['runs'][-1].get('warmup'))}")
+    print("\nslowest imports (cumulative):")
+    for row in results["slowest_imports"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {'  ' * row['level']}{row['module']}")
+    print(f"\nResults written to {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import torch
+
+
+class ConditioningCache:
+    """LRU of CLIPTextEncode outputs keyed by (clip model key, text).
+
+    With ``disk_dir`` set, entries are also written there with ``torch.save`` so
+    a restarted worker can skip the text encoder for prompts it has seen before.
+    """
+
+    def __init__(self, max_entries: int = 64, disk_dir: Optional[str] = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _key(clip_key: Hashable, text: str) -> str:
+        return hashlib.sha256(repr((clip_key, text)).encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.pt")
+
+    def get_or_encode(self, clip_key: Hashable, text: str, encode: Callable[[], Any]) -> Any:
+        key = self._key(clip_key, text)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        value = self._load_from_disk(key)
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._put(key, value)
+            return value
+
+        value = encode()
+        with self._lock:
+            self.misses += 1
+            self._put(key, value)
+        self._save_to_disk(key, value)
+        return value
+
+    def _put(self, key: str, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Any:
+        path = self._disk_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return torch.load(path, map_location="cpu", weights_only=True)
+        except Exception:
+            return None
+
+    def _save_to_disk(self, key: str, value: Any) -> None:
+        path = self._disk_path(key)
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            torch.save(value, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+CONDITIONING = ConditioningCache(
+    max_entries=int(os.getenv("CONDITIONING_CACHE_SIZE", "64")),
+    disk_dir=os.getenv("CONDITIONING_CACHE_DIR") or None,
+)
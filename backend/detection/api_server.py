@@ -1,16 +1,31 @@
+import asyncio
 import os
-import tempfile
+import threading
 import traceback
+from contextlib import asynccontextmanager
 from typing import Optional
 
 from fastapi import FastAPI, File, HTTPException, UploadFile, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
-from pipeline import analyze_video
+from gemini_client import OperationCancelled
+from ingest import STORE, StoredUpload
+from metrics import CONTENT_TYPE, TIMING_HEADERS, collect, render_latest, server_timing, span
+from pipeline import analyze_video, precompress_static_prompts
+from rate_limiter import RateLimitTimeout
 
 
-app = FastAPI(title="Gemini Video Understanding API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("TOKENC_PRECOMPRESS_ON_STARTUP", "1") != "0":
+        # Runs in the background so startup (and /analyze) is never blocked on TokenC.
+        threading.Thread(target=precompress_static_prompts, name="tokenc-precompress", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="Gemini Video Understanding API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,33 +33,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 
-def _save_upload(upload: UploadFile, suffix: str) -> str:
-    fd, path = tempfile.mkstemp(suffix=suffix)
-    os.close(fd)
+@app.middleware("http")
+async def stage_timings(request: Request, call_next):
+    """Collect the request's spans; with TIMING_HEADERS=1 they are returned as Server-Timing."""
+    with collect() as spans:
+        response = await call_next(request)
+    if TIMING_HEADERS and spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
+
+MAX_CONCURRENT_ANALYSES = max(1, int(os.getenv("ANALYZE_MAX_CONCURRENCY", "2")))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ANALYZE_QUEUE_TIMEOUT_SECONDS", "0"))
+
+_analyze_slots = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+
+async def _acquire_slot() -> None:
+    """Take an analysis slot or fail fast with 429 when the server is saturated."""
+    if QUEUE_TIMEOUT_SECONDS <= 0:
+        acquired = False
+        if not _analyze_slots.locked():
+            await _analyze_slots.acquire()
+            acquired = True
+    else:
+        try:
+            acquired = await asyncio.wait_for(_analyze_slots.acquire(), timeout=QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            acquired = False
+
+    if not acquired:
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "error": "Too many concurrent analyses",
+                "limit": MAX_CONCURRENT_ANALYSES,
+            },
+            headers={"Retry-After": "5"},
+        )
+
 
-    written = 0
+def _save_upload(upload: UploadFile, suffix: str) -> StoredUpload:
+    """Stream the upload into the content store; its sha256 comes out of the same pass."""
     try:
-        with open(path, "wb") as f:
-            while True:
-                chunk = upload.file.read(1024 * 1024)
-                if not chunk:
-                    break
-                f.write(chunk)
-                written += len(chunk)
+        stored = STORE.ingest(upload.file, suffix)
     finally:
         try:
             upload.file.close()
         except Exception:
             pass
 
-    if written <= 0:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
+    if stored.size <= 0:
+        stored.release()
         raise HTTPException(
             status_code=400,
             detail={
@@ -54,23 +98,26 @@ def _save_upload(upload: UploadFile, suffix: str) -> str:
             },
         )
 
-    return path
+    return stored
 
 
-def _rm(path: Optional[str]) -> None:
-    if not path:
-        return
-    try:
-        os.remove(path)
-    except Exception:
-        pass
+async def _watch_disconnect(request: Request, cancel_event: threading.Event) -> None:
+    """Set ``cancel_event`` once the client goes away so worker threads stop polling."""
+    while not cancel_event.is_set():
+        if await request.is_disconnected():
+            cancel_event.set()
+            return
+        await asyncio.sleep(0.5)
 
 
 @app.post("/analyze")
 async def analyze(request: Request, video: UploadFile = File(...), image: Optional[UploadFile] = File(None)) -> JSONResponse:
-    video_path: Optional[str] = None
-    image_path: Optional[str] = None
+    stored_video: Optional[StoredUpload] = None
+    stored_image: Optional[StoredUpload] = None
     stage = "init"
+    slot_held = False
+    cancel_event = threading.Event()
+    watcher: Optional[asyncio.Task] = None
 
     try:
         ct = request.headers.get("content-type", "")
@@ -84,21 +131,49 @@ async def analyze(request: Request, video: UploadFile = File(...), image: Option
                 },
             )
 
+        stage = "queue"
+        await _acquire_slot()
+        slot_held = True
+
+        # Everything below blocks (file copies, Gemini polling and backoff
+        # sleeps), so it runs in the threadpool to keep the event loop free.
         stage = "save_video"
         video_suffix = os.path.splitext(video.filename or "")[1] or ".mp4"
-        video_path = _save_upload(video, suffix=video_suffix)
+        with span("upload_save", kind="video"):
+            stored_video = await run_in_threadpool(_save_upload, video, video_suffix)
 
         if image is not None:
             stage = "save_image"
             image_suffix = os.path.splitext(image.filename or "")[1] or ".jpg"
-            image_path = _save_upload(image, suffix=image_suffix)
+            with span("upload_save", kind="image"):
+                stored_image = await run_in_threadpool(_save_upload, image, image_suffix)
 
         stage = "analyze"
-        result = analyze_video(video_path=video_path, image_path=image_path)
+        watcher = asyncio.create_task(_watch_disconnect(request, cancel_event))
+        with span("analyze"):
+            result = await run_in_threadpool(
+                analyze_video,
+                video_path=stored_video.path,
+                image_path=stored_image.path if stored_image is not None else None,
+                cancel_event=cancel_event,
+                video_hash=stored_video.sha256,
+                image_hash=stored_image.sha256 if stored_image is not None else None,
+            )
         return JSONResponse(content=result)
 
     except HTTPException:
         raise
+    except OperationCancelled:
+        print("Client disconnected during stage:", stage)
+        return JSONResponse(status_code=499, content={"stage": stage, "error": "Client disconnected"})
+    except RateLimitTimeout as e:
+        raise HTTPException(
+            status_code=429,
+            detail={"stage": stage, "error": str(e)},
+            headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))},
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail={"stage": stage, "error": str(e)})
     except Exception as e:
         tb = traceback.format_exc()
         print("ERROR stage:", stage)
@@ -108,5 +183,17 @@ async def analyze(request: Request, video: UploadFile = File(...), image: Option
             detail={"stage": stage, "error": str(e), "traceback": tb[-4000:]},
         )
     finally:
-        _rm(video_path)
-        _rm(image_path)
+        cancel_event.set()
+        if watcher is not None:
+            watcher.cancel()
+        if slot_held:
+            _analyze_slots.release()
+        for stored in (stored_video, stored_image):
+            if stored is not None:
+                stored.release()
+
+
+@app.get("/metrics")
+def metrics_endpoint() -> Response:
+    """Prometheus text exposition of the stage histograms (per worker process)."""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE)
@@ -0,0 +1,179 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_json(record: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+
+
+class TwoTierCache:
+    """In-memory LRU in front of a directory of files.
+
+    Files are JSON by default, so values must be JSON-serializable; pass
+    ``load``/``dump`` (and a ``suffix``) for another format. Both tiers honour
+    ``ttl_seconds``; the disk tier is trimmed to ``max_disk_bytes`` by dropping
+    the least recently used files (hits refresh the file mtime).
+    """
+
+    def __init__(
+        self,
+        *,
+        memory_entries: int = 256,
+        disk_dir: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        max_disk_bytes: Optional[int] = None,
+        suffix: str = ".json",
+        load: Callable[[str], Dict[str, Any]] = _load_json,
+        dump: Callable[[Dict[str, Any], str], None] = _dump_json,
+    ) -> None:
+        self.memory_entries = max(1, memory_entries)
+        self.disk_dir = disk_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.suffix = suffix
+        self._load = load
+        self._dump = dump
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key: str, value: Any, *, persist: bool = True) -> None:
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+        if persist:
+            self._write_disk(key, entry)
+
+    def _remember(self, key: str, entry: Tuple[float, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        path = self._path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            data = self._load(path)
+            created_at = float(data["created_at"])
+            value = data["value"]
+        except Exception:
+            return None
+        if self._expired(created_at):
+            _unlink(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return created_at, value
+
+    def _write_disk(self, key: str, entry: Tuple[float, Any]) -> None:
+        path = self._path(key)
+        if not path:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            os.close(fd)
+        except OSError:
+            return
+        try:
+            self._dump({"created_at": entry[0], "value": entry[1]}, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            _unlink(tmp_path)
+            return
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        if not self.disk_dir or self.max_disk_bytes is None:
+            return
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            _unlink(path)
+            total -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def cache_dir_from_env(var: str, default_name: str) -> Optional[str]:
+    """Directory for a disk tier: ``var`` if set (empty disables it), else a temp dir."""
+    value = os.getenv(var)
+    if value is None:
+        return os.path.join(tempfile.gettempdir(), default_name)
+    return value or None
@@ -1,13 +1,19 @@
+import hashlib
 import json
+import os
 import random
 import re
+import threading
 import time
-from typing import Any, Optional
+from typing import Any, Callable, Optional, Tuple
 
 from google import genai
 from google.genai import types
 
 from env_config import get_gemini_video_api_key, get_gemini_image_api_key
+from metrics import span
+from rate_limiter import RateLimitTimeout, limiter_from_env
+from upload_cache import UPLOADS, file_sha256
 
 
 VIDEO_MODEL = "models/gemini-3-flash-preview"
@@ -17,22 +23,49 @@ _DEFAULT_MAX_RETRIES = 6
 _DEFAULT_BASE_BACKOFF_SECONDS = 1.0
 _DEFAULT_MAX_BACKOFF_SECONDS = 30.0
 
+_POLL_INITIAL_SECONDS = 0.5
+_POLL_BACKOFF = 1.5
+_POLL_MAX_SECONDS = 10.0
+_DEFAULT_UPLOAD_DEADLINE_SECONDS = float(os.getenv("GEMINI_UPLOAD_DEADLINE_SECONDS", "600"))
+# A cached upload that can't be confirmed quickly is replaced by a fresh
+# upload instead of waiting out the full retry backoff.
+_CACHED_UPLOAD_PROBE_RETRIES = 1
+
+
+# Placeholder token costs for non-text parts; the bucket is corrected with the
+# real usage_metadata after each call.
+_IMAGE_TOKEN_ESTIMATE = 258
+_FILE_TOKEN_ESTIMATE = int(os.getenv("GEMINI_FILE_TOKEN_ESTIMATE", "20000"))
+
+_LIMITER = limiter_from_env()
 
 _video_client: Optional[Any] = None
 _image_client: Optional[Any] = None
+_CLIENT_KEY_IDS: dict[int, str] = {}
+
+
+def _make_client(api_key: str) -> Any:
+    client = genai.Client(api_key=api_key)
+    # Rate limits are per API key; only a short fingerprint is kept around.
+    _CLIENT_KEY_IDS[id(client)] = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return client
+
+
+def _client_key_id(client: Any) -> str:
+    return _CLIENT_KEY_IDS.get(id(client), "default")
 
 
 def make_video_client() -> Any:
     global _video_client
     if _video_client is None:
-        _video_client = genai.Client(api_key=get_gemini_video_api_key())
+        _video_client = _make_client(get_gemini_video_api_key())
     return _video_client
 
 
 def make_image_client() -> Any:
     global _image_client
     if _image_client is None:
-        _image_client = genai.Client(api_key=get_gemini_image_api_key())
+        _image_client = _make_client(get_gemini_image_api_key())
     return _image_client
 
 
@@ -64,58 +97,220 @@ def _parse_json_maybe_fenced(text: str) -> Any:
         return json.loads(m.group(0))
 
 
-def _sleep_with_jitter(seconds: float) -> None:
-    time.sleep(seconds + random.random() * 0.25)
+class OperationCancelled(RuntimeError):
+    pass
+
+
+def _sleep_with_jitter(seconds: float, cancel_event: Optional[threading.Event] = None) -> None:
+    delay = seconds + random.random() * 0.25
+    if cancel_event is None:
+        time.sleep(delay)
+    elif cancel_event.wait(delay):
+        raise OperationCancelled("Cancelled by caller")
 
 
-def _retryable(fn, *, max_retries: int = _DEFAULT_MAX_RETRIES):
+def _check_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise OperationCancelled("Cancelled by caller")
+
+
+def _classify_error(e: Exception) -> Tuple[bool, bool]:
+    """Return (is_rate_limited, is_transient), preferring the HTTP status over message text."""
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(e, "status_code", None)
+    if isinstance(code, int):
+        return code == 429, code in (408, 500, 502, 503, 504)
+
+    msg = str(e).lower()
+    is_rate = "429" in msg or "too many requests" in msg or "resource_exhausted" in msg
+    is_temp = "503" in msg or "500" in msg or "timeout" in msg or "temporarily" in msg
+    return is_rate, is_temp
+
+
+def _retryable(
+    fn,
+    *,
+    max_retries: int = _DEFAULT_MAX_RETRIES,
+    cancel_event: Optional[threading.Event] = None,
+    on_rate_limited: Optional[Callable[[], None]] = None,
+):
     last_exc: Optional[Exception] = None
     for attempt in range(max_retries + 1):
+        _check_cancelled(cancel_event)
         try:
             return fn()
+        except (OperationCancelled, RateLimitTimeout):
+            raise
         except Exception as e:
             last_exc = e
-            msg = str(e).lower()
-            is_rate = "429" in msg or "too many requests" in msg or "rate" in msg
-            is_temp = "503" in msg or "500" in msg or "timeout" in msg or "temporarily" in msg
+            is_rate, is_temp = _classify_error(e)
+            if is_rate and on_rate_limited is not None:
+                on_rate_limited()
             if attempt == max_retries or (not is_rate and not is_temp):
                 raise
             backoff = min(_DEFAULT_MAX_BACKOFF_SECONDS, _DEFAULT_BASE_BACKOFF_SECONDS * (2 ** attempt))
-            _sleep_with_jitter(backoff)
+            _sleep_with_jitter(backoff, cancel_event)
     if last_exc is not None:
         raise last_exc
     raise RuntimeError("Retry failed unexpectedly")
 
 
-def upload_file_and_wait_active(client: Any, path: str, poll_seconds: float = 2.0) -> Any:
-    uploaded = _retryable(lambda: client.files.upload(file=path))
+def _state_name(info: Any) -> Optional[str]:
+    state = getattr(info, "state", None)
+    return getattr(state, "name", None) if state is not None else None
+
+
+def _upload_cache_key(client: Any, content_hash: str) -> str:
+    # Uploaded files belong to the API key's project; another key can't use them.
+    return f"{_client_key_id(client)}:{content_hash}"
 
-    def _wait() -> Any:
-        while True:
-            info = client.files.get(name=uploaded.name)
-            state = getattr(info, "state", None)
-            state_name = getattr(state, "name", None) if state is not None else None
-            if state_name == "ACTIVE":
-                return uploaded
-            if state_name == "FAILED":
-                raise RuntimeError("Gemini file processing failed")
-            _sleep_with_jitter(poll_seconds)
 
-    return _wait()
+def _reuse_cached_upload(
+    client: Any, cache_key: str, cancel_event: Optional[threading.Event] = None
+) -> Optional[Any]:
+    entry = UPLOADS.get(cache_key)
+    if entry is None:
+        return None
+    try:
+        info = _retryable(
+            lambda: client.files.get(name=entry["name"]),
+            max_retries=_CACHED_UPLOAD_PROBE_RETRIES,
+            cancel_event=cancel_event,
+        )
+    except OperationCancelled:
+        raise
+    except Exception:
+        UPLOADS.forget(cache_key)
+        return None
+    if _state_name(info) != "ACTIVE":
+        UPLOADS.forget(cache_key)
+        return None
+    return info
+
+
+def _max_poll_interval(size_bytes: int) -> float:
+    # Processing time grows with the file, so large videos are polled less
+    # often: 1s for small clips, +1s per 25 MB, capped.
+    return min(_POLL_MAX_SECONDS, 1.0 + size_bytes / (25 * 1024 * 1024))
+
+
+def _wait_until_active(
+    client: Any,
+    name: str,
+    *,
+    max_interval: float,
+    deadline_seconds: float,
+    cancel_event: Optional[threading.Event] = None,
+) -> Any:
+    deadline = time.monotonic() + deadline_seconds
+    interval = min(_POLL_INITIAL_SECONDS, max_interval)
+    while True:
+        info = _retryable(lambda: client.files.get(name=name), cancel_event=cancel_event)
+        state_name = _state_name(info)
+        if state_name == "ACTIVE":
+            return info
+        if state_name == "FAILED":
+            raise RuntimeError("Gemini file processing failed")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Gemini file {name} not ACTIVE after {deadline_seconds:.0f}s (state={state_name})")
+        _sleep_with_jitter(min(interval, remaining), cancel_event)
+        interval = min(interval * _POLL_BACKOFF, max_interval)
+
 
+def upload_file_and_wait_active(
+    client: Any,
+    path: str,
+    poll_seconds: Optional[float] = None,
+    *,
+    use_cache: bool = True,
+    content_hash: Optional[str] = None,
+    deadline_seconds: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Any:
+    """Upload ``path`` (or reuse a cached upload) and wait until it is ACTIVE.
 
-def generate_json(client: Any, model: str, contents: list[Any]) -> Any:
+    Polling starts fast and backs off up to ``poll_seconds`` (derived from the
+    file size when omitted). Raises ``TimeoutError`` after ``deadline_seconds``
+    and ``OperationCancelled`` as soon as ``cancel_event`` is set.
+    """
+    if not use_cache:
+        content_hash = None
+    elif content_hash is None:
+        content_hash = file_sha256(path)
+    cache_key = _upload_cache_key(client, content_hash) if content_hash is not None else None
+    if cache_key is not None:
+        cached = _reuse_cached_upload(client, cache_key, cancel_event)
+        if cached is not None:
+            return cached
+
+    _check_cancelled(cancel_event)
+    with span("gemini_upload"):
+        uploaded = _retryable(lambda: client.files.upload(file=path), cancel_event=cancel_event)
+
+    if poll_seconds is None:
+        poll_seconds = _max_poll_interval(os.path.getsize(path))
+    if deadline_seconds is None:
+        deadline_seconds = _DEFAULT_UPLOAD_DEADLINE_SECONDS
+    with span("gemini_poll"):
+        active = _wait_until_active(
+            client,
+            uploaded.name,
+            max_interval=poll_seconds,
+            deadline_seconds=deadline_seconds,
+            cancel_event=cancel_event,
+        )
+    if cache_key is not None:
+        UPLOADS.put(cache_key, active)
+    return active
+
+
+def _estimate_tokens(contents: list[Any]) -> int:
+    """Rough input size used to reserve TPM budget before the real usage is known."""
+    total = 0
+    for part in contents:
+        text = getattr(part, "text", None)
+        if isinstance(part, str):
+            total += len(part) // 4
+        elif isinstance(text, str):
+            total += len(text) // 4
+        elif getattr(part, "inline_data", None) is not None:
+            total += _IMAGE_TOKEN_ESTIMATE
+        else:
+            total += _FILE_TOKEN_ESTIMATE
+    return total
+
+
+def generate_json(
+    client: Any,
+    model: str,
+    contents: list[Any],
+    cancel_event: Optional[threading.Event] = None,
+) -> Any:
     config = types.GenerateContentConfig(response_mime_type="application/json")
+    limit_key = f"{model}:{_client_key_id(client)}"
+    estimated_tokens = _estimate_tokens(contents)
 
     def _call() -> Any:
-        resp = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=config,
-        )
+        with span("rate_limit_wait"):
+            _LIMITER.acquire(limit_key, estimated_tokens, cancel_event=cancel_event)
+        _check_cancelled(cancel_event)
+        with span("gemini_generate"):
+            resp = client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+        usage = getattr(resp, "usage_metadata", None)
+        used = getattr(usage, "total_token_count", None) if usage is not None else None
+        if isinstance(used, int):
+            _LIMITER.adjust(limit_key, used - estimated_tokens)
         text = getattr(resp, "text", None)
         if not text:
             raise RuntimeError("Gemini returned empty text")
-        return _parse_json_maybe_fenced(text)
+        with span("json_parse"):
+            return _parse_json_maybe_fenced(text)
 
-    return _retryable(_call)
+    return _retryable(_call, cancel_event=cancel_event, on_rate_limited=lambda: _LIMITER.drain(limit_key))
@@ -0,0 +1,210 @@
+"""Content-addressed upload storage with hash-on-write and deduplication.
+
+Dependency-free so both services can use it: the detection service imports
+it as ``ingest``, the Flask backend as ``detection.ingest``.
+
+Layout under the store root::
+
+    incoming/<random>.part           upload being written
+    objects/<aa>/<sha256><suffix>    one file per distinct content
+    refs/<sha256>-<random><suffix>   hard link per live reference
+
+Every caller gets its own ``refs/`` link, so the file it was handed stays
+valid no matter what other threads or worker processes sharing the directory
+do. The link count of an object is its reference count across processes: an
+object with a single link is unreferenced and may be deleted.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+# References left behind by a crashed process would pin their object forever;
+# links this old (no ingest of the same content since) are dropped.
+_STALE_SECONDS = 24 * 3600
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _clean_suffix(suffix: str) -> str:
+    suffix = (suffix or "").lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,8}", suffix) else ""
+
+
+class StoredUpload:
+    """One reference to a stored upload. ``release()`` it when done."""
+
+    def __init__(self, store: "ContentStore", path: str, sha256: str, size: int, duplicate: bool) -> None:
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.duplicate = duplicate
+        self._store = store
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._store._release(self)
+
+    def __enter__(self) -> "StoredUpload":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+class ContentStore:
+    """Streams uploads to disk, hashing them in the same pass, and stores them by sha256.
+
+    An upload whose content is already stored is detected once its hash is
+    known; its freshly written copy is dropped instead of read again. Objects
+    with no live reference are kept for reuse up to ``max_bytes`` (least
+    recently ingested go first); with ``max_bytes=0`` they are deleted as soon
+    as the last reference is released.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 0) -> None:
+        self.root = root
+        self.max_bytes = max(0, max_bytes)
+        self._lock = threading.Lock()
+        self.ingested = 0
+        self.duplicates = 0
+        for name in ("incoming", "objects", "refs"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+        # Clear what an earlier process may have left behind.
+        self.trim()
+
+    def _object_path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}{suffix}")
+
+    def ingest(self, stream: BinaryIO, suffix: str = "", max_bytes: Optional[int] = None) -> StoredUpload:
+        """Copy ``stream`` into the store and return a new reference to its content.
+
+        Raises ``UploadTooLarge`` once more than ``max_bytes`` were read.
+        """
+        suffix = _clean_suffix(suffix)
+        token = uuid.uuid4().hex
+        part = os.path.join(self.root, "incoming", f"{token}.part")
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with open(part, "wb") as f:
+                while True:
+                    chunk = stream.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                    h.update(chunk)
+                    f.write(chunk)
+
+            digest = h.hexdigest()
+            obj = self._object_path(digest, suffix)
+            ref = os.path.join(self.root, "refs", f"{digest}-{token}{suffix}")
+            try:
+                os.link(obj, ref)
+                duplicate = True
+                os.utime(obj, None)
+            except FileNotFoundError:
+                # New content (or its object was just trimmed): the upload
+                # becomes this reference and is then published as the object.
+                # A concurrent identical upload may publish first; either copy
+                # is fine.
+                duplicate = False
+                os.replace(part, ref)
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                try:
+                    os.link(ref, obj)
+                except FileExistsError:
+                    pass
+        finally:
+            _unlink(part)
+
+        with self._lock:
+            self.ingested += 1
+            if duplicate:
+                self.duplicates += 1
+        return StoredUpload(self, ref, digest, size, duplicate)
+
+    def _release(self, upload: StoredUpload) -> None:
+        _unlink(upload.path)
+        obj = self._object_path(upload.sha256, os.path.splitext(upload.path)[1])
+        if self.max_bytes == 0:
+            try:
+                if os.stat(obj).st_nlink <= 1:
+                    _unlink(obj)
+            except OSError:
+                pass
+            return
+        self.trim()
+
+    def _objects(self) -> List[os.DirEntry]:
+        entries = []
+        objects_dir = os.path.join(self.root, "objects")
+        for shard in os.scandir(objects_dir):
+            if shard.is_dir():
+                entries.extend(e for e in os.scandir(shard.path) if e.is_file())
+        return entries
+
+    def trim(self) -> None:
+        """Delete unreferenced objects beyond ``max_bytes`` and leftovers of crashed writers."""
+        now = time.time()
+        for name in ("incoming", "refs"):
+            for entry in os.scandir(os.path.join(self.root, name)):
+                try:
+                    if now - entry.stat().st_mtime > _STALE_SECONDS:
+                        _unlink(entry.path)
+                except OSError:
+                    continue
+
+        with self._lock:
+            unreferenced = []
+            total = 0
+            for entry in self._objects():
+                try:
+                    st = os.stat(entry.path)
+                except OSError:
+                    continue
+                if st.st_nlink <= 1:
+                    unreferenced.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            unreferenced.sort()
+            for _, size, path in unreferenced:
+                if total <= self.max_bytes:
+                    break
+                _unlink(path)
+                total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        objects = self._objects()
+        with self._lock:
+            return {
+                "objects": len(objects),
+                "ingested": self.ingested,
+                "duplicates": self.duplicates,
+                "max_bytes": self.max_bytes,
+            }
+
+
+STORE = ContentStore(
+    root=os.getenv("UPLOAD_STORE_DIR") or os.path.join(tempfile.gettempdir(), "upload_store"),
+    max_bytes=int(os.getenv("UPLOAD_STORE_MAX_BYTES", "0")),
+)
@@ -0,0 +1,156 @@
+"""Stage timing spans, Prometheus-style histograms and per-request timings.
+
+Dependency-free so both services can use it: the detection service imports
+it as ``metrics``, the Flask backend as ``detection.metrics``.
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stages range from sub-millisecond JSON parsing to multi-minute video generation.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+# Off by default: stage names are visible to anyone who can see the responses.
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative histogram with one series per distinct label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted((name, str(v)) for name, v in labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, then +Inf count and sum
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                labels = _format_labels(key + (("le", _format_number(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {_format_number(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(values[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_number(values[-2])}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds",
+    "Time spent in each request stage (upload, Gemini calls, ComfyUI nodes, ...).",
+)
+
+_REGISTRY: List[Histogram] = [STAGE_SECONDS]
+
+# Spans of the request being served, or None outside a collect() block.
+_request_spans: "contextvars.ContextVar[Optional[List[Tuple[str, float]]]]" = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+@contextmanager
+def span(stage: str, **labels: str) -> Iterator[None]:
+    """Time the block into ``stage_duration_seconds{stage=..., status=ok|error}``.
+
+    Extra labels (e.g. ``node`` for ComfyUI nodes) become part of the series and
+    of the name the span gets in per-request timings.
+    """
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=stage, status=status, **labels)
+        spans = _request_spans.get()
+        if spans is not None:
+            name = ".".join([stage] + [labels[k] for k in sorted(labels)])
+            spans.append((name, elapsed))
+
+
+@contextmanager
+def collect() -> Iterator[List[Tuple[str, float]]]:
+    """Gather the ``(name, seconds)`` of every span run in this context (and copies of it)."""
+    spans: List[Tuple[str, float]] = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def start_collecting() -> Tuple[List[Tuple[str, float]], "contextvars.Token"]:
+    """``collect()`` for frameworks with separate before/after request hooks."""
+    spans: List[Tuple[str, float]] = []
+    return spans, _request_spans.set(spans)
+
+
+def stop_collecting(token: "contextvars.Token") -> None:
+    _request_spans.reset(token)
+
+
+def server_timing(spans: Sequence[Tuple[str, float]]) -> str:
+    """``Server-Timing`` header value; repeated stages are summed."""
+    totals: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for name, seconds in spans:
+        token = re.sub(r"[^A-Za-z0-9_.\-]", "_", name)
+        totals[token] = totals.get(token, 0.0) + seconds
+        counts[token] = counts.get(token, 0) + 1
+    entries = []
+    for token, seconds in totals.items():
+        entry = f"{token};dur={seconds * 1000:.1f}"
+        if counts[token] > 1:
+            entry += f';desc="{counts[token]} calls"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+def render_latest() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
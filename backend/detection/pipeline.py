@@ -1,4 +1,9 @@
+import contextvars
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
 from google.genai import types
@@ -11,7 +16,89 @@ from gemini_client import (
     make_video_client,
     upload_file_and_wait_active,
 )
-from tokenc_compress import compress_prompt
+from disk_cache import TwoTierCache, cache_dir_from_env
+from metrics import span
+from tokenc_compress import AGGRESSIVENESS, compress_prompt
+from upload_cache import file_sha256
+
+
+# Bump whenever the prompts below or the post-processing of the model output
+# change, so cached analyses from the old version are no longer served.
+PROMPT_VERSION = "2"
+
+_RESULT_CACHE = TwoTierCache(
+    memory_entries=int(os.getenv("ANALYZE_CACHE_MEMORY_ENTRIES", "256")),
+    disk_dir=cache_dir_from_env("ANALYZE_CACHE_DIR", "analyze_cache"),
+    ttl_seconds=float(os.getenv("ANALYZE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_disk_bytes=int(os.getenv("ANALYZE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+)
+
+
+_TARGET_PROMPT = (
+    "Identify the main physical product or object in the image.\n"
+    "Return JSON only: {\"target\": \"a short noun phrase\"}.\n"
+    "The phrase must start with 'a' or 'an'. Use 3 to 6 words. Include brand only if clearly visible.\n"
+    "Output only JSON."
+)
+
+_OBJECTS_PROMPT = (
+    "Analyze this video.\n"
+    "List every distinct physical object that is clearly visible.\n"
+    "For each object, provide one or more visibility intervals.\n\n"
+    "Rules:\n"
+    "Only include objects that actually appear.\n"
+    "Do not invent objects.\n"
+    "Merge adjacent intervals if the gap is <= 0.5 seconds.\n\n"
+    "Return JSON only using this schema:\n"
+    "{\n"
+    "  \"items\": [\n"
+    "    {\n"
+    "      \"label\": \"string\",\n"
+    "      \"description\": \"one sentence scene description including where the object is\",\n"
+    "      \"timestamps\": [\n"
+    "        {\"start_time\": number, \"end_time\": number}\n"
+    "      ]\n"
+    "    }\n"
+    "  ]\n"
+    "}\n"
+)
+
+_REPLACE_PROMPT_RULES = (
+    "Task:\n"
+    "List every distinct visible object that could be replaced by the target object in the same physical location.\n"
+    "Replacement means swapping what is there with the target in the same place.\n\n"
+    "Rules:\n"
+    "Only include objects that actually appear.\n"
+    "Do not invent objects.\n"
+    "If unsure, omit.\n"
+    "Merge adjacent intervals if the gap is <= 0.5 seconds.\n\n"
+    "Return JSON only using this schema:\n"
+    "{\n"
+    "  \"target\": \"string\",\n"
+    "  \"items\": [\n"
+    "    {\n"
+    "      \"label\": \"string\",\n"
+    "      \"description\": \"one sentence scene description including where the object is\",\n"
+    "      \"timestamps\": [\n"
+    "        {\"start_time\": number, \"end_time\": number}\n"
+    "      ]\n"
+    "    }\n"
+    "  ]\n"
+    "}\n"
+)
+
+STATIC_PROMPTS = (_TARGET_PROMPT, _OBJECTS_PROMPT, _REPLACE_PROMPT_RULES)
+
+
+def precompress_static_prompts() -> None:
+    """Warm the TokenC cache so the first request after a deploy skips compression."""
+    for prompt in STATIC_PROMPTS:
+        compress_prompt(prompt)
+
+
+def _result_cache_key(video_hash: str, image_hash: Optional[str]) -> str:
+    parts = [video_hash, image_hash or "", VIDEO_MODEL, IMAGE_MODEL, PROMPT_VERSION, str(AGGRESSIVENESS)]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
 
 
 def _normalize_target_phrase(s: str) -> str:
@@ -24,7 +111,12 @@ def _normalize_target_phrase(s: str) -> str:
     return f"a {t}"
 
 
-def describe_target_from_image(image_path: str) -> str:
+def describe_target_from_image(image_path: str, cancel_event: Optional[threading.Event] = None) -> str:
+    with span("image_describe"):
+        return _describe_target_from_image(image_path, cancel_event)
+
+
+def _describe_target_from_image(image_path: str, cancel_event: Optional[threading.Event]) -> str:
     client = make_image_client()
 
     with open(image_path, "rb") as f:
@@ -41,13 +133,7 @@ def describe_target_from_image(image_path: str) -> str:
     elif p.endswith(".heif"):
         mime = "image/heif"
 
-    prompt = (
-        "Identify the main physical product or object in the image.\n"
-        "Return JSON only: {\"target\": \"a short noun phrase\"}.\n"
-        "The phrase must start with 'a' or 'an'. Use 3 to 6 words. Include brand only if clearly visible.\n"
-        "Output only JSON."
-    )
-    prompt = compress_prompt(prompt)
+    prompt = compress_prompt(_TARGET_PROMPT)
 
     data = generate_json(
         client=client,
@@ -56,6 +142,7 @@ def describe_target_from_image(image_path: str) -> str:
             types.Part.from_bytes(data=b, mime_type=mime),
             types.Part(text=prompt),
         ],
+        cancel_event=cancel_event,
     )
 
     target = ""
@@ -64,74 +151,120 @@ def describe_target_from_image(image_path: str) -> str:
     return _normalize_target_phrase(target)
 
 
-def analyze_video(video_path: str, image_path: Optional[str] = None) -> Dict[str, Any]:
+class _LinkedCancel:
+    """Cancel event for one side task: set by its own ``set()`` or by the
+    request's ``cancel_event``, whichever comes first."""
+
+    _POLL_SECONDS = 0.1
+
+    def __init__(self, parent: Optional[threading.Event]) -> None:
+        self._parent = parent
+        self._own = threading.Event()
+
+    def set(self) -> None:
+        self._own.set()
+
+    def is_set(self) -> bool:
+        return self._own.is_set() or (self._parent is not None and self._parent.is_set())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            remaining = self._POLL_SECONDS if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # The parent is only polled; the own event wakes the wait at once.
+            self._own.wait(min(remaining, self._POLL_SECONDS))
+        return True
+
+
+def analyze_video(
+    video_path: str,
+    image_path: Optional[str] = None,
+    cancel_event: Optional[threading.Event] = None,
+    video_hash: Optional[str] = None,
+    image_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """``video_hash``/``image_hash`` are the sha256 digests when the caller already
+    has them (uploads hashed while being stored); otherwise the files are read to hash them."""
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
     if image_path is not None and not os.path.exists(image_path):
         raise FileNotFoundError(f"Image not found: {image_path}")
 
-    target_desc = None
-    if image_path is not None:
-        target_desc = describe_target_from_image(image_path)
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    def _timed(stage: str, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[stage] = round(time.perf_counter() - t0, 3)
 
+    if video_hash is None:
+        video_hash = _timed("hash", file_sha256, video_path)
+    if image_hash is None and image_path is not None:
+        image_hash = file_sha256(image_path)
+    cache_key = _result_cache_key(video_hash, image_hash)
+    cached = _RESULT_CACHE.get(cache_key)
+    if cached is not None:
+        out = dict(cached)
+        out["cached"] = True
+        timings["total"] = round(time.perf_counter() - started, 3)
+        out["timings"] = timings
+        return out
+
+    # The image description and the video upload are independent until the
+    # prompt is built, so they run side by side.
     video_client = make_video_client()
-    video_file = upload_file_and_wait_active(video_client, video_path)
+    target_desc = None
+    upload_kwargs = {"content_hash": video_hash, "cancel_event": cancel_event}
+    if image_path is not None:
+        describe_cancel = _LinkedCancel(cancel_event)
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            # The copied context keeps the worker's spans in this request's timings.
+            describe_future = pool.submit(
+                contextvars.copy_context().run,
+                _timed,
+                "describe_image",
+                describe_target_from_image,
+                image_path,
+                describe_cancel,
+            )
+            try:
+                video_file = _timed("upload_video", upload_file_and_wait_active, video_client, video_path, **upload_kwargs)
+            except BaseException:
+                # The request has failed; don't sit out the description's retries too.
+                describe_cancel.set()
+                raise
+            target_desc = describe_future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        video_file = _timed("upload_video", upload_file_and_wait_active, video_client, video_path, **upload_kwargs)
+    timings["prepare"] = round(time.perf_counter() - started, 3)
 
     if target_desc is None:
-        prompt = (
-            "Analyze this video.\n"
-            "List every distinct physical object that is clearly visible.\n"
-            "For each object, provide one or more visibility intervals.\n\n"
-            "Rules:\n"
-            "Only include objects that actually appear.\n"
-            "Do not invent objects.\n"
-            "Merge adjacent intervals if the gap is <= 0.5 seconds.\n\n"
-            "Return JSON only using this schema:\n"
-            "{\n"
-            "  \"items\": [\n"
-            "    {\n"
-            "      \"label\": \"string\",\n"
-            "      \"description\": \"one sentence scene description including where the object is\",\n"
-            "      \"timestamps\": [\n"
-            "        {\"start_time\": number, \"end_time\": number}\n"
-            "      ]\n"
-            "    }\n"
-            "  ]\n"
-            "}\n"
-        )
+        prompt = compress_prompt(_OBJECTS_PROMPT)
     else:
+        # Only the static rules go through TokenC so they can be precompressed;
+        # the target line is spliced in verbatim.
         prompt = (
             "Analyze this video.\n"
             f"Target object to insert or replace: {target_desc}\n\n"
-            "Task:\n"
-            "List every distinct visible object that could be replaced by the target object in the same physical location.\n"
-            "Replacement means swapping what is there with the target in the same place.\n\n"
-            "Rules:\n"
-            "Only include objects that actually appear.\n"
-            "Do not invent objects.\n"
-            "If unsure, omit.\n"
-            "Merge adjacent intervals if the gap is <= 0.5 seconds.\n\n"
-            "Return JSON only using this schema:\n"
-            "{\n"
-            "  \"target\": \"string\",\n"
-            "  \"items\": [\n"
-            "    {\n"
-            "      \"label\": \"string\",\n"
-            "      \"description\": \"one sentence scene description including where the object is\",\n"
-            "      \"timestamps\": [\n"
-            "        {\"start_time\": number, \"end_time\": number}\n"
-            "      ]\n"
-            "    }\n"
-            "  ]\n"
-            "}\n"
+            + compress_prompt(_REPLACE_PROMPT_RULES)
         )
 
-    prompt = compress_prompt(prompt)
-
-    data = generate_json(
-        client=video_client,
-        model=VIDEO_MODEL,
-        contents=[video_file, types.Part(text=prompt)],
+    data = _timed(
+        "generate",
+        lambda: generate_json(
+            client=video_client,
+            model=VIDEO_MODEL,
+            contents=[video_file, types.Part(text=prompt)],
+            cancel_event=cancel_event,
+        ),
     )
 
     out: Dict[str, Any] = {"items": []}
@@ -165,4 +298,9 @@ def analyze_video(video_path: str, image_path: Optional[str] = None) -> Dict[str
             items.append({"label": label, "description": desc, "timestamps": cleaned})
         out["items"] = items
 
+    _RESULT_CACHE.put(cache_key, out)
+    out = dict(out)
+    out["cached"] = False
+    timings["total"] = round(time.perf_counter() - started, 3)
+    out["timings"] = timings
     return out
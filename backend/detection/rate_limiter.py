@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class RateLimitTimeout(RuntimeError):
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token buckets for requests-per-minute and tokens-per-minute, per key.
+
+    Keys are free-form (``"<model>:<api key id>"`` in gemini_client). State
+    lives in memory and is shared by all threads; with ``state_path`` it is
+    kept in a JSON file guarded by ``flock`` so every worker process on the
+    host draws from the same budget. A limit of 0 disables that bucket.
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        *,
+        max_wait_seconds: float = 10.0,
+        state_path: Optional[str] = None,
+    ) -> None:
+        self.rpm = max(0, rpm)
+        self.tpm = max(0, tpm)
+        self.max_wait_seconds = max_wait_seconds
+        self.state_path = state_path if fcntl is not None else None
+        self._state: Dict[str, Dict[str, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Dict[str, List[float]]]]:
+        with self._lock:
+            if not self.state_path:
+                yield self._state
+                return
+
+            with open(self.state_path, "a+", encoding="utf-8") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw.strip() else {}
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _refill(bucket: List[float], capacity: int, now: float) -> None:
+        level, updated = bucket
+        bucket[0] = min(float(capacity), level + (now - updated) * capacity / 60.0)
+        bucket[1] = now
+
+    def _buckets(self, state: Dict[str, Dict[str, List[float]]], key: str, now: float) -> Dict[str, List[float]]:
+        entry = state.setdefault(key, {})
+        for name, capacity in (("requests", self.rpm), ("tokens", self.tpm)):
+            bucket = entry.setdefault(name, [float(capacity), now])
+            self._refill(bucket, capacity, now)
+        return entry
+
+    def _try_take(self, key: str, tokens: int) -> float:
+        """Debit one request and ``tokens`` if available; otherwise return seconds to wait."""
+        now = time.time()
+        with self._locked_state() as state:
+            buckets = self._buckets(state, key, now)
+            waits = []
+            for name, capacity, amount in (("requests", self.rpm, 1), ("tokens", self.tpm, tokens)):
+                if capacity <= 0:
+                    continue
+                amount = min(amount, capacity)
+                deficit = amount - buckets[name][0]
+                if deficit > 0:
+                    waits.append(deficit * 60.0 / capacity)
+            if waits:
+                return max(waits)
+            if self.rpm > 0:
+                buckets["requests"][0] -= 1
+            if self.tpm > 0:
+                buckets["tokens"][0] -= min(tokens, self.tpm)
+            return 0.0
+
+    def acquire(self, key: str, tokens: int = 0, cancel_event: Optional[threading.Event] = None) -> float:
+        """Block until the call fits the budget; returns the time spent waiting.
+
+        Raises ``RateLimitTimeout`` instead of waiting longer than
+        ``max_wait_seconds``.
+        """
+        if self.rpm <= 0 and self.tpm <= 0:
+            return 0.0
+        started = time.monotonic()
+        while True:
+            wait = self._try_take(key, tokens)
+            if wait <= 0:
+                return time.monotonic() - started
+            waited = time.monotonic() - started
+            if waited + wait > self.max_wait_seconds:
+                raise RateLimitTimeout(f"Rate limit budget exhausted for {key}", retry_after=wait)
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return time.monotonic() - started
+            else:
+                time.sleep(wait)
+
+    def adjust(self, key: str, token_delta: int) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if self.tpm <= 0 or not token_delta:
+            return
+        now = time.time()
+        with self._locked_state() as state:
+            bucket = self._buckets(state, key, now)["tokens"]
+            bucket[0] = min(float(self.tpm), bucket[0] - token_delta)
+
+    def drain(self, key: str) -> None:
+        """Empty the request bucket after a server-side 429 so other callers back off too."""
+        if self.rpm <= 0:
+            return
+        now = time.time()
+        with self._locked_state() as state:
+            self._buckets(state, key, now)["requests"][0] = 0.0
+
+
+def limiter_from_env() -> RateLimiter:
+    return RateLimiter(
+        rpm=int(os.getenv("GEMINI_RPM", "60")),
+        tpm=int(os.getenv("GEMINI_TPM", "1000000")),
+        max_wait_seconds=float(os.getenv("GEMINI_RATE_LIMIT_MAX_WAIT_SECONDS", "10")),
+        state_path=os.getenv("GEMINI_RATE_LIMIT_STATE") or None,
+    )
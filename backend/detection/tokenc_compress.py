@@ -1,15 +1,21 @@
 import hashlib
+import os
 from typing import Optional
 
 from tokenc import TokenClient
 
+from disk_cache import TwoTierCache, cache_dir_from_env
 from env_config import get_tokenc_api_key
 
-_CLIENT: Optional[TokenClient] = None
-_CACHE: dict[str, str] = {}
-
 AGGRESSIVENESS = 0.55
 
+_CLIENT: Optional[TokenClient] = None
+_CACHE = TwoTierCache(
+    memory_entries=int(os.getenv("TOKENC_CACHE_ENTRIES", "512")),
+    disk_dir=cache_dir_from_env("TOKENC_CACHE_DIR", "tokenc_cache"),
+    max_disk_bytes=int(os.getenv("TOKENC_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+)
+
 
 def _get_client() -> TokenClient:
     global _CLIENT
@@ -23,11 +29,12 @@ def compress_prompt(text: str) -> str:
     if not t:
         return text
 
-    key = hashlib.sha256(t.encode("utf-8")).hexdigest()
+    key = hashlib.sha256(f"{AGGRESSIVENESS}\n{t}".encode("utf-8")).hexdigest()
     cached = _CACHE.get(key)
     if cached is not None:
         return cached
 
+    compressed = True
     try:
         client = _get_client()
         resp = client.compress_input(input=t, aggressiveness=AGGRESSIVENESS)
@@ -36,6 +43,9 @@ def compress_prompt(text: str) -> str:
             out = t
     except Exception:
         out = t
+        compressed = False
 
-    _CACHE[key] = out
+    # Fallbacks are only remembered for this process so a TokenC outage is not
+    # baked into the on-disk cache.
+    _CACHE.put(key, out, persist=compressed)
     return out
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Gemini keeps uploaded files for 48 hours; used when the API does not report
+# an expiration time.
+DEFAULT_TTL_SECONDS = 47 * 3600
+EXPIRY_MARGIN_SECONDS = 10 * 60
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _default_index_path() -> str:
+    return os.getenv("GEMINI_UPLOAD_CACHE_PATH") or os.path.join(
+        tempfile.gettempdir(), "gemini_upload_cache.json"
+    )
+
+
+class UploadCache:
+    """Maps file content hashes to already uploaded Gemini files.
+
+    Callers prefix the hash with a fingerprint of the API key: uploaded files
+    are only visible to the project that uploaded them.
+
+    The index is a small JSON file so every worker process on the host can
+    reuse the same remote file until it expires.
+    """
+
+    def __init__(self, index_path: Optional[str] = None) -> None:
+        self.index_path = index_path or _default_index_path()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._loaded_mtime: Optional[float] = None
+
+    def _reload(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        if isinstance(data, dict):
+            self._entries = data
+            self._loaded_mtime = mtime
+
+    def _flush(self) -> None:
+        now = time.time()
+        self._entries = {k: v for k, v in self._entries.items() if v.get("expires_at", 0) > now}
+        directory = os.path.dirname(self.index_path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_path)
+            self._loaded_mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.get("expires_at", 0) - EXPIRY_MARGIN_SECONDS <= time.time():
+                return None
+            return dict(entry)
+
+    def put(self, key: str, uploaded: Any) -> None:
+        expires_at = _expiration_timestamp(uploaded)
+        entry = {
+            "name": getattr(uploaded, "name", None),
+            "uri": getattr(uploaded, "uri", None),
+            "mime_type": getattr(uploaded, "mime_type", None),
+            "expires_at": expires_at,
+        }
+        if not entry["name"]:
+            return
+        with self._lock:
+            self._reload()
+            self._entries[key] = entry
+            self._flush()
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._reload()
+            if self._entries.pop(key, None) is not None:
+                self._flush()
+
+
+def _expiration_timestamp(uploaded: Any) -> float:
+    expiration = getattr(uploaded, "expiration_time", None)
+    if expiration is not None:
+        try:
+            return float(expiration.timestamp())
+        except Exception:
+            pass
+    return time.time() + DEFAULT_TTL_SECONDS
+
+
+UPLOADS = UploadCache()
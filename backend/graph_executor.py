@@ -0,0 +1,225 @@
+import copy
+import functools
+import hashlib
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+# Sinks that only feed the ComfyUI UI; they are not run unless asked for.
+PREVIEW_CLASS_TYPES = frozenset({"PreviewImage", "MaskPreview"})
+
+# Outputs of these types reference model weights. The executor never keeps
+# them: residency (and its memory budget) belongs to model_residency.MODELS.
+MODEL_RETURN_TYPES = frozenset({"MODEL", "CLIP", "VAE", "CLIP_VISION", "CONTROL_NET", "UPSCALE_MODEL"})
+
+# resolver(node_id, kwargs, execute) -> node result
+Resolver = Callable[[str, Dict[str, Any], Callable[[], Any]], Any]
+
+
+def _is_link(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) == 2
+        and isinstance(value[0], str)
+        and isinstance(value[1], int)
+    )
+
+
+def _output_at(result: Any, index: int) -> Any:
+    try:
+        return result[index]
+    except (KeyError, TypeError):
+        return result["result"][index]
+
+
+def _literal_fingerprint(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=repr)
+
+
+def _is_nan(value: Any) -> bool:
+    return isinstance(value, float) and math.isnan(value)
+
+
+class GraphExecutor:
+    """Runs an API-format ComfyUI prompt (``PROMPT_DATA``) in topological order.
+
+    Each node's fingerprint covers its class, literal inputs, the
+    ``IS_CHANGED``/``fingerprint_inputs`` marker of its class and the
+    fingerprints of the nodes it links to. The last output of every node is
+    kept with its fingerprint, so a re-run only executes nodes downstream of
+    an input that changed. Only ancestors of the requested outputs run; by
+    default those are the sinks that are not preview nodes. The outputs
+    themselves are never served from the cache.
+
+    Node classes with a resolver are handed to it instead of being run
+    directly, so their outputs can live in an external cache (the model
+    residency manager, the conditioning and mask caches); the executor does
+    not keep those outputs, nor any output typed as a model.
+    """
+
+    def __init__(self, node_class_mappings: Mapping[str, Any]) -> None:
+        self.node_class_mappings = node_class_mappings
+        self._instances: Dict[Tuple[str, str], Any] = {}
+        self._cache: Dict[str, Tuple[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+        self.executed = 0
+        self.reused = 0
+
+    @staticmethod
+    def default_outputs(prompt: Mapping[str, Mapping[str, Any]]) -> List[str]:
+        consumed = {
+            value[0]
+            for node in prompt.values()
+            for value in node["inputs"].values()
+            if _is_link(value)
+        }
+        return [
+            node_id
+            for node_id, node in prompt.items()
+            if node_id not in consumed and node["class_type"] not in PREVIEW_CLASS_TYPES
+        ]
+
+    @staticmethod
+    def _required(prompt: Mapping[str, Mapping[str, Any]], outputs: Iterable[str]) -> List[str]:
+        """Ancestors of ``outputs`` (inclusive) in dependency order."""
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(node_id: str) -> None:
+            mark = state.get(node_id)
+            if mark == 2:
+                return
+            if mark == 1:
+                raise ValueError(f"Cycle in prompt graph at node {node_id}")
+            if node_id not in prompt:
+                raise KeyError(f"Prompt has no node {node_id}")
+            state[node_id] = 1
+            for value in prompt[node_id]["inputs"].values():
+                if _is_link(value):
+                    visit(value[0])
+            state[node_id] = 2
+            order.append(node_id)
+
+        for node_id in outputs:
+            visit(node_id)
+        return order
+
+    def _instance(self, node_id: str, class_type: str) -> Any:
+        key = (node_id, class_type)
+        instance = self._instances.get(key)
+        if instance is None:
+            node_cls = self.node_class_mappings[class_type]
+            prepare_clone = getattr(node_cls, "PREPARE_CLASS_CLONE", None)
+            if callable(prepare_clone):
+                node_cls = prepare_clone(None)
+            instance = node_cls()
+            self._instances[key] = instance
+        return instance
+
+    def _keeps_output(self, class_type: str, resolvers: Mapping[str, Resolver]) -> bool:
+        if class_type in resolvers:
+            return False
+        return_types = getattr(self.node_class_mappings[class_type], "RETURN_TYPES", None) or ()
+        return not MODEL_RETURN_TYPES.intersection(return_types)
+
+    def _change_marker(self, class_type: str, literals: Dict[str, Any]) -> Any:
+        node_cls = self.node_class_mappings[class_type]
+        is_changed = getattr(node_cls, "IS_CHANGED", None) or getattr(node_cls, "fingerprint_inputs", None)
+        if not callable(is_changed):
+            return None
+        try:
+            return is_changed(**literals)
+        except Exception:
+            # Can't tell whether the inputs changed; treat them as changed.
+            return float("nan")
+
+    def run(
+        self,
+        prompt: Mapping[str, Mapping[str, Any]],
+        outputs: Optional[Iterable[str]] = None,
+        on_node: Optional[Callable[[str, str, bool], None]] = None,
+        resolvers: Optional[Mapping[str, Resolver]] = None,
+    ) -> Dict[str, Any]:
+        """Execute what ``outputs`` need and return ``{node_id: raw node result}``.
+
+        ``on_node(node_id, class_type, reused)`` is called for every required
+        node in execution order. ``resolvers`` maps class types to
+        ``resolver(node_id, kwargs, execute)``; ``execute()`` runs the node.
+        """
+        resolvers = resolvers or {}
+        targets = set(outputs) if outputs is not None else set(self.default_outputs(prompt))
+        order = self._required(prompt, sorted(targets))
+
+        with self._lock:
+            self._runs += 1
+            results: Dict[str, Any] = {}
+            fingerprints: Dict[str, str] = {}
+            for node_id in order:
+                node = prompt[node_id]
+                class_type = node["class_type"]
+                literals = {k: v for k, v in node["inputs"].items() if not _is_link(v)}
+                links = {k: v for k, v in node["inputs"].items() if _is_link(v)}
+
+                marker = self._change_marker(class_type, literals)
+                # Requested outputs (SaveVideo, ...) have side effects and always run.
+                cacheable = node_id not in targets and not _is_nan(marker)
+                h = hashlib.sha256()
+                h.update(class_type.encode("utf-8"))
+                h.update(_literal_fingerprint(literals).encode("utf-8"))
+                h.update(_literal_fingerprint(marker).encode("utf-8"))
+                for name in sorted(links):
+                    source_id, index = links[name]
+                    h.update(f"{name}={fingerprints[source_id]}:{index}".encode("utf-8"))
+                # Uncacheable nodes get a fresh fingerprint so everything downstream reruns too.
+                fingerprint = h.hexdigest() if cacheable else f"uncached:{node_id}:{self._runs}"
+                fingerprints[node_id] = fingerprint
+
+                cached = self._cache.get(node_id)
+                if cacheable and cached is not None and cached[0] == fingerprint:
+                    results[node_id] = cached[1]
+                    self.reused += 1
+                    if on_node is not None:
+                        on_node(node_id, class_type, True)
+                    continue
+
+                kwargs = dict(literals)
+                for name, (source_id, index) in links.items():
+                    kwargs[name] = _output_at(results[source_id], index)
+
+                instance = self._instance(node_id, class_type)
+                function_name = getattr(type(instance), "FUNCTION", None) or "EXECUTE_NORMALIZED"
+                execute = functools.partial(getattr(instance, function_name), **kwargs)
+                resolver = resolvers.get(class_type)
+                result = resolver(node_id, kwargs, execute) if resolver is not None else execute()
+                results[node_id] = result
+                self.executed += 1
+                if cacheable and self._keeps_output(class_type, resolvers):
+                    self._cache[node_id] = (fingerprint, result)
+                else:
+                    self._cache.pop(node_id, None)
+                if on_node is not None:
+                    on_node(node_id, class_type, False)
+            return results
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._instances.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached_nodes": len(self._cache), "executed": self.executed, "reused": self.reused}
+
+
+def apply_overrides(
+    prompt: Mapping[str, Mapping[str, Any]], overrides: Mapping[Tuple[str, str], Any]
+) -> Dict[str, Dict[str, Any]]:
+    """Copy of ``prompt`` with ``{(node_id, input_name): value}`` substituted."""
+    updated = copy.deepcopy(dict(prompt))
+    for (node_id, input_name), value in overrides.items():
+        updated[node_id]["inputs"][input_name] = value
+    return updated
+
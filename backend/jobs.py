@@ -0,0 +1,181 @@
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, cleanup_paths: Optional[List[str]] = None) -> None:
+        self.id = job_id
+        self.status = "queued"
+        self.stage = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stage_timings: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.cleanup_paths = list(cleanup_paths or [])
+        self.version = 0
+        self._stage_started_at = self.created_at
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def _touch(self) -> None:
+        self.version += 1
+        self._cond.notify_all()
+
+    def set_stage(self, stage: str) -> None:
+        with self._cond:
+            now = time.time()
+            self.stage_timings[self.stage] = round(
+                self.stage_timings.get(self.stage, 0.0) + now - self._stage_started_at, 3
+            )
+            self.stage = stage
+            self._stage_started_at = now
+            self._touch()
+
+    def _start(self) -> None:
+        self.set_stage("running")
+        with self._cond:
+            self.status = "running"
+            self.started_at = time.time()
+            self._touch()
+
+    def _finish(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        self.set_stage(status)
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self._touch()
+
+    def wait_for_change(self, since_version: int, timeout: float) -> int:
+        with self._cond:
+            if self.version == since_version and not self.done:
+                self._cond.wait(timeout)
+            return self.version
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "stage_timings": dict(self.stage_timings),
+            }
+            if self.result is not None:
+                out["result"] = {k: v for k, v in self.result.items() if not k.startswith("_")}
+            if self.error is not None:
+                out["error"] = self.error
+            return out
+
+
+class JobManager:
+    """Bounded worker pool for long-running video jobs.
+
+    ``submit`` never blocks: it raises ``QueueFullError`` once ``max_queue``
+    jobs are waiting. Finished jobs are kept for ``result_ttl`` seconds so
+    clients can fetch the result, after which their files are removed.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 16, result_ttl: float = 3600.0) -> None:
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="video-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        fn: Callable[..., Dict[str, Any]],
+        *args: Any,
+        cleanup_paths: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Job:
+        self._reap()
+        with self._lock:
+            # Idle workers take a job right away, so only jobs beyond them wait;
+            # max_queue=0 then means "reject while every worker is busy".
+            if self._count("queued") + self._count("running") >= self.max_workers + self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+            job = Job(uuid.uuid4().hex, cleanup_paths=cleanup_paths)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Dict[str, Any]], args: tuple, kwargs: Dict[str, Any]) -> None:
+        job._start()
+        try:
+            result = fn(*args, on_stage=job.set_stage, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            job._finish("failed", error=str(e))
+            _remove_paths(job.cleanup_paths)
+        else:
+            job.cleanup_paths.extend((result or {}).get("_cleanup_paths", []))
+            job._finish("succeeded", result=result)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._reap()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _reap(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [
+                job for job in self._jobs.values()
+                if job.done and job.finished_at is not None and now - job.finished_at > self.result_ttl
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            _remove_paths(job.cleanup_paths)
+
+    def stats(self) -> Dict[str, Any]:
+        self._reap()
+        with self._lock:
+            return {
+                "queued": self._count("queued"),
+                "running": self._count("running"),
+                "succeeded": self._count("succeeded"),
+                "failed": self._count("failed"),
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+            }
+
+
+def _remove_paths(paths: List[str]) -> None:
+    for path in paths:
+        if not path:
+            continue
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
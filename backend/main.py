@@ -1,37 +1,65 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
+import base64
+import json
 import os
+import threading
+from collections import OrderedDict
+import time
 from werkzeug.utils import secure_filename
-import tempfile
 import uuid
+from urllib.parse import quote
 
 
-from langchain.agents import create_agent
 from system_prompt import SYSTEM_PROMPT
 from dotenv import load_dotenv
-import os
 load_dotenv()
-GOOGLE_API_KEY =os.getenv("GOOGLE_API_KEY")
-os.environ["GOOGLE_API_KEY"]= GOOGLE_API_KEY
-from langchain_google_genai import ChatGoogleGenerativeAI
-from video_script import run_video_workflow
-
-model = ChatGoogleGenerativeAI(
-    model="gemini-3-pro-preview",
-    temperature=1.0,  # Gemini 3.0+ defaults to 1.0
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-    # other params...
+from jobs import JobManager, QueueFullError
+from detection.ingest import STORE
+from detection.metrics import (
+    CONTENT_TYPE,
+    TIMING_HEADERS,
+    render_latest,
+    server_timing,
+    span,
+    start_collecting,
+    stop_collecting,
 )
 
-agent= create_agent(
-    model=model,
-    system_prompt= SYSTEM_PROMPT,
-)
+# langchain, the Gemini agent and video_script (torch, ComfyUI) take seconds
+# to import, so they are loaded on first use or by the warm-up thread below;
+# importing this module only builds the Flask app.
+_agent = None
+_agent_lock = threading.Lock()
 
-import base64
-from langchain.messages import HumanMessage
+
+def _get_agent():
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            from langchain.agents import create_agent
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            model = ChatGoogleGenerativeAI(
+                model="gemini-3-pro-preview",
+                temperature=1.0,  # Gemini 3.0+ defaults to 1.0
+                max_tokens=None,
+                timeout=None,
+                max_retries=2,
+                # other params...
+            )
+
+            _agent = create_agent(
+                model=model,
+                system_prompt=SYSTEM_PROMPT,
+            )
+    return _agent
+
+
+def _video_script():
+    import video_script
+
+    return video_script
 
 
 def backend(video_path, input_text):
@@ -39,6 +67,8 @@ def backend(video_path, input_text):
     if not input_text:
         return ""
 
+    from langchain.messages import HumanMessage
+
     with open(video_path, "rb") as video_file:
         video_base64 = base64.b64encode(video_file.read()).decode("utf-8")
 
@@ -49,22 +79,79 @@ def backend(video_path, input_text):
             {"type": "video", "base64": video_base64, "mime_type": mime_type},
         ]
     )
-    response = agent.invoke({"messages": [message]})
+    response = _get_agent().invoke({"messages": [message]})
     return response["messages"][-1].content
 
 
+def _load_comfy_nodes():
+    video_script = _video_script()
+    # Same lock as run_video_workflow, so a request arriving mid warm-up waits
+    # instead of importing the custom nodes a second time.
+    with video_script._workflow_lock:
+        video_script._load_node_class_mappings()
+
+
+# Warm-up steps in order; /ready reports 200 once all of them succeeded.
+WARMUP_STEPS = (
+    ("video_script", _video_script),
+    ("comfy_nodes", _load_comfy_nodes),
+    ("agent", _get_agent),
+)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+
+_warmup_state = {name: {"status": "pending"} for name, _ in WARMUP_STEPS}
+_warmup_lock = threading.Lock()
+_warmup_done = threading.Event()
+_warmup_thread = None
+
+
+def warm_up():
+    """Run every warm-up step, recording status and duration; failures don't stop later steps."""
+    for name, step in WARMUP_STEPS:
+        with _warmup_lock:
+            _warmup_state[name] = {"status": "running"}
+        t0 = time.perf_counter()
+        try:
+            with span("warmup", component=name):
+                step()
+            entry = {"status": "ready"}
+        except Exception as e:
+            entry = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        entry["seconds"] = round(time.perf_counter() - t0, 3)
+        with _warmup_lock:
+            _warmup_state[name] = entry
+    _warmup_done.set()
+
+
+def start_warmup():
+    global _warmup_thread
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def warmup_state():
+    with _warmup_lock:
+        return {name: dict(entry) for name, entry in _warmup_state.items()}
+
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
 
 # Configuration
-UPLOAD_FOLDER = tempfile.mkdtemp()
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+jobs = JobManager(
+    max_workers=int(os.getenv("VIDEO_JOB_WORKERS", "1")),
+    max_queue=int(os.getenv("VIDEO_JOB_MAX_QUEUE", "16")),
+    result_ttl=float(os.getenv("VIDEO_JOB_RESULT_TTL_SECONDS", "3600")),
+)
+
 
 def allowed_video_file(filename):
     """Check if file extension is allowed"""
@@ -81,10 +168,16 @@ DEFAULT_POSITIVE_PROMPT = "three pepsi cans spinning from above"
 DEFAULT_SEGMENTATION_PROMPT = "coke bottle"
 
 
-def process_video_backend(video_path, text_input, *, image_path=None):
+def process_video_backend(video_path, text_input, *, image_path=None, detection=None, on_stage=None):
     """
     Run the ComfyUI workflow (video_script.py) and return the generated file path + text output.
+
+    ``detection`` is an optional ``(analyze result, item)`` pair; when given only
+    the intervals where that item was detected are generated.
     """
+    if on_stage is None:
+        on_stage = lambda stage: None
+
     if not image_path or not os.path.exists(image_path):
         raise ValueError("A reference image is required to run the video workflow.")
 
@@ -92,14 +185,30 @@ def process_video_backend(video_path, text_input, *, image_path=None):
     segmentation_prompt = text_input.strip() if text_input else DEFAULT_SEGMENTATION_PROMPT
     prefix = f"processed_{uuid.uuid4().hex}"
 
-    generated_videos = run_video_workflow(
-        video_path=video_path,
-        positive_prompt=positive_prompt,
-        reference_image=image_path,
-        segmentation_prompt=segmentation_prompt,
-        filename_prefix=prefix,
-        additional_overrides={"queue_size": 1},
-    )
+    on_stage("generate_video")
+    video_script = _video_script()
+    with span("generate_video"):
+        if detection is not None:
+            analysis, item = detection
+            generated_videos = video_script.run_detected_intervals(
+                video_path,
+                positive_prompt,
+                analysis,
+                item,
+                image_path,
+                segmentation_prompt=text_input.strip() or None,
+                filename_prefix=prefix,
+                additional_overrides={"queue_size": 1},
+            )
+        else:
+            generated_videos = video_script.run_video_workflow(
+                video_path=video_path,
+                positive_prompt=positive_prompt,
+                reference_image=image_path,
+                segmentation_prompt=segmentation_prompt,
+                filename_prefix=prefix,
+                additional_overrides={"queue_size": 1},
+            )
 
     if not generated_videos:
         raise RuntimeError("Video generation workflow did not produce any outputs.")
@@ -108,84 +217,351 @@ def process_video_backend(video_path, text_input, *, image_path=None):
     if not os.path.exists(processed_video_path):
         raise FileNotFoundError(f"Generated video missing at {processed_video_path}")
 
-    text_output = backend(video_path, text_input)
+    on_stage("describe_video")
+    with span("describe_video"):
+        text_output = backend(video_path, text_input)
     return processed_video_path, text_output
 
 
+def _run_video_job(video, text_input, *, image, detection, on_stage):
+    try:
+        output_path, output_text = process_video_backend(
+            video.path,
+            text_input,
+            image_path=image.path,
+            detection=detection,
+            on_stage=on_stage,
+        )
+    finally:
+        video.release()
+        image.release()
+    return {
+        'text': output_text,
+        'filename': os.path.basename(output_path),
+        '_output_path': output_path,
+        '_cleanup_paths': [output_path],
+    }
+
+
+def _validate_upload_request():
+    """Return an error message for a bad /process-video style payload, or None."""
+    if 'video' not in request.files:
+        return 'No video file provided'
+
+    video_file = request.files['video']
+    image_file = request.files.get('image')
+
+    if video_file.filename == '':
+        return 'No video file selected'
+
+    if not allowed_video_file(video_file.filename):
+        return 'Invalid file type'
+
+    if image_file is None or image_file.filename == '':
+        return 'Reference image is required'
+
+    if not allowed_image_file(image_file.filename):
+        return 'Invalid image file type'
+
+    try:
+        _request_detection()
+    except ValueError as e:
+        return str(e)
+
+    return None
+
+
+def _request_detection():
+    """Optional `detection` (an /analyze response as JSON) and `item` (index or label) form fields."""
+    raw = request.form.get('detection')
+    if not raw:
+        return None
+    try:
+        analysis = json.loads(raw)
+    except ValueError:
+        raise ValueError('Invalid detection JSON')
+    if not isinstance(analysis, dict) or not isinstance(analysis.get('items'), list):
+        raise ValueError('Detection must be an /analyze response with an items list')
+    item = request.form.get('item', '0')
+    return analysis, int(item) if item.isdigit() else item
+
+
+def _ingest_upload(file_storage, kind):
+    """Stream an upload into the content store, hashing it on the way; returns the StoredUpload."""
+    suffix = os.path.splitext(secure_filename(file_storage.filename))[1]
+    with span("upload_save", kind=kind):
+        return STORE.ingest(file_storage.stream, suffix)
+
+
+def _save_request_files():
+    """Store the video and reference image of the request; release() both when done.
+
+    Each request gets its own reference, so same-named concurrent uploads
+    can't overwrite each other and identical content is stored once.
+    """
+    video = _ingest_upload(request.files['video'], "video")
+    try:
+        image = _ingest_upload(request.files['image'], "image")
+    except Exception:
+        video.release()
+        raise
+    # The mask cache keys on the video digest; hand it over instead of re-reading
+    # the file. Imported here because mask_cache pulls in torch.
+    from mask_cache import register_digest
+    register_digest(video.path, video.sha256)
+    return video, image
+
+
 @app.route('/process-video', methods=['POST'])
 def process_video():
     """
     Endpoint to receive video and text from frontend,
     process it, and return the processed video
     """
-    input_path = None
-    image_path = None
+    uploads = ()
     output_path = None
     try:
-        # Check if video file is present
-        if 'video' not in request.files:
-            return jsonify({'error': 'No video file provided'}), 400
-        
-        video_file = request.files['video']
-        image_file = request.files.get('image')
+        error = _validate_upload_request()
+        if error:
+            return jsonify({'error': error}), 400
+
         text_input = request.form.get('text', '')
-        
-        # Validate file
-        if video_file.filename == '':
-            return jsonify({'error': 'No video file selected'}), 400
-        
-        if not allowed_video_file(video_file.filename):
-            return jsonify({'error': 'Invalid file type'}), 400
-
-        if image_file is None or image_file.filename == '':
-            return jsonify({'error': 'Reference image is required'}), 400
-
-        if not allowed_image_file(image_file.filename):
-            return jsonify({'error': 'Invalid image file type'}), 400
-        
-        # Save uploaded video
-        filename = secure_filename(video_file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        video_file.save(input_path)
-
-        image_filename = secure_filename(image_file.filename)
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename)
-        image_file.save(image_path)
-        
+        uploads = video, image = _save_request_files()
+
         # Process video with backend
         output_path, output_text = process_video_backend(
-            input_path,
+            video.path,
             text_input,
-            image_path=image_path,
+            image_path=image.path,
+            detection=_request_detection(),
         )
-        with open(output_path, 'rb') as processed_file:
-            video_base64 = base64.b64encode(processed_file.read()).decode('utf-8')
-        
-        # Return processed video
-        return jsonify({
-            'video': video_base64,
-            'text': output_text,
-            'filename': os.path.basename(output_path)
-        }), 200
-    
+
+        # Stream the file from disk; the output is removed once the response
+        # has been sent.
+        response = _send_video(output_path, os.path.basename(output_path), text=output_text)
+        cleanup_paths = (output_path,)
+        response.call_on_close(lambda: _remove_files(cleanup_paths))
+        output_path = None
+        return response
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    
+
     finally:
-        # Clean up uploaded file
-        for path in (input_path, image_path, output_path):
-            if path and os.path.exists(path):
-                try:
-                    os.remove(path)
-                except OSError:
-                    pass
+        for stored in uploads:
+            stored.release()
+        _remove_files((output_path,))
+
+
+def _remove_files(paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+MAX_TEXT_HEADER_LENGTH = 4096
+
+# Narratives too long for a header are kept here and served whole from
+# GET /texts/<id>, for as long as finished job results are kept.
+GENERATED_TEXT_TTL_SECONDS = float(os.getenv("VIDEO_JOB_RESULT_TTL_SECONDS", "3600"))
+GENERATED_TEXT_MAX_ENTRIES = 256
+_generated_texts = OrderedDict()  # text id -> (stored_at, text)
+_generated_texts_lock = threading.Lock()
+
+
+def _expire_generated_texts(now):
+    while _generated_texts:
+        text_id, (stored_at, _) = next(iter(_generated_texts.items()))
+        if now - stored_at <= GENERATED_TEXT_TTL_SECONDS and len(_generated_texts) <= GENERATED_TEXT_MAX_ENTRIES:
+            break
+        del _generated_texts[text_id]
+
+
+def _store_generated_text(text):
+    text_id = uuid.uuid4().hex
+    now = time.time()
+    with _generated_texts_lock:
+        _generated_texts[text_id] = (now, text)
+        _expire_generated_texts(now)
+    return text_id
+
+
+@app.route('/texts/<text_id>', methods=['GET'])
+def generated_text(text_id):
+    with _generated_texts_lock:
+        _expire_generated_texts(time.time())
+        entry = _generated_texts.get(text_id)
+    if entry is None:
+        return jsonify({'error': 'Unknown or expired text'}), 404
+    return jsonify({'text': entry[1]}), 200
+
+
+def _send_video(path, filename, text=None):
+    """Serve a generated video straight from disk (chunked, with Range support)."""
+    response = send_file(
+        path,
+        mimetype='video/mp4',
+        conditional=True,
+        download_name=filename,
+    )
+    # With direct passthrough Werkzeug hands the file wrapper to the server as-is
+    # and call_on_close() callbacks never fire; iterating it keeps the same
+    # chunked read but runs them once the body is sent.
+    response.direct_passthrough = False
+    response.headers['X-Output-Filename'] = filename
+    response.headers['Access-Control-Expose-Headers'] = (
+        'X-Output-Filename, X-Generated-Text, X-Generated-Text-Url, Content-Range, Accept-Ranges, Server-Timing'
+    )
+    if text:
+        # Headers are latin-1 only, so the text is percent-encoded.
+        encoded = quote(text, safe='')
+        if len(encoded) > MAX_TEXT_HEADER_LENGTH:
+            # Too long for a header: point to the whole text instead of cutting it.
+            response.headers['X-Generated-Text-Url'] = f"/texts/{_store_generated_text(text)}"
+        else:
+            response.headers['X-Generated-Text'] = encoded
+    return response
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a /process-video style request and return its job id right away."""
+    error = _validate_upload_request()
+    if error:
+        return jsonify({'error': error}), 400
+
+    uploads = ()
+    try:
+        uploads = video, image = _save_request_files()
+        # The job releases the uploads once it has run.
+        job = jobs.submit(
+            _run_video_job,
+            video,
+            request.form.get('text', ''),
+            image=image,
+            detection=_request_detection(),
+        )
+    except QueueFullError as e:
+        for stored in uploads:
+            stored.release()
+        return jsonify({'error': str(e), 'queue': jobs.stats()}), 429
+    except Exception as e:
+        for stored in uploads:
+            stored.release()
+        return jsonify({'error': str(e)}), 500
+
+    body = job.to_dict()
+    body['status_url'] = f"/jobs/{job.id}"
+    body['events_url'] = f"/jobs/{job.id}/events"
+    body['video_url'] = f"/jobs/{job.id}/video"
+    return jsonify(body), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def job_queue_stats():
+    return jsonify(jobs.stats()), 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events: one `data:` line with the job state per change."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def stream():
+        version = -1
+        while True:
+            new_version = job.wait_for_change(version, timeout=15.0)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.done:
+                return
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/jobs/<job_id>/video', methods=['GET'])
+def job_video(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if not job.done:
+        return jsonify({'error': 'Job not finished', 'status': job.status}), 409
+    if job.status != 'succeeded' or not job.result:
+        return jsonify({'error': job.error or 'Job failed', 'status': job.status}), 409
+
+    output_path = job.result['_output_path']
+    if not os.path.exists(output_path):
+        return jsonify({'error': 'Result expired'}), 410
+    return _send_video(output_path, job.result['filename'])
+
+
+@app.before_request
+def _start_stage_timings():
+    g.stage_spans, g.stage_spans_token = start_collecting()
+
+
+@app.after_request
+def _add_server_timing(response):
+    """With TIMING_HEADERS=1 the request's stage spans are returned as Server-Timing."""
+    spans = g.get('stage_spans')
+    if TIMING_HEADERS and spans:
+        response.headers['Server-Timing'] = server_timing(spans)
+    return response
+
+
+@app.teardown_request
+def _stop_stage_timings(exc):
+    token = g.pop('stage_spans_token', None)
+    if token is not None:
+        stop_collecting(token)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of the stage histograms."""
+    return Response(render_latest(), content_type=CONTENT_TYPE)
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness: answers as soon as the app is imported, even while warming up."""
     return jsonify({'status': 'healthy'}), 200
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: 200 once the warm-up finished cleanly (or is disabled), else 503."""
+    if not WARMUP_ON_STARTUP:
+        return jsonify({'status': 'ready', 'warmup': 'disabled'}), 200
+    state = warmup_state()
+    if not _warmup_done.is_set():
+        return jsonify({'status': 'warming_up', 'warmup': state}), 503
+    if any(entry['status'] != 'ready' for entry in state.values()):
+        return jsonify({'status': 'failed', 'warmup': state}), 503
+    return jsonify({'status': 'ready', 'warmup': state}), 200
+
+
+# Under the debug reloader the parent process only watches files; the child
+# it spawns (WERKZEUG_RUN_MAIN=true) serves requests and does the warm-up.
+if WARMUP_ON_STARTUP and not (__name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    start_warmup()
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
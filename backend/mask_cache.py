@@ -0,0 +1,159 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import torch
+
+from detection.disk_cache import TwoTierCache, cache_dir_from_env
+from detection.upload_cache import file_sha256
+
+
+def encode_masks(mask: torch.Tensor) -> Dict[str, Any]:
+    """Run-length encode a [frames, H, W] mask batch, one run list per frame.
+
+    Runs alternate 0/1 starting with 0 (a frame starting with 1 gets a leading
+    zero-length run). Soft masks can't be run-length encoded losslessly and are
+    stored as float16 instead.
+    """
+    mask = mask.detach().cpu()
+    shape = tuple(mask.shape)
+    if not bool(((mask == 0) | (mask == 1)).all()):
+        return {"shape": shape, "dense": mask.to(torch.float16)}
+
+    flat = mask.reshape(shape[0], -1).to(torch.uint8)
+    runs = []
+    offsets = [0]
+    for frame in flat:
+        change = torch.nonzero(frame[1:] != frame[:-1]).flatten() + 1
+        bounds = torch.cat((torch.tensor([0]), change, torch.tensor([frame.numel()])))
+        frame_runs = torch.diff(bounds)
+        if frame.numel() and frame[0] == 1:
+            frame_runs = torch.cat((torch.tensor([0]), frame_runs))
+        runs.append(frame_runs.to(torch.int32))
+        offsets.append(offsets[-1] + frame_runs.numel())
+    return {
+        "shape": shape,
+        "runs": torch.cat(runs) if runs else torch.zeros(0, dtype=torch.int32),
+        "offsets": torch.tensor(offsets, dtype=torch.int64),
+    }
+
+
+def decode_masks(encoded: Dict[str, Any]) -> torch.Tensor:
+    shape = tuple(encoded["shape"])
+    if "dense" in encoded:
+        return encoded["dense"].to(torch.float32).reshape(shape)
+
+    runs = encoded["runs"].to(torch.int64)
+    offsets = encoded["offsets"].tolist()
+    frames = []
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        frame_runs = runs[start:end]
+        values = (torch.arange(frame_runs.numel()) % 2).to(torch.float32)
+        frames.append(torch.repeat_interleave(values, frame_runs))
+    if not frames:
+        return torch.zeros(shape)
+    return torch.stack(frames).reshape(shape)
+
+
+def _encoded_bytes(encoded: Dict[str, Any]) -> int:
+    return sum(
+        value.numel() * value.element_size() for value in encoded.values() if isinstance(value, torch.Tensor)
+    )
+
+
+# Digests of recently seen files; uploads get a fresh path per request, so
+# the memo is bounded.
+_DIGEST_MEMO_ENTRIES = 256
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def _remember_digest(memo_key: Tuple[str, int, int], digest: str) -> None:
+    with _digests_lock:
+        _digests[memo_key] = digest
+        _digests.move_to_end(memo_key)
+        while len(_digests) > _DIGEST_MEMO_ENTRIES:
+            _digests.popitem(last=False)
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, memoized on (path, size, mtime) so re-runs don't re-read it."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(memo_key)
+        if digest is not None:
+            _digests.move_to_end(memo_key)
+            return digest
+
+    digest = file_sha256(path)
+    _remember_digest(memo_key, digest)
+    return digest
+
+
+def register_digest(path: str, digest: str) -> None:
+    """Seed the memo with a digest computed elsewhere (e.g. while the upload was written)."""
+    st = os.stat(path)
+    _remember_digest((os.path.abspath(path), st.st_size, st.st_mtime_ns), digest)
+
+
+def _load_record(path: str) -> Dict[str, Any]:
+    return torch.load(path, map_location="cpu", weights_only=True)
+
+
+def _dump_record(record: Dict[str, Any], path: str) -> None:
+    torch.save(record, path)
+
+
+class MaskCache(TwoTierCache):
+    """LRU of run-length encoded segmentation masks, mirrored to disk as ``.pt`` files.
+
+    Keys are any hashable describing the video content and segmentation
+    settings. The disk tier is trimmed to ``max_disk_bytes`` by dropping the
+    least recently used files (hits refresh the file mtime).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 8,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: Optional[int] = None,
+    ) -> None:
+        super().__init__(
+            memory_entries=max_entries,
+            disk_dir=disk_dir,
+            max_disk_bytes=max_disk_bytes,
+            suffix=".pt",
+            load=_load_record,
+            dump=_dump_record,
+        )
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def get_or_segment(self, key: Hashable, segment: Callable[[], torch.Tensor]) -> torch.Tensor:
+        digest = self._key(key)
+        encoded = self.get(digest)
+        if encoded is not None:
+            return decode_masks(encoded)
+
+        mask = segment()
+        self.put(digest, encode_masks(mask))
+        return mask
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats["memory_bytes"] = sum(_encoded_bytes(entry[1]) for entry in self._memory.values())
+        stats["max_entries"] = self.memory_entries
+        return stats
+
+
+MASKS = MaskCache(
+    max_entries=int(os.getenv("MASK_CACHE_MEMORY_ENTRIES", "8")),
+    disk_dir=cache_dir_from_env("MASK_CACHE_DIR", "mask_cache"),
+    max_disk_bytes=int(os.getenv("MASK_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def _budget_from_env() -> Optional[int]:
+    raw = os.getenv("MODEL_RESIDENCY_BUDGET_GB", "").strip()
+    if not raw:
+        return None
+    try:
+        gb = float(raw)
+    except ValueError:
+        return None
+    if gb <= 0:
+        return None
+    return int(gb * (1024 ** 3))
+
+
+def estimate_model_bytes(loaded: Any) -> int:
+    """Best-effort size of a ComfyUI loader result (ModelPatcher, CLIP or VAE)."""
+    obj = loaded
+    if isinstance(obj, (tuple, list)) and obj:
+        obj = obj[0]
+
+    for candidate in (obj, getattr(obj, "patcher", None)):
+        if candidate is None:
+            continue
+        model_size = getattr(candidate, "model_size", None)
+        if callable(model_size):
+            try:
+                return int(model_size())
+            except Exception:
+                pass
+
+    module = getattr(obj, "first_stage_model", None) or getattr(obj, "model", None)
+    parameters = getattr(module, "parameters", None)
+    if callable(parameters):
+        try:
+            return int(sum(p.numel() * p.element_size() for p in parameters()))
+        except Exception:
+            pass
+    return 0
+
+
+class ModelResidency:
+    """Process-wide LRU of loaded models with an optional byte budget.
+
+    Entries are keyed by whatever identifies a loader call (names, dtype, LoRA
+    strength, ...). When the budget is exceeded the least recently used entries
+    that are not pinned by the current request are dropped, together with any
+    entry derived from them (e.g. a LoRA-patched clone of an evicted UNet).
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None) -> None:
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._parents: Dict[Hashable, Tuple[Hashable, ...]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        *,
+        size_fn: Optional[Callable[[Any], int]] = estimate_model_bytes,
+        parents: Tuple[Hashable, ...] = (),
+        pinned: Tuple[Hashable, ...] = (),
+    ) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            value = loader()
+            size = size_fn(value) if size_fn is not None else 0
+            self._entries[key] = (value, size)
+            if parents:
+                self._parents[key] = tuple(parents)
+            self._evict(keep=(key,) + tuple(parents) + tuple(pinned))
+            return value
+
+    def _evict(self, keep: Tuple[Hashable, ...]) -> None:
+        if self.budget_bytes is None:
+            return
+        evicted = False
+        for key in list(self._entries.keys()):
+            if self.total_bytes() <= self.budget_bytes:
+                break
+            if key in keep or key not in self._entries:
+                continue
+            self._drop(key)
+            evicted = True
+        if evicted:
+            _release_device_memory()
+
+    def _drop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        self._parents.pop(key, None)
+        self.evictions += 1
+        for child, parents in list(self._parents.items()):
+            if key in parents:
+                self._drop(child)
+
+    def set_budget(self, budget_bytes: Optional[int]) -> None:
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict(keep=())
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._parents.clear()
+        _release_device_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": [repr(k) for k in self._entries.keys()],
+                "resident_bytes": self.total_bytes(),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _release_device_memory() -> None:
+    import gc
+
+    gc.collect()
+    try:
+        import comfy.model_management as mm
+    except ImportError:
+        return
+    try:
+        mm.cleanup_models()
+        mm.soft_empty_cache()
+    except Exception:
+        pass
+
+
+MODELS = ModelResidency(budget_bytes=_budget_from_env())
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The Flask side imports backend/ modules by bare name and the detection
+# service does the same inside backend/detection/.
+for path in (BACKEND_DIR, os.path.join(BACKEND_DIR, "detection")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Module-level caches and stores are created on import; keep them off the
+# shared temp dirs.
+os.environ.setdefault("ANALYZE_CACHE_DIR", "")
+os.environ.setdefault("MASK_CACHE_DIR", "")
+os.environ.setdefault("UPLOAD_STORE_DIR", tempfile.mkdtemp(prefix="upload_store_test_"))
+
+
+@pytest.fixture
+def fake_comfy(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(BACKEND_DIR, "bench"))
+    monkeypatch.setitem(sys.modules, "nodes", sys.modules.get("nodes"))
+    import fake_nodes
+    import run_bench
+
+    fake_nodes.install(str(tmp_path / "output"))
+    video = str(tmp_path / "in.mp4")
+    image = str(tmp_path / "ref.png")
+    # 40 frames: not 4n+1, so no single "Wan" load covers the clip.
+    run_bench._write_clip(video, 96, 96, 2.0, 20)
+    run_bench._write_image(image)
+    return video, image
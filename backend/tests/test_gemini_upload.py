@@ -0,0 +1,77 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import gemini_client
+from gemini_client import OperationCancelled, upload_file_and_wait_active
+from upload_cache import UploadCache
+
+
+class TransientError(Exception):
+    code = 503
+
+
+class FakeFiles:
+    def __init__(self, get_errors=0):
+        self.get_errors = get_errors
+        self.gets = 0
+        self.uploads = 0
+
+    def get(self, name):
+        self.gets += 1
+        if self.get_errors:
+            self.get_errors -= 1
+            raise TransientError(name)
+        return SimpleNamespace(name=name, state=SimpleNamespace(name="ACTIVE"))
+
+    def upload(self, file):
+        self.uploads += 1
+        return SimpleNamespace(name=f"files/new{self.uploads}")
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    cache = UploadCache(str(tmp_path / "uploads.json"))
+    monkeypatch.setattr(gemini_client, "UPLOADS", cache)
+    sleeps = []
+    real_sleep = gemini_client._sleep_with_jitter
+
+    def sleep(seconds, cancel_event=None):
+        sleeps.append(seconds)
+        real_sleep(0, cancel_event)
+
+    monkeypatch.setattr(gemini_client, "_sleep_with_jitter", sleep)
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"video")
+    return cache, str(video), sleeps
+
+
+def test_unconfirmed_cached_upload_falls_back_after_a_short_probe(uploads):
+    cache, video, sleeps = uploads
+    files = FakeFiles()
+    client = SimpleNamespace(files=files)
+    key = gemini_client._upload_cache_key(client, gemini_client.file_sha256(video))
+    cache.put(key, SimpleNamespace(name="files/old"))
+    files.get_errors = 2
+
+    info = upload_file_and_wait_active(client, video)
+
+    assert info.name == "files/new1"
+    # One retry for the cached file, then the fresh upload's poll.
+    assert files.gets == 3 and files.uploads == 1
+    assert sleeps[:1] == [gemini_client._DEFAULT_BASE_BACKOFF_SECONDS]
+    assert cache.get(key)["name"] == "files/new1"
+
+
+def test_cached_upload_probe_stops_on_cancel(uploads):
+    cache, video, _ = uploads
+    files = FakeFiles(get_errors=10)
+    client = SimpleNamespace(files=files)
+    cache.put(gemini_client._upload_cache_key(client, gemini_client.file_sha256(video)), SimpleNamespace(name="files/old"))
+    cancel = threading.Event()
+    cancel.set()
+
+    with pytest.raises(OperationCancelled):
+        upload_file_and_wait_active(client, video, cancel_event=cancel)
+    assert files.gets == 0 and files.uploads == 0
@@ -0,0 +1,184 @@
+import pytest
+
+from graph_executor import GraphExecutor, apply_overrides
+
+
+CALLS = []
+
+
+class Loader:
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "load"
+
+    def load(self, name):
+        CALLS.append(("Loader", name))
+        return ({"model": name},)
+
+
+class Source:
+    FUNCTION = "run"
+
+    def run(self, value):
+        CALLS.append(("Source", value))
+        return (value,)
+
+
+class Add:
+    FUNCTION = "run"
+
+    def run(self, a, b):
+        CALLS.append(("Add", a, b))
+        return (a + b,)
+
+
+class Apply:
+    FUNCTION = "run"
+
+    def run(self, model, x):
+        CALLS.append(("Apply", x))
+        return (f"{model['model']}({x})",)
+
+
+class Sink:
+    FUNCTION = "run"
+
+    def run(self, value):
+        CALLS.append(("Sink", value))
+        return {"value": value}
+
+
+class Volatile:
+    FUNCTION = "run"
+
+    @classmethod
+    def IS_CHANGED(cls, value):
+        return float("nan")
+
+    def run(self, value):
+        CALLS.append(("Volatile", value))
+        return (value,)
+
+
+class PreviewImage:
+    FUNCTION = "run"
+
+    def run(self, images):
+        CALLS.append(("PreviewImage",))
+        return {}
+
+
+MAPPINGS = {cls.__name__: cls for cls in (Loader, Source, Add, Apply, Sink, Volatile, PreviewImage)}
+
+PROMPT = {
+    "1": {"class_type": "Source", "inputs": {"value": 1}},
+    "2": {"class_type": "Source", "inputs": {"value": 10}},
+    "3": {"class_type": "Add", "inputs": {"a": ["1", 0], "b": ["2", 0]}},
+    "4": {"class_type": "Sink", "inputs": {"value": ["3", 0]}},
+    "5": {"class_type": "PreviewImage", "inputs": {"images": ["3", 0]}},
+}
+
+
+@pytest.fixture(autouse=True)
+def _reset_calls():
+    CALLS.clear()
+
+
+def test_first_run_executes_required_nodes_and_skips_previews():
+    executor = GraphExecutor(MAPPINGS)
+    results = executor.run(PROMPT)
+    assert results["4"] == {"value": 11}
+    assert ("PreviewImage",) not in CALLS
+    assert executor.stats()["executed"] == 4
+
+
+def test_unchanged_rerun_only_runs_the_outputs():
+    executor = GraphExecutor(MAPPINGS)
+    executor.run(PROMPT)
+    CALLS.clear()
+    results = executor.run(PROMPT)
+    assert results["4"] == {"value": 11}
+    assert CALLS == [("Sink", 11)]
+    assert executor.stats()["reused"] == 3
+
+
+def test_changed_literal_invalidates_only_downstream():
+    executor = GraphExecutor(MAPPINGS)
+    executor.run(PROMPT)
+    CALLS.clear()
+    results = executor.run(apply_overrides(PROMPT, {("2", "value"): 20}))
+    assert results["4"] == {"value": 21}
+    assert CALLS == [("Source", 20), ("Add", 1, 20), ("Sink", 21)]
+
+
+def test_explicit_outputs_run_only_their_ancestors():
+    executor = GraphExecutor(MAPPINGS)
+    results = executor.run(PROMPT, outputs=["1"])
+    assert list(results) == ["1"]
+    assert CALLS == [("Source", 1)]
+
+
+def test_nan_change_marker_reruns_downstream():
+    prompt = {
+        "1": {"class_type": "Volatile", "inputs": {"value": 2}},
+        "2": {"class_type": "Add", "inputs": {"a": ["1", 0], "b": 3}},
+        "3": {"class_type": "Sink", "inputs": {"value": ["2", 0]}},
+    }
+    executor = GraphExecutor(MAPPINGS)
+    executor.run(prompt)
+    CALLS.clear()
+    executor.run(prompt)
+    assert CALLS == [("Volatile", 2), ("Add", 2, 3), ("Sink", 5)]
+
+
+def test_cycles_and_missing_nodes_are_reported():
+    executor = GraphExecutor(MAPPINGS)
+    with pytest.raises(ValueError):
+        executor.run({"1": {"class_type": "Add", "inputs": {"a": ["1", 0], "b": 1}}}, outputs=["1"])
+    with pytest.raises(KeyError):
+        executor.run({"1": {"class_type": "Sink", "inputs": {"value": ["9", 0]}}})
+
+
+MODEL_PROMPT = {
+    "1": {"class_type": "Loader", "inputs": {"name": "unet"}},
+    "2": {"class_type": "Apply", "inputs": {"model": ["1", 0], "x": "frame"}},
+    "3": {"class_type": "Sink", "inputs": {"value": ["2", 0]}},
+}
+
+
+def test_model_outputs_are_not_kept():
+    executor = GraphExecutor(MAPPINGS)
+    executor.run(MODEL_PROMPT)
+    assert "1" not in executor._cache
+    CALLS.clear()
+    executor.run(MODEL_PROMPT)
+    # The loader runs again (no resolver keeps it), but its fingerprint is
+    # stable, so the node after it is still reused.
+    assert CALLS == [("Loader", "unet"), ("Sink", "unet(frame)")]
+
+
+def test_resolvers_serve_nodes_from_an_external_cache():
+    external = {}
+    seen = []
+
+    def resolve(node_id, kwargs, execute):
+        seen.append((node_id, kwargs))
+        if kwargs["name"] not in external:
+            external[kwargs["name"]] = execute()
+        return external[kwargs["name"]]
+
+    executor = GraphExecutor(MAPPINGS)
+    for _ in range(3):
+        results = executor.run(MODEL_PROMPT, resolvers={"Loader": resolve})
+        assert results["3"] == {"value": "unet(frame)"}
+    assert CALLS.count(("Loader", "unet")) == 1
+    assert seen == [("1", {"name": "unet"})] * 3
+    assert "1" not in executor._cache
+
+
+def test_clear_drops_cached_outputs():
+    executor = GraphExecutor(MAPPINGS)
+    executor.run(PROMPT)
+    executor.clear()
+    CALLS.clear()
+    executor.run(PROMPT)
+    assert len(CALLS) == 4
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+
+from ingest import ContentStore, UploadTooLarge
+
+
+def _files(root, sub):
+    return sorted(name for _, _, names in os.walk(os.path.join(root, sub)) for name in names)
+
+
+def test_ingest_hashes_while_writing(tmp_path):
+    store = ContentStore(str(tmp_path))
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    with store.ingest(io.BytesIO(data), ".MP4") as stored:
+        assert stored.sha256 == hashlib.sha256(data).hexdigest()
+        assert stored.size == len(data)
+        assert not stored.duplicate
+        assert stored.path.endswith(".mp4")
+        with open(stored.path, "rb") as f:
+            assert f.read() == data
+
+
+def test_duplicate_content_is_stored_once(tmp_path):
+    store = ContentStore(str(tmp_path))
+    first = store.ingest(io.BytesIO(b"same bytes"), ".mp4")
+    second = store.ingest(io.BytesIO(b"same bytes"), ".mp4")
+    assert second.duplicate
+    assert second.sha256 == first.sha256
+    assert first.path != second.path
+    assert len(_files(str(tmp_path), "objects")) == 1
+    assert store.stats()["duplicates"] == 1
+
+    # Each reference stays readable after the other is released.
+    first.release()
+    with open(second.path, "rb") as f:
+        assert f.read() == b"same bytes"
+    second.release()
+
+
+def test_last_release_deletes_the_object(tmp_path):
+    store = ContentStore(str(tmp_path), max_bytes=0)
+    first = store.ingest(io.BytesIO(b"a"), ".png")
+    second = store.ingest(io.BytesIO(b"a"), ".png")
+    first.release()
+    first.release()  # releasing twice is harmless
+    assert len(_files(str(tmp_path), "objects")) == 1
+    second.release()
+    for sub in ("incoming", "objects", "refs"):
+        assert _files(str(tmp_path), sub) == []
+
+
+def test_retention_keeps_unreferenced_objects_up_to_budget(tmp_path):
+    store = ContentStore(str(tmp_path), max_bytes=15)
+    old = store.ingest(io.BytesIO(b"0123456789"), ".bin")
+    old_object = os.path.join(str(tmp_path), "objects", old.sha256[:2], old.sha256 + ".bin")
+    old.release()
+    os.utime(old_object, (1, 1))
+    store.ingest(io.BytesIO(b"abcdefghij"), ".bin").release()
+    # Only the most recent object fits the budget.
+    assert not os.path.exists(old_object)
+    assert len(_files(str(tmp_path), "objects")) == 1
+    again = store.ingest(io.BytesIO(b"abcdefghij"), ".bin")
+    assert again.duplicate
+    again.release()
+
+
+def test_referenced_objects_are_never_trimmed(tmp_path):
+    store = ContentStore(str(tmp_path), max_bytes=1)
+    held = store.ingest(io.BytesIO(b"held content"), ".bin")
+    store.ingest(io.BytesIO(b"other"), ".bin").release()
+    store.trim()
+    with open(held.path, "rb") as f:
+        assert f.read() == b"held content"
+    held.release()
+
+
+def test_too_large_upload_leaves_nothing_behind(tmp_path):
+    store = ContentStore(str(tmp_path))
+    with pytest.raises(UploadTooLarge):
+        store.ingest(io.BytesIO(b"x" * 100), ".mp4", max_bytes=10)
+    for sub in ("incoming", "objects", "refs"):
+        assert _files(str(tmp_path), sub) == []
+
+
+def test_suffix_is_sanitized(tmp_path):
+    store = ContentStore(str(tmp_path))
+    with store.ingest(io.BytesIO(b"x"), "/../../evil") as stored:
+        assert os.path.dirname(stored.path) == os.path.join(str(tmp_path), "refs")
+        assert "." not in os.path.basename(stored.path)
+
+
+def test_concurrent_identical_uploads(tmp_path):
+    store = ContentStore(str(tmp_path))
+    data = os.urandom(256 * 1024)
+    results = []
+    barrier = threading.Barrier(8)
+
+    def upload():
+        barrier.wait()
+        results.append(store.ingest(io.BytesIO(data), ".mp4"))
+
+    threads = [threading.Thread(target=upload) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({r.path for r in results}) == 8
+    assert len(_files(str(tmp_path), "objects")) == 1
+    for r in results:
+        with open(r.path, "rb") as f:
+            assert f.read() == data
+        r.release()
+    for sub in ("incoming", "objects", "refs"):
+        assert _files(str(tmp_path), sub) == []
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+import pipeline
+from gemini_client import OperationCancelled
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "make_video_client", lambda: object())
+    video = tmp_path / "clip.mp4"
+    image = tmp_path / "ref.png"
+    video.write_bytes(b"video")
+    image.write_bytes(b"image")
+    return str(video), str(image)
+
+
+def _slow_describe(seen):
+    def describe(image_path, cancel_event=None):
+        # Stands in for a description stuck in its retry backoff.
+        if cancel_event.wait(10):
+            seen.append("cancelled")
+            raise OperationCancelled("Cancelled by caller")
+        return "a can"
+
+    return describe
+
+
+def test_failed_upload_does_not_wait_for_the_description(media, monkeypatch):
+    video, image = media
+    seen = []
+    monkeypatch.setattr(pipeline, "describe_target_from_image", _slow_describe(seen))
+
+    def upload(*args, **kwargs):
+        raise TimeoutError("not ACTIVE")
+
+    monkeypatch.setattr(pipeline, "upload_file_and_wait_active", upload)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pipeline.analyze_video(video, image)
+    assert time.monotonic() - started < 2
+    deadline = time.monotonic() + 2
+    while not seen and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert seen == ["cancelled"]
+
+
+def test_request_cancel_reaches_the_description(media, monkeypatch):
+    video, image = media
+    seen = []
+    cancel = threading.Event()
+    monkeypatch.setattr(pipeline, "describe_target_from_image", _slow_describe(seen))
+
+    def upload(*args, **kwargs):
+        cancel.set()
+        return object()
+
+    monkeypatch.setattr(pipeline, "upload_file_and_wait_active", upload)
+
+    with pytest.raises(OperationCancelled):
+        pipeline.analyze_video(video, image, cancel_event=cancel)
+    assert seen == ["cancelled"]
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, RateLimitTimeout
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", fake)
+    return fake
+
+
+def test_request_bucket_empties_and_reports_retry_after(clock):
+    limiter = RateLimiter(rpm=2, tpm=0, max_wait_seconds=0)
+    limiter.acquire("m:k")
+    limiter.acquire("m:k")
+    with pytest.raises(RateLimitTimeout) as exc:
+        limiter.acquire("m:k")
+    # One request refills every 60 / rpm seconds.
+    assert exc.value.retry_after == pytest.approx(30.0)
+
+
+def test_acquire_waits_for_refill(clock):
+    limiter = RateLimiter(rpm=60, tpm=0, max_wait_seconds=5)
+    for _ in range(60):
+        assert limiter.acquire("m:k") == 0
+    assert limiter.acquire("m:k") == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = RateLimiter(rpm=1, tpm=0, max_wait_seconds=0)
+    limiter.acquire("m:a")
+    limiter.acquire("m:b")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("m:a")
+
+
+def test_token_bucket_and_adjust(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000, max_wait_seconds=0)
+    limiter.acquire("m:k", tokens=800)
+    with pytest.raises(RateLimitTimeout) as exc:
+        limiter.acquire("m:k", tokens=400)
+    assert exc.value.retry_after == pytest.approx(200 * 60 / 1000)
+
+    # The call really used 300 tokens fewer than reserved.
+    limiter.adjust("m:k", -300)
+    limiter.acquire("m:k", tokens=400)
+
+
+def test_oversized_call_only_waits_for_a_full_bucket(clock):
+    limiter = RateLimiter(rpm=0, tpm=100, max_wait_seconds=0)
+    limiter.acquire("m:k", tokens=5000)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("m:k", tokens=1)
+
+
+def test_drain_blocks_other_callers(clock):
+    limiter = RateLimiter(rpm=60, tpm=0, max_wait_seconds=0)
+    limiter.drain("m:k")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("m:k")
+
+
+def test_zero_limits_disable_the_limiter(clock):
+    limiter = RateLimiter(rpm=0, tpm=0, max_wait_seconds=0)
+    for _ in range(1000):
+        assert limiter.acquire("m:k", tokens=10 ** 9) == 0
+
+
+def test_cancel_event_stops_the_wait(clock):
+    limiter = RateLimiter(rpm=1, tpm=0, max_wait_seconds=120)
+    limiter.acquire("m:k")
+    cancelled = threading.Event()
+    cancelled.set()
+    limiter.acquire("m:k", cancel_event=cancelled)
+    assert clock.sleeps == []
+
+
+@pytest.mark.skipif(rate_limiter.fcntl is None, reason="needs flock")
+def test_state_file_is_shared_between_limiters(clock, tmp_path):
+    path = str(tmp_path / "state.json")
+    first = RateLimiter(rpm=1, tpm=0, max_wait_seconds=0, state_path=path)
+    second = RateLimiter(rpm=1, tpm=0, max_wait_seconds=0, state_path=path)
+    first.acquire("m:k")
+    with pytest.raises(RateLimitTimeout):
+        second.acquire("m:k")
@@ -0,0 +1,57 @@
+import enum
+import sys
+import types
+
+import pytest
+import torch
+
+import video_script
+from model_residency import MODELS
+
+SIZES = {"custom_width11": 96, "custom_height12": 96, "width24": 96, "height25": 96, "steps31": 1}
+
+
+class CPUState(enum.Enum):
+    GPU = 0
+    CPU = 1
+
+
+@pytest.fixture
+def comfy_device(monkeypatch):
+    """Stand-ins for the ComfyUI modules the CPU profile switches."""
+    cli_args = types.ModuleType("comfy.cli_args")
+    cli_args.args = types.SimpleNamespace(cpu=False)
+    model_management = types.ModuleType("comfy.model_management")
+    model_management.CPUState = CPUState
+    model_management.cpu_state = CPUState.GPU
+    model_management.get_torch_device = lambda: "cpu" if model_management.cpu_state is CPUState.CPU else "cuda:0"
+    comfy = types.ModuleType("comfy")
+    comfy.cli_args, comfy.model_management = cli_args, model_management
+    monkeypatch.setitem(sys.modules, "comfy", comfy)
+    monkeypatch.setitem(sys.modules, "comfy.cli_args", cli_args)
+    monkeypatch.setitem(sys.modules, "comfy.model_management", model_management)
+    return cli_args.args, model_management
+
+
+def test_cpu_profile_only_applies_to_its_own_run(fake_comfy, comfy_device, monkeypatch):
+    video, image = fake_comfy
+    cli_args, model_management = comfy_device
+    threads = torch.get_num_threads()
+    monkeypatch.setenv("CPU_PROFILE_THREADS", str(threads + 1))
+    MODELS.clear()
+
+    video_script.run_video_workflow(video, "x", image, profile="cpu", additional_overrides=SIZES)
+    assert video_script.last_effective_config["device"] == "cpu"
+    assert video_script.last_effective_config["intra_op_threads"] == threads + 1
+    assert model_management.cpu_state is CPUState.GPU
+    assert cli_args.cpu is False
+    assert torch.get_num_threads() == threads
+
+    video_script.run_video_workflow(video, "x", image, additional_overrides=SIZES)
+    assert video_script.last_effective_config["device"] == "cuda:0"
+    assert video_script.last_effective_config["intra_op_threads"] == threads
+
+    # Models loaded for one device are not handed to a run on the other.
+    entries = MODELS.stats()["entries"]
+    for kind in ("'unet'", "'clip'", "'vae'"):
+        assert sum(kind in entry and "'lora'" not in entry for entry in entries) == 2
@@ -0,0 +1,89 @@
+import pytest
+import torch
+
+import video_script
+from video_script import _fit_wan_range, _mask_ranges, _plan_windows, _wan_length
+
+
+def _mask(total, active):
+    mask = torch.zeros(total, 4, 4)
+    for start, end in active:
+        mask[start:end] = 1
+    return mask
+
+
+def _is_wan(length):
+    return (length - 1) % 4 == 0
+
+
+def test_wan_length():
+    assert [_wan_length(n) for n in (1, 4, 5, 8, 9, 40, 41)] == [1, 1, 5, 5, 9, 37, 41]
+
+
+def test_fit_wan_range_grows_to_4n_plus_1():
+    assert _fit_wan_range(10, 20, 100) == (10, 23)
+    # Near the end the range is shifted back instead of cut.
+    assert _fit_wan_range(90, 100, 100) == (87, 100)
+
+
+def test_fit_wan_range_is_capped_by_short_clips():
+    # 40 frames hold at most a 37-frame Wan range; callers cover the rest.
+    assert _fit_wan_range(0, 40, 40) == (0, 37)
+
+
+@pytest.mark.parametrize("total, size, overlap", [(10, 17, 0), (41, 17, 4), (100, 41, 0), (100, 41, 8)])
+def test_plan_windows_cover_the_clip(total, size, overlap):
+    windows = _plan_windows(total, size, overlap)
+    assert windows[0][0] == 0 and windows[-1][1] == total
+    for (_, prev_end), (start, _) in zip(windows, windows[1:]):
+        assert start <= prev_end
+    if total > size:
+        assert all(end - start == size for start, end in windows)
+
+
+def test_mask_ranges_empty_mask():
+    assert _mask_ranges(_mask(50, []), 50) == []
+
+
+@pytest.mark.parametrize(
+    "total, active",
+    [(100, [(30, 35)]), (100, [(0, 3), (90, 100)]), (40, [(0, 40)]), (42, [(38, 42)]), (100, [(10, 20), (25, 30)])],
+)
+def test_mask_ranges_cover_every_masked_frame(total, active):
+    ranges = _mask_ranges(_mask(total, active), total)
+    covered = set()
+    for start, end in ranges:
+        assert 0 <= start < end <= total
+        # 4n+1 unless the end of the clip cuts the range short.
+        assert _is_wan(end - start) or end == total
+        covered.update(range(start, end))
+    for start, end in active:
+        assert set(range(start, end)) <= covered
+    for (_, prev_end), (start, _) in zip(ranges, ranges[1:]):
+        assert prev_end <= start
+
+
+def test_mask_ranges_split_without_overlap():
+    mask = _mask(100, [(5, 98)])
+    assert _mask_ranges(mask, 100) == [(3, 100)]
+    assert _mask_ranges(mask, 100, 41) == [(3, 44), (44, 85), (85, 100)]
+
+
+def _frames_and_size(path):
+    import av
+
+    with av.open(path) as container:
+        frames = [frame for frame in container.decode(video=0)]
+    return len(frames), {(frame.height, frame.width) for frame in frames}
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"window_size": 41}, {"window_size": 17, "window_overlap": 4}, {"intervals": [(1.5, 1.9)]}],
+)
+def test_windowed_output_keeps_every_frame_at_output_size(fake_comfy, options):
+    video, image = fake_comfy
+    sizes = {"custom_width11": 96, "custom_height12": 96, "width24": 128, "height25": 128, "steps31": 1}
+    paths = video_script.run_video_workflow(video, "x", image, additional_overrides=sizes, **options)
+    # Windows without a mask are written at the generated size too.
+    assert [_frames_and_size(path) for path in paths] == [(40, {(128, 128)})]
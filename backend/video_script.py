@@ -2,11 +2,21 @@ import os
 import random
 import sys
 import json
+import math
+import re
+import threading
+from types import SimpleNamespace
 import argparse
 import contextlib
-from typing import Sequence, Mapping, Any, Union, Optional, Dict, List
+from typing import Sequence, Mapping, Any, Callable, Union, Optional, Dict, List
 import torch
 
+from conditioning_cache import CONDITIONING
+from detection.metrics import span
+from graph_executor import GraphExecutor, apply_overrides
+from mask_cache import MASKS, file_digest
+from model_residency import MODELS
+
 
 def get_value_at_index(obj: Union[Sequence, Mapping], index: int) -> Any:
     """Returns the value at the given index of a sequence or mapping.
@@ -504,6 +514,46 @@ parser.add_argument(
     help="How many times the workflow will be executed (default: 1)",
 )
 
+parser.add_argument(
+    "--window-size",
+    type=int,
+    default=0,
+    help="Process the whole input in overlapping windows of this many frames (rounded down to 4n+1; 0 disables windowing)",
+)
+
+parser.add_argument(
+    "--window-overlap",
+    type=int,
+    default=8,
+    help="Frames shared by consecutive windows and cross-faded at the seams (default: 8)",
+)
+
+parser.add_argument(
+    "--profile",
+    default=os.getenv("VIDEO_PROFILE") or None,
+    choices=["cpu"],
+    help="Named execution profile; 'cpu' runs on CPU with a small, fast configuration (default: $VIDEO_PROFILE)",
+)
+
+parser.add_argument(
+    "--decode-budget-mb",
+    type=int,
+    default=int(os.getenv("VAE_DECODE_BUDGET_MB", "0")),
+    help="Decode latents in temporal/spatial tiles sized for this much working memory and stream them to the encoder (0: one decode per range)",
+)
+
+parser.add_argument(
+    "--roi",
+    action="store_true",
+    help="Generate only a crop around the masked object (stable over each frame range) and paste it back",
+)
+
+parser.add_argument(
+    "--intervals",
+    default=None,
+    help="Only generate these time ranges, e.g. 1.5-3,7-9.25 (seconds); the rest of the clip is copied through",
+)
+
 parser.add_argument(
     "--comfyui-directory",
     "-c",
@@ -534,6 +584,8 @@ if __name__ == "__main__" and "--" in sys.argv:
 args = None
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.profile == "cpu" and "--cpu" not in comfy_args:
+        comfy_args.append("--cpu")
     sys.argv = comfy_args
 if args is not None and args.output is not None and args.output == "-":
     ctx = contextlib.redirect_stdout(sys.stderr)
@@ -592,6 +644,7 @@ def import_custom_nodes() -> None:
     loop.run_until_complete(inner())
 
 
+_workflow_lock = threading.Lock()
 _custom_nodes_imported = False
 _custom_path_added = False
 _output_directory_set = False
@@ -680,15 +733,873 @@ def _extract_video_results(savevideo_result):
     return outputs
 
 
+def _wan_length(frames: int) -> int:
+    """Largest valid WanVaceToVideo length (4n+1) that fits in ``frames``."""
+    return max(1, ((frames - 1) // 4) * 4 + 1)
+
+
+def _loaded_frame_total(video_info: Mapping, skip_first_frames: int, select_every_nth: int, force_rate: float) -> int:
+    """Number of frames VHS_LoadVideo yields for the whole clip with these settings."""
+    if force_rate:
+        source_frames = int(float(video_info["source_duration"]) * float(force_rate))
+    else:
+        source_frames = int(video_info["source_frame_count"])
+    remaining = max(0, source_frames - skip_first_frames)
+    return -(-remaining // max(1, select_every_nth))
+
+
+def _plan_windows(total: int, size: int, overlap: int) -> List[tuple]:
+    """Split ``total`` frames into [start, end) windows of ``size`` sharing ``overlap`` frames.
+
+    The last window is aligned to the end of the clip so every window is full
+    length (WanVace and the "Wan" load format both want 4n+1 frames).
+    """
+    if total <= size:
+        return [(0, total)]
+    overlap = max(0, min(overlap, size - 1))
+    stride = size - overlap
+    windows = []
+    start = 0
+    while start + size < total:
+        windows.append((start, start + size))
+        start += stride
+    windows.append((total - size, total))
+    return windows
+
+
+def _crossfade(tail: torch.Tensor, head: torch.Tensor) -> torch.Tensor:
+    """Linear blend from the previous window's ``tail`` into the next window's ``head``."""
+    count = tail.shape[0]
+    weights = torch.arange(1, count + 1, dtype=tail.dtype, device=tail.device) / (count + 1)
+    weights = weights.view(-1, *([1] * (tail.dim() - 1)))
+    return tail * (1 - weights) + head.to(tail.device, tail.dtype) * weights
+
+
+class _VideoStreamWriter:
+    """Encodes frames to an mp4 as they arrive so the whole clip never sits in memory."""
+
+    def __init__(self, filename_prefix: str, fps: float) -> None:
+        import av
+        from fractions import Fraction
+
+        self.path = _next_output_path(filename_prefix)
+        self._container = av.open(self.path, mode="w")
+        self._stream = self._container.add_stream("libx264", rate=Fraction(float(fps)).limit_denominator(1001))
+        self._stream.pix_fmt = "yuv420p"
+        self._av = av
+        self._opened = False
+
+    def write(self, images: torch.Tensor) -> None:
+        if images.shape[0] == 0:
+            return
+        if not self._opened:
+            # yuv420p needs even dimensions.
+            self._stream.height = images.shape[1] - images.shape[1] % 2
+            self._stream.width = images.shape[2] - images.shape[2] % 2
+            self._opened = True
+        frames = images[:, : self._stream.height, : self._stream.width, :3]
+        frames = (frames.clamp(0, 1) * 255).round().to(torch.uint8).cpu().numpy()
+        for frame in frames:
+            video_frame = self._av.VideoFrame.from_ndarray(frame, format="rgb24")
+            for packet in self._stream.encode(video_frame):
+                self._container.mux(packet)
+
+    def close(self) -> str:
+        for packet in self._stream.encode(None):
+            self._container.mux(packet)
+        self._container.close()
+        return self.path
+
+
+def _next_output_path(filename_prefix: str) -> str:
+    output_dir = _get_output_directory()
+    subfolder, prefix = os.path.split(filename_prefix)
+    folder = os.path.join(output_dir, subfolder)
+    os.makedirs(folder, exist_ok=True)
+    counter = 1
+    while True:
+        candidate = os.path.join(folder, f"{prefix}_{counter:05}_.mp4")
+        # Reserve the name right away; the encoder only creates the file on
+        # its first write, and several writers may be open at once.
+        try:
+            with open(candidate, "x"):
+                pass
+        except FileExistsError:
+            counter += 1
+            continue
+        return candidate
+
+
+def _load_frames(workflow, skip_first_frames: int, frame_load_cap: int):
+    return workflow.vhs_loadvideo.load_video(
+        video=parse_arg(args.video9),
+        force_rate=parse_arg(args.force_rate10),
+        custom_width=parse_arg(args.custom_width11),
+        custom_height=parse_arg(args.custom_height12),
+        frame_load_cap=frame_load_cap,
+        skip_first_frames=skip_first_frames,
+        select_every_nth=parse_arg(args.select_every_nth15),
+        format="Wan",
+    )
+
+
+def _sam3_cache_key(frames: torch.Tensor, load: Mapping, segment: Mapping) -> Optional[tuple]:
+    """Everything that determines SAM3's output for these frames, or None if the video isn't a local file.
+
+    ``load`` and ``segment`` are the VHS_LoadVideo and SAM3Segmentation inputs.
+    """
+    video = load["video"]
+    if not isinstance(video, str) or not os.path.isfile(video):
+        return None
+    return (
+        "sam3",
+        file_digest(video),
+        load["force_rate"],
+        load["custom_width"],
+        load["custom_height"],
+        int(load["skip_first_frames"]),
+        int(load["frame_load_cap"] or 0),
+        load["select_every_nth"],
+        tuple(frames.shape),
+        segment["prompt"],
+        segment["threshold"],
+        segment["min_width_pixels"],
+        segment["min_height_pixels"],
+        segment["use_video_model"],
+    )
+
+
+def _mask_cache_key(frames: torch.Tensor, skip_first_frames: int, frame_load_cap: int) -> Optional[tuple]:
+    return _sam3_cache_key(
+        frames,
+        {
+            "video": parse_arg(args.video9),
+            "force_rate": parse_arg(args.force_rate10),
+            "custom_width": parse_arg(args.custom_width11),
+            "custom_height": parse_arg(args.custom_height12),
+            "skip_first_frames": skip_first_frames,
+            "frame_load_cap": frame_load_cap,
+            "select_every_nth": parse_arg(args.select_every_nth15),
+        },
+        {
+            "prompt": parse_arg(args.prompt18),
+            "threshold": parse_arg(args.threshold19),
+            "min_width_pixels": parse_arg(args.min_width_pixels20),
+            "min_height_pixels": parse_arg(args.min_height_pixels21),
+            "use_video_model": parse_arg(args.use_video_model22),
+        },
+    )
+
+
+def _segment_frames(
+    workflow, frames: torch.Tensor, unload_after_run: bool, skip_first_frames: int, frame_load_cap: int
+) -> torch.Tensor:
+    """SAM3 mask for ``frames``, served from the mask cache when the same clip was segmented before."""
+
+    def segment() -> torch.Tensor:
+        sam3segmentation_28 = workflow.sam3segmentation.segment(
+            prompt=parse_arg(args.prompt18),
+            threshold=parse_arg(args.threshold19),
+            min_width_pixels=parse_arg(args.min_width_pixels20),
+            min_height_pixels=parse_arg(args.min_height_pixels21),
+            use_video_model=parse_arg(args.use_video_model22),
+            unload_after_run=unload_after_run,
+            object_ids="",
+            image=frames,
+        )
+        return get_value_at_index(sam3segmentation_28, 2)
+
+    key = _mask_cache_key(frames, skip_first_frames, frame_load_cap)
+    if key is None:
+        return segment()
+    return MASKS.get_or_segment(key, segment)
+
+
+def _mask_weights(mask: torch.Tensor, height: int, width: int, dtype: torch.dtype) -> torch.Tensor:
+    """Mask as a [frames, H, W, 1] blend weight at the given size (bilinear, like the composite node)."""
+    weights = mask.reshape(-1, 1, mask.shape[-2], mask.shape[-1]).to(dtype)
+    if weights.shape[-2] != height or weights.shape[-1] != width:
+        weights = torch.nn.functional.interpolate(weights, size=(height, width), mode="bilinear")
+    return weights.movedim(1, -1)
+
+
+def _composite_control(frames: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    """Fused MaskToImage + InvertMask + ImageCompositeFromMaskBatch+ for the control video.
+
+    The node chain computes ``(1 - m) * frames + m * m`` (the masked region
+    painted with the mask image); ``lerp(frames, m, m)`` is the same blend in a
+    single pass into one output buffer.
+    """
+    weights = _mask_weights(mask[: frames.shape[0]], frames.shape[1], frames.shape[2], frames.dtype)
+    control = torch.empty_like(frames)
+    torch.lerp(frames, weights, weights.to(frames.device), out=control)
+    return control
+
+
+def _paste_back(frames: torch.Tensor, images: torch.Tensor, mask: torch.Tensor, out: torch.Tensor) -> None:
+    """Fused final composite: generated ``images`` inside the mask, ``frames`` outside, written into ``out``."""
+    count, height, width = out.shape[0], out.shape[1], out.shape[2]
+    images = _resize_frames(images[:count], height, width).to(out.device, out.dtype)
+    if images.shape[0] < count:
+        # Same as the node: a short decode is padded with its last frame.
+        images = torch.cat((images, images[-1:].expand(count - images.shape[0], -1, -1, -1)))
+    base = _resize_frames(frames[:count], height, width).to(out.device, out.dtype)
+    weights = _mask_weights(mask[:count], height, width, out.dtype).to(out.device)
+    torch.lerp(base, images, weights, out=out)
+
+
+# ROI mode: margin around the object (fraction of its size), the smallest
+# side generated (tiny crops lose too much context), and the share of the
+# frame above which cropping isn't worth it.
+_ROI_MARGIN = 0.15
+_ROI_MIN_SIDE = 256
+_ROI_MAX_AREA = 0.5
+
+
+def _output_size() -> tuple:
+    """(height, width) of generated frames: the WanVace size, which the VAE works in multiples of 8."""
+    return int(parse_arg(args.height25)) // 8 * 8, int(parse_arg(args.width24)) // 8 * 8
+
+
+def _roi_box(mask: torch.Tensor) -> Optional[tuple]:
+    """Crop (y0, y1, x0, x1) in output pixels around the union of the mask over all frames.
+
+    Using the union keeps the crop fixed for the whole range, so the object
+    does not jitter against the background. Sides are multiples of 16 as
+    WanVace requires. Returns None when the crop would not save much.
+    """
+    out_h, out_w = _output_size()
+    active = (mask > 0).reshape(-1, mask.shape[-2], mask.shape[-1]).any(dim=0)
+    rows = torch.nonzero(active.any(dim=1)).flatten()
+    cols = torch.nonzero(active.any(dim=0)).flatten()
+    if rows.numel() == 0:
+        return None
+
+    scale_y, scale_x = out_h / mask.shape[-2], out_w / mask.shape[-1]
+    y0, y1 = rows[0].item() * scale_y, (rows[-1].item() + 1) * scale_y
+    x0, x1 = cols[0].item() * scale_x, (cols[-1].item() + 1) * scale_x
+
+    def side(low: float, high: float, limit: int) -> tuple:
+        size = (high - low) * (1 + 2 * _ROI_MARGIN)
+        size = min(limit // 16 * 16, max(_ROI_MIN_SIDE, int(math.ceil(size / 16)) * 16))
+        start = int(round((low + high) / 2 - size / 2))
+        start = max(0, min(start, limit - size))
+        return start, start + size
+
+    y0, y1 = side(y0, y1, out_h)
+    x0, x1 = side(x0, x1, out_w)
+    if (y1 - y0) * (x1 - x0) > _ROI_MAX_AREA * out_h * out_w:
+        return None
+    return y0, y1, x0, x1
+
+
+def _crop(tensor: torch.Tensor, box: tuple) -> torch.Tensor:
+    """Crop a [frames, H, W, ...] tensor to ``box`` given in output pixels."""
+    out_h, out_w = _output_size()
+    height, width = tensor.shape[1], tensor.shape[2]
+    y0, y1, x0, x1 = box
+    return tensor[
+        :,
+        int(round(y0 * height / out_h)) : int(round(y1 * height / out_h)),
+        int(round(x0 * width / out_w)) : int(round(x1 * width / out_w)),
+    ]
+
+
+def _prepare_range(workflow, frames: torch.Tensor, mask: torch.Tensor) -> SimpleNamespace:
+    """Seed-independent half of generation: control composite and WanVace conditioning.
+
+    In ROI mode only a crop around the object is generated; ``box`` is where it
+    goes in the output frame.
+    """
+    out_h, out_w = _output_size()
+    count = frames.shape[0]
+    length = _wan_length(count + 3)
+    if length > count:
+        # Ranges cut short by the end of the clip (or by max_length) aren't
+        # 4n+1 long; pad them with their last frame, the extra output frames
+        # are never composited.
+        frames = torch.cat((frames, frames[-1:].expand(length - count, *frames.shape[1:])))
+        mask = torch.cat((mask, mask[-1:].expand(length - count, *mask.shape[1:])))
+    box = _roi_box(mask) if args.roi else None
+    if box is None:
+        box = (0, out_h, 0, out_w)
+    else:
+        frames, mask = _crop(frames, box), _crop(mask, box)
+
+    wanvacetovideo_25 = workflow.wanvacetovideo.EXECUTE_NORMALIZED(
+        width=box[3] - box[2],
+        height=box[1] - box[0],
+        length=length,
+        batch_size=parse_arg(args.batch_size27),
+        strength=parse_arg(args.strength28),
+        positive=workflow.positive,
+        negative=workflow.negative,
+        vae=workflow.vae,
+        control_video=_composite_control(frames, mask),
+        reference_image=workflow.reference_image,
+    )
+    return SimpleNamespace(mask=mask, box=box, wanvacetovideo=wanvacetovideo_25)
+
+
+def _sample_range(workflow, prepared: SimpleNamespace, seed: int) -> Any:
+    """KSampler -> TrimVideoLatent for one seed; returns the latent to decode."""
+    wanvacetovideo_25 = prepared.wanvacetovideo
+    ksampler_29 = workflow.ksampler.sample(
+        seed=seed,
+        steps=parse_arg(args.steps31),
+        cfg=parse_arg(args.cfg32),
+        sampler_name=parse_arg(args.sampler_name33),
+        scheduler=parse_arg(args.scheduler34),
+        denoise=parse_arg(args.denoise35),
+        model=workflow.model,
+        positive=get_value_at_index(wanvacetovideo_25, 0),
+        negative=get_value_at_index(wanvacetovideo_25, 1),
+        latent_image=get_value_at_index(wanvacetovideo_25, 2),
+    )
+
+    trimvideolatent_1 = workflow.trimvideolatent.EXECUTE_NORMALIZED(
+        trim_amount=get_value_at_index(wanvacetovideo_25, 3),
+        samples=get_value_at_index(ksampler_29, 0),
+    )
+    return get_value_at_index(trimvideolatent_1, 0)
+
+
+# Rough decoder working set per output pixel (activations across the Wan VAE
+# up-blocks), used to size decode tiles from --decode-budget-mb. Each latent
+# frame after the first decodes to 4 video frames; chunks after the first
+# re-decode a couple of latent frames before them to warm up the causal
+# convolutions and drop their output.
+_DECODE_BYTES_PER_PIXEL = 384
+_DECODE_CONTEXT_LATENTS = 2
+
+
+def _decode_chunks(workflow, samples: Mapping) -> Any:
+    """Yield decoded frame batches for ``samples`` in order.
+
+    Without a decode budget this is a single VAEDecode call. With one, the
+    latent is decoded a few latent frames at a time (and in spatial tiles if
+    even one frame does not fit), so peak memory follows the budget instead
+    of the clip length.
+    """
+    budget = int(args.decode_budget_mb or 0) * 1024 * 1024
+    if budget <= 0:
+        vaedecode_20 = workflow.vaedecode.decode(samples=samples, vae=workflow.vae)
+        yield get_value_at_index(vaedecode_20, 0)
+        return
+
+    latent = samples["samples"]
+    pixels = latent.shape[-2] * 8 * latent.shape[-1] * 8
+    per_latent_frame = 4 * pixels * _DECODE_BYTES_PER_PIXEL
+    chunk = max(1, budget // per_latent_frame)
+    tile = None
+    if per_latent_frame > budget:
+        tile_px = max(128, int(math.sqrt(budget / (4 * _DECODE_BYTES_PER_PIXEL))) // 64 * 64)
+        tile = tile_px // 8
+
+    for start in range(0, latent.shape[2], chunk):
+        end = min(latent.shape[2], start + chunk)
+        context_start = max(0, start - _DECODE_CONTEXT_LATENTS)
+        part = latent[:, :, context_start:end]
+        if tile is not None:
+            images = workflow.vae.decode_tiled(part, tile_x=tile, tile_y=tile, overlap=tile // 4)
+        else:
+            images = workflow.vae.decode(part)
+        images = images.reshape(-1, images.shape[-3], images.shape[-2], images.shape[-1])
+        if context_start < start:
+            images = images[1 + 4 * (start - context_start - 1):]
+        yield images
+
+
+def _variant_seeds(seed: Any, count: int) -> List[int]:
+    """One seed per queue_size variant; the first is the configured seed itself."""
+    return [(int(seed) + offset) % 0x10000000000000000 for offset in range(count)]
+
+
+# Frames kept around each masked span for temporal context, and the largest
+# gap between masked spans that is still generated as one range (every range
+# pays the full WanVace/KSampler setup cost).
+_MASK_RANGE_PADDING = 2
+_MASK_RANGE_MERGE_GAP = 8
+
+
+def _fit_wan_range(start: int, end: int, total: int) -> tuple:
+    """Grow [start, end) to the next 4n+1 length, staying inside [0, total).
+
+    When ``total`` is not 4n+1 itself the result can stop short of ``end``
+    (e.g. ``(0, 40, 40)`` gives ``(0, 37)``); callers cover the remainder.
+    """
+    length = min(_wan_length(end - start + 3), _wan_length(total))
+    end = min(total, start + length)
+    return max(0, end - length), end
+
+
+def _mask_ranges(mask: torch.Tensor, total: int, max_length: Optional[int] = None) -> List[tuple]:
+    """[start, end) frame ranges covering every frame with a non-empty mask.
+
+    Ranges are 4n+1 long except where the end of the clip, or splitting at
+    ``max_length``, cuts them short.
+    """
+    active = (mask[:total].reshape(min(total, mask.shape[0]), -1) > 0).any(dim=1).tolist()
+    spans: List[List[int]] = []
+    for index, is_active in enumerate(active):
+        if not is_active:
+            continue
+        if spans and index - spans[-1][1] <= _MASK_RANGE_MERGE_GAP:
+            spans[-1][1] = index + 1
+        else:
+            spans.append([index, index + 1])
+
+    def fit(start: int, end: int) -> tuple:
+        # Keep the last frames of a clip that is not 4n+1 long; _prepare_range
+        # pads such a range.
+        fitted_start, fitted_end = _fit_wan_range(start, end, total)
+        return fitted_start, max(fitted_end, end)
+
+    ranges: List[tuple] = []
+    for start, end in spans:
+        start, end = fit(max(0, start - _MASK_RANGE_PADDING), min(total, end + _MASK_RANGE_PADDING))
+        # Growing a range can make it overlap the previous one; merge and refit.
+        while ranges and start <= ranges[-1][1]:
+            start, end = fit(ranges.pop()[0], max(end, start))
+        ranges.append((start, end))
+
+    if not max_length:
+        return ranges
+    size = _wan_length(int(max_length))
+    split: List[tuple] = []
+    for start, end in ranges:
+        # The last chunk is shorter rather than overlapping the one before it;
+        # _prepare_range pads it back to 4n+1.
+        split.extend((chunk, min(end, chunk + size)) for chunk in range(start, end, size))
+    return split
+
+
+def _resize_frames(frames: torch.Tensor, height: int, width: int) -> torch.Tensor:
+    if frames.shape[1] == height and frames.shape[2] == width:
+        return frames
+    resized = torch.nn.functional.interpolate(frames.movedim(-1, 1), size=(height, width), mode="bilinear")
+    return resized.movedim(1, -1)
+
+
+def _plan_masked(
+    workflow, frames: torch.Tensor, mask: torch.Tensor, max_length: Optional[int] = None
+) -> List[tuple]:
+    """Prepare every frame range with a non-empty mask: ``[(start, end, prepared), ...]``.
+
+    The plan is seed-independent, so it is built once and sampled for every
+    variant.
+    """
+    total = frames.shape[0]
+    ranges = _mask_ranges(mask, total, max_length)
+    generated = sum(end - start for start, end in ranges)
+    print(f"Generating {generated} of {total} frames in {len(ranges)} masked range(s)")
+    return [
+        (start, end, _prepare_range(workflow, frames[start:end], mask[start:end]))
+        for start, end in ranges
+    ]
+
+
+# Frames handed to the encoder at a time for copied-through stretches.
+_PASSTHROUGH_CHUNK = 16
+
+
+def _render_stream(workflow, frames: torch.Tensor, plan: List[tuple], seed: int, emit: Callable) -> None:
+    """Sample the planned ranges and ``emit`` the output clip in order, a chunk at a time.
+
+    Frames outside the masked ranges are passed through unchanged, which is
+    what the final composite would produce anyway (an empty mask keeps the
+    original pixels). Each decoded chunk is blended into a chunk-sized buffer
+    and emitted right away.
+    """
+    out_h, out_w = _output_size()
+    cursor = 0
+
+    def pass_through(until: int) -> None:
+        nonlocal cursor
+        while cursor < until:
+            end = min(until, cursor + _PASSTHROUGH_CHUNK)
+            emit(_resize_frames(frames[cursor:end], out_h, out_w))
+            cursor = end
+
+    for start, end, prepared in plan:
+        pass_through(start)
+        y0, y1, x0, x1 = prepared.box
+        position = start
+        images = None
+        for images in _decode_chunks(workflow, _sample_range(workflow, prepared, seed)):
+            chunk_end = min(end, position + images.shape[0])
+            if chunk_end > cursor:
+                buffer = _resize_frames(frames[position:chunk_end], out_h, out_w).clone()
+                _paste_back(
+                    _crop(frames[position:chunk_end], prepared.box),
+                    images,
+                    prepared.mask[position - start : chunk_end - start],
+                    buffer[:, y0:y1, x0:x1],
+                )
+                emit(buffer[max(0, cursor - position):])
+                cursor = chunk_end
+            position = chunk_end
+            if position >= end:
+                break
+        while cursor < end and images is not None:
+            # Same as the composite node: a short decode is padded with its last frame.
+            buffer = _resize_frames(frames[cursor:cursor + 1], out_h, out_w).clone()
+            _paste_back(
+                _crop(frames[cursor:cursor + 1], prepared.box),
+                images[-1:],
+                prepared.mask[cursor - start : cursor - start + 1],
+                buffer[:, y0:y1, x0:x1],
+            )
+            emit(buffer)
+            cursor += 1
+    pass_through(frames.shape[0])
+
+
+def _render_masked(workflow, frames: torch.Tensor, plan: List[tuple], seed: int) -> torch.Tensor:
+    """Whole-clip version of ``_render_stream``; always at the output size, masked or not."""
+    out_h, out_w = _output_size()
+    if not plan:
+        # Windows with and without a mask go into the same stream writer,
+        # which fixes its dimensions on the first write.
+        return _resize_frames(frames, out_h, out_w)
+    output = torch.empty((frames.shape[0], out_h, out_w, frames.shape[-1]), dtype=frames.dtype, device=frames.device)
+    position = 0
+
+    def emit(chunk: torch.Tensor) -> None:
+        nonlocal position
+        output[position:position + chunk.shape[0]] = chunk
+        position += chunk.shape[0]
+
+    _render_stream(workflow, frames, plan, seed, emit)
+    return output
+
+
+def _parse_intervals(value: Any) -> List[tuple]:
+    """Accept ``"1.5-3,7-9"`` (CLI) or a list of ``(start, end)`` pairs in seconds."""
+    if isinstance(value, str):
+        value = [part.split("-", 1) for part in value.split(",") if part.strip()]
+    intervals = []
+    for start, end in value:
+        start, end = float(start), float(end)
+        if end < start:
+            start, end = end, start
+        intervals.append((start, end))
+    return intervals
+
+
+def _interval_frames(intervals: List[tuple], video_info: Mapping, total: int) -> List[tuple]:
+    """Map time intervals (seconds) to merged [start, end) indices of the loaded frames."""
+    force_rate = float(parse_arg(args.force_rate10) or 0)
+    base_rate = force_rate or float(video_info["source_fps"])
+    skip_first_frames = int(parse_arg(args.skip_first_frames14))
+    select_every_nth = max(1, int(parse_arg(args.select_every_nth15)))
+
+    ranges: List[List[int]] = []
+    for start_time, end_time in sorted(intervals):
+        start = math.floor((start_time * base_rate - skip_first_frames) / select_every_nth)
+        end = math.ceil((end_time * base_rate - skip_first_frames) / select_every_nth) + 1
+        start, end = max(0, start), min(total, end)
+        if end <= start:
+            continue
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return [tuple(r) for r in ranges]
+
+
+def _timeline_spans(total: int, ranges: Optional[List[tuple]]) -> List[tuple]:
+    """Cover [0, total) with (start, end, generate) spans."""
+    if ranges is None:
+        return [(0, total, True)]
+    spans = []
+    cursor = 0
+    for start, end in ranges:
+        if start > cursor:
+            spans.append((cursor, start, False))
+        spans.append((start, end, True))
+        cursor = end
+    if cursor < total:
+        spans.append((cursor, total, False))
+    return spans
+
+
+def _run_windowed(workflow, seeds: List[int]) -> List[str]:
+    """Render the clip window by window and stream one output per seed to disk.
+
+    Only one window of frames, masks and latents is alive at a time, and the
+    models stay loaded across windows (SAM3 is unloaded after the last one at
+    most). Consecutive windows overlap and are cross-faded at the seams. With
+    ``args.intervals`` only those time ranges are segmented and generated;
+    the frames in between are decoded and copied through. Each window is
+    segmented and prepared once and then sampled for every seed.
+    """
+    size = _wan_length(int(args.window_size or parse_arg(args.length26)))
+    overlap = max(0, int(args.window_overlap))
+    skip_first_frames = int(parse_arg(args.skip_first_frames14))
+    select_every_nth = int(parse_arg(args.select_every_nth15))
+    frame_load_cap = int(parse_arg(args.frame_load_cap13) or 0)
+
+    first = _load_frames(workflow, skip_first_frames, size)
+    video_info = get_value_at_index(first, 3)
+    total = _loaded_frame_total(
+        video_info, skip_first_frames, select_every_nth, parse_arg(args.force_rate10)
+    )
+    if frame_load_cap > 0:
+        total = min(total, frame_load_cap)
+    fps = get_value_at_index(workflow.vhs_videoinfo.get_video_info(video_info=video_info), 5)
+
+    ranges = None
+    if args.intervals:
+        ranges = _interval_frames(_parse_intervals(args.intervals), video_info, total)
+    spans = _timeline_spans(total, ranges)
+    last_generated = max((i for i, span in enumerate(spans) if span[2]), default=-1)
+
+    writers = []
+    try:
+        for _ in seeds:
+            writers.append(_VideoStreamWriter(parse_arg(args.filename_prefix36), fps))
+        for span_index, (span_start, span_end, generate) in enumerate(spans):
+            windows = _plan_windows(span_end - span_start, size, overlap if generate else 0)
+            tails: List[Optional[torch.Tensor]] = [None] * len(seeds)
+            for index, (start, end) in enumerate(windows):
+                start, end = start + span_start, end + span_start
+                # VHS's "Wan" format trims every load to 4n+1 frames, so load a
+                # window of that length covering [start, end) and slice.
+                load_start, load_end = _fit_wan_range(start, end, total)
+                if first is not None and load_start == 0 and load_end == get_value_at_index(first, 1):
+                    loaded = first
+                else:
+                    loaded = _load_frames(
+                        workflow, skip_first_frames + load_start * select_every_nth, load_end - load_start
+                    )
+                first = None
+                frames = get_value_at_index(loaded, 0)
+                while load_end < end:
+                    # A clip that is not 4n+1 long can't be loaded in one
+                    # piece; load the frames it leaves out separately.
+                    tail_start, tail_end = _fit_wan_range(load_end, end, total)
+                    tail = get_value_at_index(
+                        _load_frames(
+                            workflow, skip_first_frames + tail_start * select_every_nth, tail_end - tail_start
+                        ),
+                        0,
+                    )
+                    frames = torch.cat((frames, tail[load_end - tail_start : end - tail_start]))
+                    load_end = min(end, tail_end)
+                is_last = index == len(windows) - 1
+                next_start = windows[index + 1][0] + span_start if not is_last else end
+                keep = end - next_start
+
+                plan = []
+                if generate:
+                    mask = _segment_frames(
+                        workflow,
+                        frames,
+                        unload_after_run=bool(parse_arg(args.unload_after_run23))
+                        and is_last
+                        and span_index == last_generated,
+                        skip_first_frames=skip_first_frames + load_start * select_every_nth,
+                        frame_load_cap=load_end - load_start,
+                    )
+                    plan = _plan_masked(workflow, frames, mask)
+
+                for variant, (seed, writer) in enumerate(zip(seeds, writers)):
+                    output = _render_masked(workflow, frames, plan, seed)
+                    output = output[start - load_start : end - load_start]
+
+                    tail = tails[variant]
+                    if tail is not None:
+                        shared = tail.shape[0]
+                        writer.write(_crossfade(tail, output[:shared]))
+                        output = output[shared:]
+
+                    writer.write(output[: output.shape[0] - keep])
+                    tails[variant] = output[output.shape[0] - keep:] if keep > 0 else None
+    finally:
+        paths = [writer.close() for writer in writers]
+    return paths
+
+
+# Inputs a profile replaces when the caller left them at their defaults.
+# "cpu": no fp8 (CPUs have no fp8 kernels, so weights load in their stored
+# precision), a 320px / 17-frame clip, 2 sampler steps and a bounded decode.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "cpu": {
+        "weight_dtype2": "default",
+        "custom_width11": 320,
+        "custom_height12": 320,
+        "width24": 320,
+        "height25": 320,
+        "frame_load_cap13": 17,
+        "length26": 17,
+        "steps31": 2,
+        "decode_budget_mb": 1024,
+    },
+}
+
+last_effective_config: Dict[str, Any] = {}
+
+
+def _cpu_threads() -> tuple:
+    cpus = os.cpu_count() or 1
+    intra = int(os.getenv("CPU_PROFILE_THREADS", str(cpus)))
+    inter = int(os.getenv("CPU_PROFILE_INTEROP_THREADS", str(max(1, min(4, cpus // 4)))))
+    return max(1, intra), max(1, inter)
+
+
+def _apply_profile(namespace: argparse.Namespace) -> None:
+    """Fill in the profile's values for every input still at its parser default."""
+    profile = PROFILES.get(namespace.profile or "")
+    if not profile:
+        return
+    for name, value in profile.items():
+        if getattr(namespace, name) == parser.get_default(name):
+            setattr(namespace, name, value)
+
+
+def _model_device(profile: Optional[str]) -> str:
+    """Device part of the MODELS keys: weights loaded for one device are never
+    handed to a run on another."""
+    return "cpu" if profile == "cpu" else "default"
+
+
+@contextlib.contextmanager
+def _profile_runtime(namespace: argparse.Namespace):
+    """Apply the profile's process-wide settings (ComfyUI device, torch
+    threads) for one run and put the previous ones back afterwards.
+
+    Inter-op threads can only be set once per process, before any inter-op
+    parallel work, so they follow only the process profile (``--profile`` /
+    ``$VIDEO_PROFILE``), never a per-call ``profile=``.
+    """
+    if namespace.profile != "cpu":
+        yield
+        return
+
+    intra, inter = _cpu_threads()
+    if parser.get_default("profile") == "cpu" or __name__ == "__main__":
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            # Already set, or inter-op work has run in this process.
+            pass
+    previous_threads = torch.get_num_threads()
+    previous_cpu = _force_comfy_cpu()
+    torch.set_num_threads(intra)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous_threads)
+        _restore_comfy_device(previous_cpu)
+
+
+def _force_comfy_cpu() -> Optional[tuple]:
+    """Equivalent of ComfyUI's ``--cpu`` for an already running process.
+
+    Returns the previous ``(args.cpu, cpu_state)`` for ``_restore_comfy_device``.
+    """
+    try:
+        from comfy.cli_args import args as comfy_cli_args
+    except ImportError:
+        return None
+    model_management = sys.modules.get("comfy.model_management")
+    has_state = model_management is not None and hasattr(model_management, "CPUState")
+    previous = (comfy_cli_args.cpu, model_management.cpu_state if has_state else None)
+    comfy_cli_args.cpu = True
+    if has_state:
+        model_management.cpu_state = model_management.CPUState.CPU
+    return previous
+
+
+def _restore_comfy_device(previous: Optional[tuple]) -> None:
+    if previous is None:
+        return
+    from comfy.cli_args import args as comfy_cli_args
+
+    comfy_cli_args.cpu, cpu_state = previous
+    model_management = sys.modules.get("comfy.model_management")
+    if cpu_state is not None and model_management is not None:
+        model_management.cpu_state = cpu_state
+
+
+def _report_effective_config(namespace: argparse.Namespace) -> Dict[str, Any]:
+    global last_effective_config
+    device = "cpu"
+    try:
+        import comfy.model_management
+
+        device = str(comfy.model_management.get_torch_device())
+    except Exception:
+        if torch.cuda.is_available() and namespace.profile != "cpu":
+            device = "cuda"
+    last_effective_config = {
+        "profile": namespace.profile or "default",
+        "device": device,
+        "weight_dtype": parse_arg(namespace.weight_dtype2),
+        "load_size": [parse_arg(namespace.custom_width11), parse_arg(namespace.custom_height12)],
+        "generate_size": [parse_arg(namespace.width24), parse_arg(namespace.height25)],
+        "frame_load_cap": parse_arg(namespace.frame_load_cap13),
+        "length": parse_arg(namespace.length26),
+        "steps": parse_arg(namespace.steps31),
+        "window_size": namespace.window_size,
+        "roi": bool(namespace.roi),
+        "decode_budget_mb": namespace.decode_budget_mb,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    }
+    print(f"Effective workflow config: {json.dumps(last_effective_config)}")
+    return last_effective_config
+
+
+class _TimedNode:
+    """Proxy that records every method call of a node as a ``comfy_node`` span."""
+
+    def __init__(self, node: Any, name: str) -> None:
+        self._node = node
+        self._name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self._node, attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            with span("comfy_node", node=self._name):
+                return value(*args, **kwargs)
+
+        return call
+
+
+def _load_node_class_mappings():
+    """Put ComfyUI on sys.path and load its custom nodes (once per process)."""
+    global _custom_nodes_imported, _custom_path_added
+    with ctx:
+        if not _custom_path_added:
+            add_comfyui_directory_to_sys_path()
+            add_extra_model_paths()
+
+            _custom_path_added = True
+
+        if not _custom_nodes_imported:
+            import_custom_nodes()
+
+            _custom_nodes_imported = True
+
+        from nodes import NODE_CLASS_MAPPINGS
+        ensure_output_directory()
+    return NODE_CLASS_MAPPINGS
+
+
 def main(*func_args, **func_kwargs):
-    global args, _custom_nodes_imported, _custom_path_added
+    global args
     if __name__ == "__main__":
         if args is None:
             args = parser.parse_args()
     else:
         defaults = dict(
             (arg, parser.get_default(arg))
-            for arg in ["queue_size", "comfyui_directory", "output", "disable_metadata"]
+            for arg in ["queue_size", "window_size", "window_overlap", "intervals", "roi", "decode_budget_mb", "profile", "comfyui_directory", "output", "disable_metadata"]
             + [
                 "unet_name1",
                 "weight_dtype2",
@@ -737,59 +1648,91 @@ def main(*func_args, **func_kwargs):
 
         args = argparse.Namespace(**all_args)
 
-    with ctx:
-        if not _custom_path_added:
-            add_comfyui_directory_to_sys_path()
-            add_extra_model_paths()
+    _apply_profile(args)
+    NODE_CLASS_MAPPINGS = _load_node_class_mappings()
+    # The profile's device and thread settings only last for this run.
+    with _profile_runtime(args):
+        return _run_main(NODE_CLASS_MAPPINGS)
 
-            _custom_path_added = True
 
-        if not _custom_nodes_imported:
-            import_custom_nodes()
+def _run_main(NODE_CLASS_MAPPINGS):
+    _report_effective_config(args)
 
-            _custom_nodes_imported = True
-
-        from nodes import NODE_CLASS_MAPPINGS
-        ensure_output_directory()
-
-        def instantiate_node(node_name: str):
-            node_cls = NODE_CLASS_MAPPINGS[node_name]
-            prepare_clone = getattr(node_cls, "PREPARE_CLASS_CLONE", None)
-            if callable(prepare_clone):
-                node_cls = node_cls.PREPARE_CLASS_CLONE(None)
-            return node_cls()
+    def instantiate_node(node_name: str):
+        node_cls = NODE_CLASS_MAPPINGS[node_name]
+        prepare_clone = getattr(node_cls, "PREPARE_CLASS_CLONE", None)
+        if callable(prepare_clone):
+            node_cls = node_cls.PREPARE_CLASS_CLONE(None)
+        return _TimedNode(node_cls(), node_name)
 
     with torch.inference_mode(), ctx:
-        unetloader = instantiate_node("UNETLoader")
-        unetloader_10 = unetloader.load_unet(
-            unet_name=parse_arg(args.unet_name1),
-            weight_dtype=parse_arg(args.weight_dtype2),
+        unet_name = parse_arg(args.unet_name1)
+        weight_dtype = parse_arg(args.weight_dtype2)
+        lora_name = parse_arg(args.lora_name3)
+        strength_model = parse_arg(args.strength_model4)
+        clip_name = parse_arg(args.clip_name5)
+        clip_type = parse_arg(args.type6)
+        vae_name = parse_arg(args.vae_name7)
+
+        device = _model_device(args.profile)
+        unet_key = ("unet", unet_name, weight_dtype, device)
+        lora_key = unet_key + ("lora", lora_name, float(strength_model))
+        clip_key = ("clip", clip_name, clip_type, "default", device)
+        vae_key = ("vae", vae_name, device)
+        request_keys = (unet_key, lora_key, clip_key, vae_key)
+
+        unetloader_10 = MODELS.get_or_load(
+            unet_key,
+            lambda: instantiate_node("UNETLoader").load_unet(
+                unet_name=unet_name,
+                weight_dtype=weight_dtype,
+            ),
+            pinned=request_keys,
         )
 
-        loraloadermodelonly = instantiate_node("LoraLoaderModelOnly")
-        loraloadermodelonly_11 = loraloadermodelonly.load_lora_model_only(
-            lora_name=parse_arg(args.lora_name3),
-            strength_model=parse_arg(args.strength_model4),
-            model=get_value_at_index(unetloader_10, 0),
+        # The LoRA patcher is a clone sharing the UNet weights, so it adds no
+        # resident size of its own but must go away with its parent.
+        loraloadermodelonly_11 = MODELS.get_or_load(
+            lora_key,
+            lambda: instantiate_node("LoraLoaderModelOnly").load_lora_model_only(
+                lora_name=lora_name,
+                strength_model=strength_model,
+                model=get_value_at_index(unetloader_10, 0),
+            ),
+            size_fn=None,
+            parents=(unet_key,),
+            pinned=request_keys,
         )
 
-        cliploader = instantiate_node("CLIPLoader")
-        cliploader_12 = cliploader.load_clip(
-            clip_name=parse_arg(args.clip_name5),
-            type=parse_arg(args.type6),
-            device="default",
+        cliploader_12 = MODELS.get_or_load(
+            clip_key,
+            lambda: instantiate_node("CLIPLoader").load_clip(
+                clip_name=clip_name,
+                type=clip_type,
+                device="default",
+            ),
+            pinned=request_keys,
         )
 
-        vaeloader = instantiate_node("VAELoader")
-        vaeloader_13 = vaeloader.load_vae(vae_name=parse_arg(args.vae_name7))
+        vaeloader_13 = MODELS.get_or_load(
+            vae_key,
+            lambda: instantiate_node("VAELoader").load_vae(vae_name=vae_name),
+            pinned=request_keys,
+        )
 
         cliptextencode = instantiate_node("CLIPTextEncode")
-        cliptextencode_24 = cliptextencode.encode(
-            text=parse_arg(args.text8), clip=get_value_at_index(cliploader_12, 0)
+        positive_text = parse_arg(args.text8)
+        cliptextencode_24 = CONDITIONING.get_or_encode(
+            clip_key,
+            positive_text,
+            lambda: cliptextencode.encode(
+                text=positive_text, clip=get_value_at_index(cliploader_12, 0)
+            ),
         )
 
         vhs_loadvideo = instantiate_node("VHS_LoadVideo")
-        vhs_loadvideo_26 = vhs_loadvideo.load_video(
+        # In windowed/interval mode frames are loaded one window at a time instead.
+        vhs_loadvideo_26 = None if args.window_size or args.intervals else vhs_loadvideo.load_video(
             video=parse_arg(args.video9),
             force_rate=parse_arg(args.force_rate10),
             custom_width=parse_arg(args.custom_width11),
@@ -800,17 +1743,19 @@ def main(*func_args, **func_kwargs):
             format="Wan",
         )
 
-        cliptextencode_30 = cliptextencode.encode(
-            text=parse_arg(args.text16), clip=get_value_at_index(cliploader_12, 0)
+        negative_text = parse_arg(args.text16)
+        cliptextencode_30 = CONDITIONING.get_or_encode(
+            clip_key,
+            negative_text,
+            lambda: cliptextencode.encode(
+                text=negative_text, clip=get_value_at_index(cliploader_12, 0)
+            ),
         )
 
         loadimage = instantiate_node("LoadImage")
         loadimage_32 = loadimage.load_image(image=parse_arg(args.image17))
 
         sam3segmentation = instantiate_node("SAM3Segmentation")
-        masktoimage = instantiate_node("MaskToImage")
-        invertmask = instantiate_node("InvertMask")
-        imagecompositefrommaskbatch = instantiate_node("ImageCompositeFromMaskBatch+")
         wanvacetovideo = instantiate_node("WanVaceToVideo")
         modelsamplingsd3 = instantiate_node("ModelSamplingSD3")
         ksampler = instantiate_node("KSampler")
@@ -821,86 +1766,73 @@ def main(*func_args, **func_kwargs):
         savevideo = instantiate_node("SaveVideo")
         maskpreview = instantiate_node("MaskPreview")
         generated_videos = []
-        for q in range(args.queue_size):
-            sam3segmentation_28 = sam3segmentation.segment(
-                prompt=parse_arg(args.prompt18),
-                threshold=parse_arg(args.threshold19),
-                min_width_pixels=parse_arg(args.min_width_pixels20),
-                min_height_pixels=parse_arg(args.min_height_pixels21),
-                use_video_model=parse_arg(args.use_video_model22),
-                unload_after_run=parse_arg(args.unload_after_run23),
-                object_ids="",
-                image=get_value_at_index(vhs_loadvideo_26, 0),
-            )
-
-            masktoimage_18 = masktoimage.EXECUTE_NORMALIZED(
-                mask=get_value_at_index(sam3segmentation_28, 2)
-            )
-
-            invertmask_21 = invertmask.EXECUTE_NORMALIZED(
-                mask=get_value_at_index(sam3segmentation_28, 2)
-            )
-
-            imagecompositefrommaskbatch_31 = imagecompositefrommaskbatch.execute(
-                image_from=get_value_at_index(masktoimage_18, 0),
-                image_to=get_value_at_index(vhs_loadvideo_26, 0),
-                mask=get_value_at_index(invertmask_21, 0),
-            )
 
-            wanvacetovideo_25 = wanvacetovideo.EXECUTE_NORMALIZED(
-                width=parse_arg(args.width24),
-                height=parse_arg(args.height25),
-                length=parse_arg(args.length26),
-                batch_size=parse_arg(args.batch_size27),
-                strength=parse_arg(args.strength28),
-                positive=get_value_at_index(cliptextencode_24, 0),
-                negative=get_value_at_index(cliptextencode_30, 0),
-                vae=get_value_at_index(vaeloader_13, 0),
-                control_video=get_value_at_index(imagecompositefrommaskbatch_31, 0),
-                reference_image=get_value_at_index(loadimage_32, 0),
-            )
-
-            modelsamplingsd3_2 = modelsamplingsd3.patch(
-                shift=parse_arg(args.shift29),
-                model=get_value_at_index(loraloadermodelonly_11, 0),
-            )
-
-            ksampler_29 = ksampler.sample(
-                seed=parse_arg(args.seed30),
-                steps=parse_arg(args.steps31),
-                cfg=parse_arg(args.cfg32),
-                sampler_name=parse_arg(args.sampler_name33),
-                scheduler=parse_arg(args.scheduler34),
-                denoise=parse_arg(args.denoise35),
-                model=get_value_at_index(modelsamplingsd3_2, 0),
-                positive=get_value_at_index(wanvacetovideo_25, 0),
-                negative=get_value_at_index(wanvacetovideo_25, 1),
-                latent_image=get_value_at_index(wanvacetovideo_25, 2),
-            )
+        workflow = SimpleNamespace(
+            vhs_loadvideo=vhs_loadvideo,
+            vhs_videoinfo=vhs_videoinfo,
+            sam3segmentation=sam3segmentation,
+            wanvacetovideo=wanvacetovideo,
+            ksampler=ksampler,
+            trimvideolatent=trimvideolatent,
+            vaedecode=vaedecode,
+            positive=get_value_at_index(cliptextencode_24, 0),
+            negative=get_value_at_index(cliptextencode_30, 0),
+            vae=get_value_at_index(vaeloader_13, 0),
+            reference_image=get_value_at_index(loadimage_32, 0),
+            model=get_value_at_index(
+                modelsamplingsd3.patch(
+                    shift=parse_arg(args.shift29),
+                    model=get_value_at_index(loraloadermodelonly_11, 0),
+                ),
+                0,
+            ),
+        )
 
-            trimvideolatent_1 = trimvideolatent.EXECUTE_NORMALIZED(
-                trim_amount=get_value_at_index(wanvacetovideo_25, 3),
-                samples=get_value_at_index(ksampler_29, 0),
+        if args.window_size or args.intervals:
+            generated_videos.extend(
+                _run_windowed(workflow, _variant_seeds(parse_arg(args.seed30), args.queue_size))
             )
+            return generated_videos
+
+        # Everything up to the sampler is the same for every variant, so it
+        # runs once; only KSampler onwards is repeated, with a distinct seed
+        # per variant.
+        frames = get_value_at_index(vhs_loadvideo_26, 0)
+        mask = _segment_frames(
+            workflow,
+            frames,
+            unload_after_run=parse_arg(args.unload_after_run23),
+            skip_first_frames=parse_arg(args.skip_first_frames14),
+            frame_load_cap=parse_arg(args.frame_load_cap13),
+        )
 
-            vhs_videoinfo_22 = vhs_videoinfo.get_video_info(
-                video_info=get_value_at_index(vhs_loadvideo_26, 3)
-            )
+        vhs_videoinfo_22 = vhs_videoinfo.get_video_info(
+            video_info=get_value_at_index(vhs_loadvideo_26, 3)
+        )
 
-            vaedecode_20 = vaedecode.decode(
-                samples=get_value_at_index(trimvideolatent_1, 0),
-                vae=get_value_at_index(vaeloader_13, 0),
-            )
+        # Diffusion only runs on frame ranges where SAM3 found the object;
+        # with no mask at all the input frames are saved unchanged (resized
+        # to the output size).
+        plan = _plan_masked(workflow, frames, mask, max_length=parse_arg(args.length26))
+
+        for seed in _variant_seeds(parse_arg(args.seed30), args.queue_size):
+            if args.decode_budget_mb:
+                # Decoded chunks go straight to the encoder; no clip-sized
+                # output tensor is built.
+                writer = _VideoStreamWriter(
+                    parse_arg(args.filename_prefix36), get_value_at_index(vhs_videoinfo_22, 5)
+                )
+                try:
+                    _render_stream(workflow, frames, plan, seed, writer.write)
+                finally:
+                    generated_videos.append(writer.close())
+                continue
 
-            imagecompositefrommaskbatch_33 = imagecompositefrommaskbatch.execute(
-                image_from=get_value_at_index(vaedecode_20, 0),
-                image_to=get_value_at_index(vhs_loadvideo_26, 0),
-                mask=get_value_at_index(invertmask_21, 0),
-            )
+            images = _render_masked(workflow, frames, plan, seed)
 
             createvideo_4 = createvideo.EXECUTE_NORMALIZED(
                 fps=get_value_at_index(vhs_videoinfo_22, 5),
-                images=get_value_at_index(imagecompositefrommaskbatch_33, 0),
+                images=images,
             )
 
             savevideo_3 = savevideo.EXECUTE_NORMALIZED(
@@ -911,9 +1843,7 @@ def main(*func_args, **func_kwargs):
             )
             generated_videos.extend(_extract_video_results(savevideo_3))
 
-            maskpreview_27 = maskpreview.EXECUTE_NORMALIZED(
-                mask=get_value_at_index(sam3segmentation_28, 2)
-            )
+        maskpreview_27 = maskpreview.EXECUTE_NORMALIZED(mask=mask)
 
         return generated_videos
 
@@ -926,27 +1856,269 @@ def run_video_workflow(
     negative_prompt: Optional[str] = None,
     segmentation_prompt: Optional[str] = None,
     filename_prefix: Optional[str] = None,
+    window_size: Optional[int] = None,
+    window_overlap: Optional[int] = None,
+    intervals: Optional[List[tuple]] = None,
+    roi: bool = False,
+    profile: Optional[str] = None,
     additional_overrides: Optional[Dict[str, Any]] = None,
 ) -> List[str]:
-    """Programmatic helper to invoke the workflow from other modules."""
+    """Programmatic helper to invoke the workflow from other modules.
+
+    With ``window_size`` the whole clip is rendered in overlapping windows
+    (``frame_load_cap13`` then caps the total frame count, 0 = to the end).
+    With ``intervals`` (``(start, end)`` seconds) only those ranges are
+    generated and spliced back into the otherwise unchanged clip. ``roi``
+    generates only a crop around the masked object. ``profile`` selects an
+    entry of ``PROFILES`` (default: ``$VIDEO_PROFILE``).
+    """
     overrides: Dict[str, Any] = {
         "video9": os.path.abspath(video_path),
         "text8": positive_prompt,
     }
 
+    if window_size or intervals:
+        overrides["frame_load_cap13"] = 0
+    if window_size:
+        overrides["window_size"] = window_size
+    if window_overlap is not None:
+        overrides["window_overlap"] = window_overlap
+    if intervals:
+        overrides["intervals"] = [(float(start), float(end)) for start, end in intervals]
+    if roi:
+        overrides["roi"] = True
+    if profile:
+        overrides["profile"] = profile
+
+    overrides.update(
+        _input_overrides(reference_image, negative_prompt, segmentation_prompt, filename_prefix)
+    )
+    if additional_overrides:
+        overrides.update(additional_overrides)
+
+    # main() works on the module-level ``args`` namespace, so concurrent callers
+    # (request threads, job workers) have to take turns.
+    with _workflow_lock:
+        return main(**overrides)
+
+
+def _input_overrides(
+    reference_image: Optional[str],
+    negative_prompt: Optional[str],
+    segmentation_prompt: Optional[str],
+    filename_prefix: Optional[str],
+) -> Dict[str, Any]:
+    overrides: Dict[str, Any] = {}
     if reference_image:
         overrides["image17"] = os.path.abspath(reference_image)
-
     if negative_prompt:
         overrides["text16"] = negative_prompt
     if segmentation_prompt:
         overrides["prompt18"] = segmentation_prompt
     if filename_prefix:
         overrides["filename_prefix36"] = filename_prefix
+    return overrides
+
+
+def _graph_arg_inputs() -> Dict[str, tuple]:
+    """Map each autogenerated ``--<input><n>`` argument to its (node id, input name) in PROMPT_DATA."""
+    mapping = {}
+    for action in parser._actions:
+        match = re.search(r"input `(\w+)` for node .* id (\d+) \(autogenerated\)", action.help or "")
+        if match:
+            mapping[action.dest] = (match.group(2), match.group(1))
+    return mapping
+
+
+_graph_executor: Optional[GraphExecutor] = None
+
+
+def _graph_resolvers(prompt: Mapping[str, Mapping[str, Any]]) -> Dict[str, Callable]:
+    """GraphExecutor resolvers that serve ``prompt``'s loaders, text encodes and
+    SAM3 masks from MODELS, CONDITIONING and MASKS.
+
+    The keys are the ones ``run_video_workflow`` uses, so both paths share one
+    resident copy of every model and one cache entry per encode and mask.
+    """
+
+    def inputs(node_id: str) -> Mapping[str, Any]:
+        return prompt[node_id]["inputs"]
+
+    def source(node_id: str, name: str) -> Optional[str]:
+        value = inputs(node_id).get(name)
+        return value[0] if isinstance(value, list) else None
+
+    # The graph path has no per-call profile; it runs on the process's device.
+    device = _model_device(parser.get_default("profile"))
+
+    def model_key(node_id: Optional[str]) -> Optional[tuple]:
+        if node_id is None:
+            return None
+        node = prompt[node_id]
+        values = node["inputs"]
+        if node["class_type"] == "UNETLoader":
+            return ("unet", values["unet_name"], values["weight_dtype"], device)
+        if node["class_type"] == "LoraLoaderModelOnly":
+            parent = model_key(source(node_id, "model"))
+            if parent is None:
+                return None
+            return parent + ("lora", values["lora_name"], float(values["strength_model"]))
+        if node["class_type"] == "CLIPLoader":
+            return ("clip", values["clip_name"], values["type"], values.get("device", "default"), device)
+        if node["class_type"] == "VAELoader":
+            return ("vae", values["vae_name"], device)
+        return None
+
+    request_keys = tuple(
+        key for key in (model_key(node_id) for node_id in prompt) if key is not None
+    )
+
+    def load_model(node_id: str, kwargs: Dict[str, Any], execute: Callable[[], Any]) -> Any:
+        key = model_key(node_id)
+        if key is None:
+            return execute()
+        if prompt[node_id]["class_type"] == "LoraLoaderModelOnly":
+            # A clone sharing the UNet weights; see run_video_workflow.
+            parent = model_key(source(node_id, "model"))
+            return MODELS.get_or_load(key, execute, size_fn=None, parents=(parent,), pinned=request_keys)
+        return MODELS.get_or_load(key, execute, pinned=request_keys)
+
+    def encode(node_id: str, kwargs: Dict[str, Any], execute: Callable[[], Any]) -> Any:
+        clip_key = model_key(source(node_id, "clip"))
+        if clip_key is None:
+            return execute()
+        return CONDITIONING.get_or_encode(clip_key, kwargs["text"], execute)
+
+    def segment(node_id: str, kwargs: Dict[str, Any], execute: Callable[[], Any]) -> Any:
+        video_node = source(node_id, "image")
+        key = None
+        if video_node is not None and prompt[video_node]["class_type"] == "VHS_LoadVideo":
+            key = _sam3_cache_key(kwargs["image"], inputs(video_node), kwargs)
+        if key is None:
+            return execute()
+        executed = []
+
+        def run() -> torch.Tensor:
+            executed.append(execute())
+            return get_value_at_index(executed[0], 2)
+
+        mask = MASKS.get_or_segment(key, run)
+        # Only the mask output is cached; PROMPT_DATA uses nothing else.
+        return executed[0] if executed else (kwargs["image"], None, mask)
+
+    return {
+        "UNETLoader": load_model,
+        "LoraLoaderModelOnly": load_model,
+        "CLIPLoader": load_model,
+        "VAELoader": load_model,
+        "CLIPTextEncode": encode,
+        "SAM3Segmentation": segment,
+    }
+
+
+def run_graph_workflow(
+    video_path: str,
+    positive_prompt: str,
+    reference_image: Optional[str] = None,
+    *,
+    negative_prompt: Optional[str] = None,
+    segmentation_prompt: Optional[str] = None,
+    filename_prefix: Optional[str] = None,
+    outputs: Optional[List[str]] = None,
+    additional_overrides: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Run PROMPT_DATA itself through a memoizing GraphExecutor.
+
+    Node outputs are kept between calls and reused while their inputs are
+    unchanged, so e.g. a new positive prompt only re-runs the text encode and
+    the sampler/decode/composite/save chain. Models, text encodes and SAM3
+    masks go through MODELS, CONDITIONING and MASKS like in
+    ``run_video_workflow``; the video load comes from the previous call. ``outputs`` picks the node ids to
+    compute (default: every non-preview sink). ``additional_overrides`` uses
+    the same argument names as ``run_video_workflow``.
+    """
+    global _graph_executor
+    values: Dict[str, Any] = {
+        "video9": os.path.abspath(video_path),
+        "text8": positive_prompt,
+    }
+    values.update(_input_overrides(reference_image, negative_prompt, segmentation_prompt, filename_prefix))
     if additional_overrides:
-        overrides.update(additional_overrides)
+        values.update(additional_overrides)
+
+    prompt_overrides = {}
+    for arg_name, target in _graph_arg_inputs().items():
+        value = values[arg_name] if arg_name in values else parser.get_default(arg_name)
+        prompt_overrides[target] = parse_arg(value)
+    prompt = apply_overrides(PROMPT_DATA, prompt_overrides)
+
+    with _workflow_lock:
+        node_class_mappings = _load_node_class_mappings()
+        if _graph_executor is None or _graph_executor.node_class_mappings is not node_class_mappings:
+            _graph_executor = GraphExecutor(node_class_mappings)
+        with torch.inference_mode(), ctx:
+            results = _graph_executor.run(prompt, outputs=outputs, resolvers=_graph_resolvers(prompt))
+
+    generated_videos = []
+    for node_id, result in results.items():
+        if prompt[node_id]["class_type"] == "SaveVideo":
+            generated_videos.extend(_extract_video_results(result))
+    return generated_videos
 
-    return main(**overrides)
+
+def intervals_from_detection(detection: Mapping, item: Union[int, str] = 0) -> tuple:
+    """Pick one item of an ``analyze_video`` result by index or label.
+
+    Returns ``(label, [(start_time, end_time), ...])``.
+    """
+    items = detection.get("items") or []
+    if isinstance(item, str):
+        matches = [it for it in items if str(it.get("label", "")).strip().lower() == item.strip().lower()]
+        if not matches:
+            raise ValueError(f"No detected item labelled {item!r}")
+        chosen = matches[0]
+    else:
+        if not 0 <= item < len(items):
+            raise ValueError(f"Detection has no item {item} ({len(items)} items)")
+        chosen = items[item]
+
+    intervals = [
+        (float(ts["start_time"]), float(ts["end_time"]))
+        for ts in chosen.get("timestamps") or []
+        if isinstance(ts, Mapping)
+    ]
+    return str(chosen.get("label", "")).strip(), intervals
+
+
+def run_detected_intervals(
+    video_path: str,
+    positive_prompt: str,
+    detection: Mapping,
+    item: Union[int, str] = 0,
+    reference_image: Optional[str] = None,
+    *,
+    padding_seconds: float = 0.25,
+    segmentation_prompt: Optional[str] = None,
+    **kwargs: Any,
+) -> List[str]:
+    """Render only the intervals where the detection service saw ``item``.
+
+    The intervals are widened by ``padding_seconds`` on both sides, and the
+    item's label is used as the SAM3 prompt unless ``segmentation_prompt`` is
+    given. Everything outside the intervals is copied from the input.
+    """
+    label, intervals = intervals_from_detection(detection, item)
+    if not intervals:
+        raise ValueError(f"Detected item {label or item!r} has no timestamps")
+    padded = [(max(0.0, start - padding_seconds), end + padding_seconds) for start, end in intervals]
+    return run_video_workflow(
+        video_path,
+        positive_prompt,
+        reference_image,
+        segmentation_prompt=segmentation_prompt or label or None,
+        intervals=padded,
+        **kwargs,
+    )
 
 
 if __name__ == "__main__":